@@ -0,0 +1,347 @@
+"""
+Microbenchmarks for the hot paths of the pipeline, on synthetic data sized like the real splits.
+
+Usage:
+    python benchmark_hot_paths.py run --output before.json
+    python benchmark_hot_paths.py run --output after.json
+    python benchmark_hot_paths.py compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# the LLM helpers ask for an API key when they are created, but nothing is sent to the APIs
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+import numpy as np
+import pandas as pd
+
+from benchmark import Engine
+from data import Benchmark
+from evaluation import calculate_significant_improvements
+from llms import AnthropicHelper, OpenAIHelper
+
+# average number of words per document in each split
+SPLIT_PROFILES = {
+    "retail": 150,
+    "videogames": 200,
+    "books": 150,
+    "news": 600,
+    "web": 60,
+    "debate": 60,
+}
+
+VOCABULARY = [
+    "the",
+    "best",
+    "product",
+    "quality",
+    "price",
+    "game",
+    "story",
+    "review",
+    "players",
+    "design",
+    "battery",
+    "author",
+    "report",
+    "according",
+    "experts",
+    "market",
+    "performance",
+    "value",
+    "new",
+    "classic",
+]
+
+# packages whose import time is measured in a fresh interpreter
+IMPORT_MODULES = ["llms", "data", "benchmark", "methods", "evaluation"]
+
+BENCHMARK_METHODS = [
+    "baseline",
+    "Fluency",
+    "seo_baseline-1",
+    "seo_baseline_game_theory",
+]
+
+
+def create_synthetic_split(num_queries, num_docs, doc_words, seed):
+    """
+    Creates a synthetic split with the same columns as the C-SEO Bench dataset and a selected document per query.
+
+    Returns:
+        tuple: The split as a DataFrame and the selected documents (as in `selected_docs.json`).
+    """
+    rng = random.Random(seed)
+    list_rows = []
+    selected_docs = {}
+    for query_idx in range(num_queries):
+        query = " ".join(rng.choices(VOCABULARY, k=8)) + "?"
+        for doc_idx in range(num_docs):
+            length = max(1, int(rng.gauss(doc_words, doc_words / 4)))
+            document = " ".join(rng.choices(VOCABULARY, k=length))
+            list_rows.append(
+                {"query_id": f"q{query_idx}", "query": query, "document": document}
+            )
+        doc_idx = rng.randrange(num_docs)
+        doc = list_rows[-num_docs + doc_idx]["document"]
+        selected_docs[str(query_idx)] = {
+            str(doc_idx): {"doc": doc, "Fluency(doc)": doc + " " + doc[:200]}
+        }
+    return pd.DataFrame(list_rows), selected_docs
+
+
+def create_synthetic_responses(dataset, seed):
+    """
+    Creates synthetic responses with in-line citations for each data point.
+    """
+    rng = random.Random(seed)
+    list_responses = []
+    for x in dataset:
+        num_docs = len(x["list_docs"])
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            cited = rng.sample(range(1, num_docs + 1), k=rng.randint(1, 3))
+            sentences.append(
+                " ".join(rng.choices(VOCABULARY, k=15))
+                + "".join(f"[{i}]" for i in cited)
+                + "."
+            )
+        list_responses.append(" ".join(sentences))
+    return list_responses
+
+
+def measure(func, repeat):
+    """
+    Runs a function `repeat` times and returns the timings in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def measure_import(module, repeat):
+    """
+    Imports a module `repeat` times, each time in a fresh interpreter, and returns the import times in seconds.
+    """
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - start)"
+    )
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return {
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def run(args):
+    doc_words = SPLIT_PROFILES[args.split]
+    df, selected_docs = create_synthetic_split(
+        args.num_queries, args.num_docs, doc_words, args.seed
+    )
+    folder = tempfile.mkdtemp()
+    selected_docs_path = os.path.join(folder, "selected_docs.json")
+    with open(selected_docs_path, "w") as f:
+        json.dump(selected_docs, f)
+
+    def create_benchmark(method):
+        return Benchmark(
+            num_docs_in_context=args.num_docs,
+            method=method,
+            split=args.split,
+            selected_documents_path=(
+                None if method == "baseline" else selected_docs_path
+            ),
+            df=df,
+        )
+
+    cases = {}
+    for method in BENCHMARK_METHODS:
+        cases[f"benchmark_init[{method}]"] = lambda method=method: create_benchmark(
+            method
+        )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        dataset = create_benchmark("Fluency")
+        baseline = create_benchmark("baseline")
+    engine = Engine()
+    developer_prompt = (
+        "Write an accurate and concise answer citing the search results using [index]."
+    )
+    for llm in [
+        OpenAIHelper("gpt-4o-mini"),
+        AnthropicHelper("claude-3-5-haiku-20241022"),
+    ]:
+        provider = type(llm).__name__
+        cases[f"create_requests[{provider}]"] = lambda llm=llm: engine.create_requests(
+            dataset, developer_prompt, llm
+        )
+
+    responses = create_synthetic_responses(dataset, args.seed)
+    cases["get_citation_order"] = lambda: [
+        engine.get_citation_order(response) for response in responses
+    ]
+
+    running_folder = os.path.join(folder, "running", args.split, "Fluency")
+    _, df_requests = engine.create_requests(
+        dataset, developer_prompt, OpenAIHelper("gpt-4o-mini")
+    )
+    os.makedirs(running_folder, exist_ok=True)
+    df_requests.to_parquet(os.path.join(running_folder, "requests.parquet"))
+    results_folder = running_folder.replace("running", "results")
+    cases["process_benchmark_responses"] = lambda: engine.process_benchmark_responses(
+        responses, results_folder
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_method = engine.process_benchmark_responses(responses, results_folder)
+        df_baseline = engine.process_benchmark_responses(
+            create_synthetic_responses(baseline, args.seed + 1), results_folder
+        )
+    cases["calculate_significant_improvements"] = (
+        lambda: calculate_significant_improvements(df_baseline, df_method)
+    )
+
+    results = {}
+    for module in IMPORT_MODULES:
+        name = f"import_time[{module}]"
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure_import(module, args.repeat)
+        print(f"{name:<45} median {results[name]['median'] * 1000:10.2f} ms")
+
+    for name, func in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        print(f"{name:<45} median {results[name]['median'] * 1000:10.2f} ms")
+
+    report = {
+        "metadata": {
+            "split": args.split,
+            "num_queries": args.num_queries,
+            "num_docs": args.num_docs,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results saved in {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'case':<45} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name in sorted(set(baseline) & set(current)):
+        before = baseline[name]["median"]
+        after = current[name]["median"]
+        ratio = after / before if before > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<45} {before * 1000:10.2f}ms {after * 1000:10.2f}ms {ratio:8.2f}{flag}"
+        )
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks for the hot paths of the pipeline."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument(
+        "--output",
+        type=str,
+        default="benchmark_results.json",
+        help="JSON file where the results are saved.",
+    )
+    run_parser.add_argument(
+        "--split",
+        type=str,
+        default="retail",
+        choices=sorted(SPLIT_PROFILES),
+        help="Split whose document length is simulated.",
+    )
+    run_parser.add_argument(
+        "--num_queries", type=int, default=1000, help="Number of queries."
+    )
+    run_parser.add_argument(
+        "--num_docs", type=int, default=10, help="Number of documents per query."
+    )
+    run_parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of runs of each benchmark."
+    )
+    run_parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    run_parser.add_argument(
+        "--filter",
+        type=str,
+        default=None,
+        help="Only run the benchmarks whose name contains this string.",
+    )
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two benchmark results."
+    )
+    compare_parser.add_argument("baseline", type=str, help="Baseline results (JSON).")
+    compare_parser.add_argument("current", type=str, help="Current results (JSON).")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown of the median reported as a regression.",
+    )
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
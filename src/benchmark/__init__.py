@@ -1,5 +1,39 @@
+from .context_sweep import ContextSweep
 from .engine import Engine
+from .fan_out import FanOutRunner
+from .game import BestResponseGame
+from .grid import GridRunner
+
+# Imported on first access (see `llms/__init__.py`): they import pandas, numpy or scipy
+_LAZY_IMPORTS = {
+    "CostEstimator": ".cost_estimator",
+    "ExecutionRouter": ".router",
+    "AdoptionSweep": ".adoption",
+    "SequentialRunner": ".sequential",
+    "SurrogateEngine": ".surrogate",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "Engine",
+    "CostEstimator",
+    "GridRunner",
+    "FanOutRunner",
+    "ExecutionRouter",
+    "AdoptionSweep",
+    "BestResponseGame",
+    "ContextSweep",
+    "SequentialRunner",
+    "SurrogateEngine",
 ]
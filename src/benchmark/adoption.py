@@ -0,0 +1,351 @@
+import json
+import os
+from typing import List, Union
+
+import numpy as np
+
+from config.adoption_mode import AdoptionMode
+from data import Benchmark, SelectedDocsStore, load_split
+from data.selected_docs_store import ORIGINAL
+from llms import LLMInterface
+from methods.multi_method import MultiMethodRewriter
+
+from .grid import GridRunner
+
+MANIFEST_FILENAME = "adoption.json"
+
+
+def adoption_tag(level: int, num_docs: int) -> str:
+    """
+    Returns the tag of an adoption level, used as the name of its run folder.
+
+    Args:
+        level (int): Number of documents per query that adopt the C-SEO method.
+        num_docs (int): Number of documents in the context.
+
+    Returns:
+        str: "none" (no adopters), "unilateral" (one adopter), "full" (all the documents adopt) or "adoption-{level}".
+    """
+    if level == 0:
+        return AdoptionMode.NONE.value
+    if level == 1:
+        return AdoptionMode.UNILATERAL.value
+    if level >= num_docs:
+        return AdoptionMode.FULL.value
+    return f"adoption-{level}"
+
+
+class AdoptionSweep:
+    """
+    The AdoptionSweep class runs a C-SEO method with an increasing number of adopters per query
+    (from one document, `AdoptionMode.UNILATERAL`, to all the documents, `AdoptionMode.FULL`) to measure
+    how the benefit of the method changes when competitors adopt it too.
+
+    The adopters of each query are nested: the documents are shuffled once per query (one pass of a
+    seeded RNG), and the adopters of level k are the first k documents. Each level therefore only adds
+    one rewrite per query to the previous one, and rewrites already in the `SelectedDocsStore` are
+    reused. The `Benchmark` of each level is built on demand from the same dataset and the same document
+    strings, and all the levels are submitted together with a `GridRunner`, one tagged run per level.
+
+    Usage:
+        sweep = AdoptionSweep(store, split="retail", df=df)
+        sweep.submit_rewrites([Fluency(llm)], rewrites_folder)
+        ...
+        sweep.retrieve_rewrites()
+        grid = sweep.run("Fluency", llm, developer_prompt, "experiments")
+        ...
+        grid.retrieve_results()
+    """
+
+    def __init__(
+        self,
+        store: SelectedDocsStore,
+        levels: List[Union[int, float]] = None,
+        seed: int = 42,
+        num_docs_in_context: int = 10,
+        sample_size: int = None,
+        data_path: str = "cseo/cseo-bench",
+        split: str = "retail",
+        doc_type: str = "document",
+        df=None,
+    ):
+        """
+        Initializes the AdoptionSweep and draws the adopters of each query.
+
+        Args:
+            store (SelectedDocsStore): Store with the rewrites of the methods. Only new rewrites are written to it (the
+                adopters are not, so other users of the store do not see them as boosted).
+            levels (List[int or float], optional): Adoption levels, as numbers of adopters per query (1..N) or as
+                fractions of the documents in the context (0 < f <= 1). Defaults to 1..`num_docs_in_context`.
+            seed (int): Seed of the RNG that draws the adopters. Defaults to 42.
+            num_docs_in_context (int): Number of documents in the context. Defaults to 10.
+            sample_size (int, optional): Number of queries. If None, all queries are used.
+            data_path (str): Path or identifier for the dataset. Defaults to "cseo/cseo-bench".
+            split (str): Dataset split to use. Defaults to "retail".
+            doc_type (str): Type of document, used in the user prompts.
+            df (pd.DataFrame, optional): The split already loaded as a DataFrame. If None, it is loaded once here.
+        """
+        if df is None:
+            df = load_split(data_path, split)
+        self.df = df
+        self.store = store
+        self.seed = seed
+        self.num_docs_in_context = num_docs_in_context
+        self.sample_size = sample_size
+        self.data_path = data_path
+        self.split = split
+        self.doc_type = doc_type
+        self.levels = (
+            levels
+            if levels is not None
+            else list(range(1, self.num_docs_in_context + 1))
+        )
+
+        # documents in the context of each query, in the same order as in Benchmark
+        query_ids = self.df["query_id"].unique()
+        if sample_size:
+            query_ids = query_ids[:sample_size]
+        hits = self.df[self.df["query_id"].isin(query_ids)]
+        documents = hits.groupby("query_id", sort=False)["document"].apply(list)
+        self.documents = [
+            documents[query_id][: self.num_docs_in_context] for query_id in query_ids
+        ]
+
+        # one seeded pass: the adopters of level k are the first k documents of each permutation
+        rng = np.random.default_rng(seed)
+        self.permutations = [
+            rng.permutation(len(docs)).tolist() for docs in self.documents
+        ]
+        self.rewrites = {}
+        self.rewriter = None
+
+    def num_adopters(self, level: Union[int, float], query_idx: int) -> int:
+        """
+        Returns the number of adopters of a query at an adoption level.
+
+        Args:
+            level (int or float): Number of adopters or fraction of the documents in the context.
+            query_idx (int): Index of the query.
+
+        Returns:
+            int: Number of adopters.
+        """
+        num_docs = len(self.permutations[query_idx])
+        if isinstance(level, float) and level <= 1:
+            return min(num_docs, int(round(level * num_docs)))
+        return min(num_docs, int(level))
+
+    def adopters(self, level: Union[int, float]) -> dict:
+        """
+        Returns the adopters of every query at an adoption level.
+
+        Args:
+            level (int or float): Number of adopters or fraction of the documents in the context.
+
+        Returns:
+            dict: {query_idx: [doc_idx, ...]}
+        """
+        return {
+            query_idx: sorted(permutation[: self.num_adopters(level, query_idx)])
+            for query_idx, permutation in enumerate(self.permutations)
+        }
+
+    def tag(self, level: Union[int, float]) -> str:
+        """
+        Returns the tag of an adoption level (see `adoption_tag`).
+
+        Args:
+            level (int or float): Number of adopters or fraction of the documents in the context.
+
+        Returns:
+            str: The tag.
+        """
+        if isinstance(level, float) and level <= 1:
+            if level >= 1:
+                return AdoptionMode.FULL.value
+            return f"adoption-{int(round(level * 100))}pct"
+        return adoption_tag(int(level), self.num_docs_in_context)
+
+    def submit_rewrites(self, methods, output_folder: str):
+        """
+        Submits the rewrites of the adopters of all the levels that are not in the store yet. Each method
+        only rewrites the adopters it does not have a rewrite for. The store is not modified until
+        `retrieve_rewrites`, which only writes the rewrites of the methods.
+
+        Args:
+            methods (List[CitationBoosting]): The C-SEO methods to run.
+            output_folder (str): Folder where the batches are saved.
+
+        Returns:
+            MultiMethodRewriter: The rewriter, or None if all the rewrites are already in the store.
+        """
+        adopters = {}
+        for level in self.levels:
+            for query_idx, doc_indices in self.adopters(level).items():
+                adopters.setdefault(query_idx, set()).update(doc_indices)
+
+        # each method only rewrites its own missing documents, so the rewrites already in the store are kept
+        missing = {}
+        for method in methods:
+            method_name = type(method).__name__
+            rewritten = self.store.read(method_name)
+            for query_idx, doc_indices in adopters.items():
+                for doc_idx in doc_indices:
+                    if doc_idx not in rewritten.get(query_idx, {}):
+                        missing.setdefault(method_name, {}).setdefault(
+                            str(query_idx), {}
+                        )[str(doc_idx)] = {ORIGINAL: self.documents[query_idx][doc_idx]}
+        num_missing = sum(
+            len(docs)
+            for method_docs in missing.values()
+            for docs in method_docs.values()
+        )
+        print(f"{num_missing} adopter rewrites missing")
+        if num_missing == 0:
+            return None
+        self.rewriter = MultiMethodRewriter(
+            [method for method in methods if type(method).__name__ in missing]
+        )
+        self.rewriter.improve_selected_docs(missing, output_folder, per_method=True)
+        return self.rewriter
+
+    def retrieve_rewrites(self):
+        """
+        Retrieves the rewrites submitted with `submit_rewrites` and writes them to the store.
+
+        Returns:
+            float: The cost of the rewrites, or None if a batch is not completed.
+        """
+        _, cost = self.rewriter.retrieve_results(store=self.store)
+        # the cached rewrites are read again from the store
+        self.rewrites = {}
+        return cost
+
+    def selected_docs(self, method: str, level: Union[int, float]) -> dict:
+        """
+        Returns the selected documents of an adoption level in the `selected_docs.json` format. The
+        document strings are shared between levels, not copied.
+
+        Args:
+            method (str): Name of the C-SEO method.
+            level (int or float): Number of adopters or fraction of the documents in the context.
+
+        Returns:
+            dict: {str(query_idx): {str(doc_idx): {'doc': ..., f"{method}(doc)": ...}}}
+        """
+        if method not in self.rewrites:
+            self.rewrites[method] = self.store.read(method)
+        rewrites = self.rewrites[method]
+        selected_docs = {}
+        for query_idx, doc_indices in self.adopters(level).items():
+            missing = [d for d in doc_indices if d not in rewrites.get(query_idx, {})]
+            if missing:
+                raise ValueError(
+                    f"Query {query_idx} has adopters without {method} rewrites: {missing}. "
+                    "Run `submit_rewrites` and `retrieve_rewrites` first."
+                )
+            selected_docs[str(query_idx)] = {
+                str(doc_idx): {
+                    ORIGINAL: self.documents[query_idx][doc_idx],
+                    f"{method}({ORIGINAL})": rewrites[query_idx][doc_idx],
+                }
+                for doc_idx in doc_indices
+            }
+        return selected_docs
+
+    def benchmark(self, method: str, level: Union[int, float]) -> Benchmark:
+        """
+        Builds the Benchmark of an adoption level from the shared dataset and documents.
+
+        Args:
+            method (str): Name of the C-SEO method.
+            level (int or float): Number of adopters or fraction of the documents in the context.
+
+        Returns:
+            Benchmark: The benchmark where the adopters of each query use the rewrites of the method.
+        """
+        return Benchmark(
+            num_docs_in_context=self.num_docs_in_context,
+            method=method,
+            sample_size=self.sample_size,
+            data_path=self.data_path,
+            split=self.split,
+            doc_type=self.doc_type,
+            df=self.df,
+            selected_docs=self.selected_docs(method, level),
+        )
+
+    def benchmarks(self, method: str):
+        """
+        Yields the Benchmark of each adoption level, building them one at a time.
+
+        Args:
+            method (str): Name of the C-SEO method.
+
+        Yields:
+            tuple: The tag and the Benchmark of each level.
+        """
+        for level in self.levels:
+            yield self.tag(level), self.benchmark(method, level)
+
+    def save(self, folder: str):
+        """
+        Saves the levels, seed and adopters of the sweep as `adoption.json`.
+
+        Args:
+            folder (str): Folder where the manifest is saved.
+        """
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "seed": self.seed,
+                    "levels": {
+                        self.tag(level): self.adopters(level) for level in self.levels
+                    },
+                },
+                f,
+            )
+
+    def run(
+        self,
+        method: str,
+        llm: LLMInterface,
+        developer_prompt: str,
+        experiments_folder: str,
+        include_baseline: bool = True,
+    ) -> GridRunner:
+        """
+        Submits one run per adoption level in shared batches. The run of each level is saved in
+        `{experiments_folder}/running/{split}/{method}/{tag}` and its results in the same path under "results".
+
+        Args:
+            method (str): Name of the C-SEO method. Its rewrites must be in the store (see `submit_rewrites`).
+            llm (LLMInterface): The LLM interface used to run the benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            experiments_folder (str): Root of the running and results folders.
+            include_baseline (bool): Whether to add a run without adopters ("none"). Defaults to True.
+
+        Returns:
+            GridRunner: The grid with the submitted runs. The results are obtained with `grid.retrieve_results()`.
+        """
+        method_folder = os.path.join(experiments_folder, "running", self.split, method)
+        grid = GridRunner(llm, os.path.join(method_folder, "grid"))
+        if include_baseline:
+            grid.add_run(
+                Benchmark(
+                    num_docs_in_context=self.num_docs_in_context,
+                    sample_size=self.sample_size,
+                    data_path=self.data_path,
+                    split=self.split,
+                    doc_type=self.doc_type,
+                    df=self.df,
+                ),
+                developer_prompt,
+                os.path.join(method_folder, AdoptionMode.NONE.value),
+            )
+        for tag, dataset in self.benchmarks(method):
+            grid.add_run(dataset, developer_prompt, os.path.join(method_folder, tag))
+        self.save(method_folder)
+        grid.submit()
+        return grid
@@ -0,0 +1,109 @@
+import os
+from typing import List
+
+from data import Benchmark, load_split
+from llms import LLMInterface
+
+from .grid import GridRunner
+
+
+class ContextSweep:
+    """
+    The ContextSweep class runs a method with several numbers of documents in the context, to study how
+    the size of the context affects the gains of C-SEO methods.
+
+    The split is loaded once and the prompts are rendered once with the largest context. The smaller
+    contexts are derived as prefixes with `Benchmark.with_context_size` (boosted documents outside of the
+    window are dropped from the boosted indices), and all the sizes are submitted in one grid run.
+
+    Usage:
+        sweep = ContextSweep([3, 5, 10, 20], method="Fluency", split="retail", selected_documents_path=path)
+        grid = sweep.run(llm, developer_prompt, "experiments")
+        ...
+        grid.retrieve_results()
+    """
+
+    def __init__(
+        self,
+        sizes: List[int],
+        method: str = "baseline",
+        include_baseline: bool = True,
+        **benchmark_kwargs,
+    ):
+        """
+        Initializes the ContextSweep, loading the split and rendering the largest context.
+
+        Args:
+            sizes (List[int]): Numbers of documents in the context.
+            method (str): The method to evaluate. Defaults to "baseline".
+            include_baseline (bool): Whether to also run the baseline with every size. Defaults to True.
+            **benchmark_kwargs: Other arguments of `Benchmark` (e.g., split, doc_type, selected_documents_path, df).
+        """
+        if "df" not in benchmark_kwargs or benchmark_kwargs["df"] is None:
+            benchmark_kwargs["df"] = load_split(
+                **{
+                    key: benchmark_kwargs[key]
+                    for key in ("data_path", "split")
+                    if key in benchmark_kwargs
+                }
+            )
+        self.sizes = sorted(sizes)
+        self.method = method
+        self.split = benchmark_kwargs.get("split", "retail")
+        self.benchmarks = {
+            method: Benchmark(
+                num_docs_in_context=self.sizes[-1], method=method, **benchmark_kwargs
+            )
+        }
+        if include_baseline and method != "baseline":
+            kwargs = {
+                key: value
+                for key, value in benchmark_kwargs.items()
+                if key not in ("selected_documents_path", "selected_docs")
+            }
+            self.benchmarks["baseline"] = Benchmark(
+                num_docs_in_context=self.sizes[-1], method="baseline", **kwargs
+            )
+
+    def benchmark(self, num_docs_in_context: int, method: str = None) -> Benchmark:
+        """
+        Returns the benchmark of one size, derived from the largest context.
+
+        Args:
+            num_docs_in_context (int): Number of documents in the context.
+            method (str, optional): The method ("baseline" or the method of the sweep). Defaults to the method of the sweep.
+
+        Returns:
+            Benchmark: The benchmark with `num_docs_in_context` documents in the context.
+        """
+        method = method if method is not None else self.method
+        return self.benchmarks[method].with_context_size(num_docs_in_context)
+
+    def run(
+        self, llm: LLMInterface, developer_prompt: str, experiments_folder: str
+    ) -> GridRunner:
+        """
+        Submits one run per method and size in shared batches. Each run is saved in
+        `{experiments_folder}/running/{split}/{method}/docs-{size}` and its results in the same path under "results".
+
+        Args:
+            llm (LLMInterface): The LLM interface used to run the benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            experiments_folder (str): Root of the running and results folders.
+
+        Returns:
+            GridRunner: The grid with the submitted runs. The results are obtained with `grid.retrieve_results()`.
+        """
+        running_folder = os.path.join(experiments_folder, "running", self.split)
+        grid = GridRunner(
+            llm, os.path.join(running_folder, self.method, "context_sweep")
+        )
+        for method in self.benchmarks:
+            for size in self.sizes:
+                grid.add_run(
+                    self.benchmark(size, method),
+                    developer_prompt,
+                    os.path.join(running_folder, method, f"docs-{size}"),
+                )
+        grid.submit()
+        return grid
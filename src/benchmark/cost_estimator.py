@@ -0,0 +1,143 @@
+import math
+from typing import List, Union
+
+import pandas as pd
+
+from data import Benchmark
+from llms import LLMInterface
+from llms.token_counter import (
+    TokenCounter,
+    count_request_tokens,
+    get_request_max_tokens,
+)
+from methods.citation_boosting import deduplicate_texts
+
+from .engine import Engine
+
+
+class CostEstimator:
+    """
+    The CostEstimator class estimates the number of tokens and the cost of a run before submitting it.
+    It tokenizes the requests created by `Engine.create_requests` and `CitationBoosting.create_requests`
+    locally and uses the price tables of the LLM helper (`get_token_prices`).
+    """
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        token_counter: TokenCounter = None,
+        batch: bool = True,
+    ):
+        """
+        Initializes the CostEstimator.
+
+        Args:
+            llm (LLMInterface): The LLM interface used to create the requests and get the prices.
+            token_counter (TokenCounter, optional): Counter used to tokenize the requests. The same counter can be
+                shared across estimators to reuse the cached token counts of each document.
+            batch (bool): Whether to use the Batch API prices. Defaults to True.
+        """
+        self.llm = llm
+        self.token_counter = (
+            token_counter if token_counter is not None else TokenCounter(llm.llm_name)
+        )
+        self.batch = batch
+
+    def estimate_requests(
+        self,
+        list_requests: List,
+        output_tokens: Union[int, List[int]],
+        shard_size: int = None,
+    ) -> pd.DataFrame:
+        """
+        Estimates the tokens and cost of a list of requests.
+
+        Args:
+            list_requests (List): Requests created with `llm.create_request`.
+            output_tokens (int or List[int]): Expected number of output tokens, for all requests or per request.
+                It is capped by the `max_tokens` of each request.
+            shard_size (int, optional): Number of requests per shard. If None, all requests are in one shard.
+
+        Returns:
+            pd.DataFrame: One row per shard with the columns "Shard", "Requests", "Input Tokens",
+                "Output Tokens" and "Cost".
+        """
+        if isinstance(output_tokens, int):
+            output_tokens = [output_tokens] * len(list_requests)
+        prices = self.llm.get_token_prices(batch=self.batch)
+        shard_size = shard_size or max(len(list_requests), 1)
+
+        list_rows = []
+        for shard, start in enumerate(range(0, len(list_requests), shard_size)):
+            shard_requests = list_requests[start : start + shard_size]
+            input_tokens = 0
+            shard_output_tokens = 0
+            for request, expected in zip(
+                shard_requests, output_tokens[start : start + shard_size]
+            ):
+                input_tokens += count_request_tokens(request, self.token_counter)
+                max_tokens = get_request_max_tokens(request)
+                if max_tokens is not None:
+                    expected = min(expected, max_tokens)
+                shard_output_tokens += expected
+            cost = (
+                input_tokens * prices["input"] + shard_output_tokens * prices["output"]
+            ) / 1e6
+            list_rows.append(
+                [shard, len(shard_requests), input_tokens, shard_output_tokens, cost]
+            )
+        return pd.DataFrame(
+            list_rows,
+            columns=["Shard", "Requests", "Input Tokens", "Output Tokens", "Cost"],
+        )
+
+    def estimate_benchmark(
+        self,
+        dataset: Benchmark,
+        developer_prompt: str,
+        output_tokens: int = 400,
+        shard_size: int = None,
+    ) -> pd.DataFrame:
+        """
+        Estimates the tokens and cost of `Engine.run_benchmark` without submitting anything.
+
+        Args:
+            dataset (Benchmark): The dataset to benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            output_tokens (int): Expected length of each response in tokens. Defaults to 400.
+            shard_size (int, optional): Number of requests per shard.
+
+        Returns:
+            pd.DataFrame: The estimate per shard (see `estimate_requests`).
+        """
+        list_requests, _ = Engine().create_requests(dataset, developer_prompt, self.llm)
+        return self.estimate_requests(list_requests, output_tokens, shard_size)
+
+    def estimate_rewrites(
+        self,
+        method,
+        texts: List[str],
+        output_ratio: float = 1.2,
+        shard_size: int = None,
+        deduplicate: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Estimates the tokens and cost of `CitationBoosting.improve_texts` without submitting anything.
+
+        Args:
+            method (CitationBoosting): The C-SEO method used to rewrite the texts.
+            texts (List[str]): List of texts to improve.
+            output_ratio (float): Expected length of each rewrite relative to the original text. Defaults to 1.2.
+            shard_size (int, optional): Number of requests per shard.
+            deduplicate (bool): Whether identical texts are rewritten once (as in `improve_texts`). Defaults to True.
+
+        Returns:
+            pd.DataFrame: The estimate per shard (see `estimate_requests`).
+        """
+        if deduplicate:
+            texts, _ = deduplicate_texts(texts)
+        list_requests = method.create_requests(texts)
+        output_tokens = [
+            math.ceil(self.token_counter.count(text) * output_ratio) for text in texts
+        ]
+        return self.estimate_requests(list_requests, output_tokens, shard_size)
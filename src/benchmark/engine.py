@@ -1,13 +1,13 @@
 import itertools
+import json
 import math
 import os
 import re
 
-import numpy as np
-import pandas as pd
-
 from data import Benchmark
 from llms import LLMInterface
+from llms.batching import encode_custom_id
+from profiling import profiler
 
 
 class Engine:
@@ -35,18 +35,74 @@ class Engine:
         Returns:
             str: The batch ID of the executed requests.
         """
-        list_columns = [
-            "Prompt",
-            "Response",
-            "Search Query",
-            "Boost Product Index",
-            "Citation Order",
-        ]
-        list_rows = []
+        list_requests, df = self.create_requests(dataset, developer_prompt, llm)
+
+        # Save the input data
+        with profiler.timer("engine.write_requests_parquet"):
+            os.makedirs(running_folder, exist_ok=True)
+            df.to_parquet(os.path.join(running_folder, "requests.parquet"))
+
+        # Run the requests
+        batch_id = llm.run_batch(list_requests, running_folder)
+        profiler.write_report(running_folder)
+        return batch_id
+
+    @profiler.timed("engine.create_requests")
+    def create_requests(
+        self,
+        dataset: Benchmark,
+        developer_prompt: str,
+        llm: LLMInterface,
+        custom_id_prefix: str = None,
+    ):
+        """
+        Creates the requests of a benchmark run without submitting them.
+
+        Args:
+            dataset (Benchmark): The dataset to benchmark, containing user prompts and metadata.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            llm (LLMInterface): The LLM interface used to generate messages and requests.
+            custom_id_prefix (str, optional): If given, the custom_id of each request is "{custom_id_prefix}-{i}"
+                instead of "request-{i}", so requests of several runs can share a batch.
+
+        Returns:
+            tuple:
+                - list_requests (list): List of requests, one per data point.
+                - df (pd.DataFrame): The input data to save in `requests.parquet`.
+        """
+        data_points = list(dataset)
+        list_requests, raw_prompts = self.convert_requests(
+            data_points, developer_prompt, llm, custom_id_prefix
+        )
+        return list_requests, self.create_table(
+            data_points, developer_prompt, raw_prompts
+        )
+
+    def convert_requests(
+        self,
+        data_points: list,
+        developer_prompt: str,
+        llm: LLMInterface,
+        custom_id_prefix: str = None,
+    ):
+        """
+        Converts rendered data points into the requests of a provider.
+
+        Args:
+            data_points (list): The data points of a benchmark (e.g., `list(dataset)`).
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            llm (LLMInterface): The LLM interface used to generate messages and requests.
+            custom_id_prefix (str, optional): If given, the custom_id of each request is "{custom_id_prefix}-{i}"
+                instead of "request-{i}".
 
-        # Create the requests
+        Returns:
+            tuple:
+                - list_requests (list): List of requests, one per data point.
+                - raw_prompts (list): The raw prompt of each request, as saved in the "Prompt" column.
+        """
         list_requests = []
-        for i, x in enumerate(dataset):
+        raw_prompts = []
+        for i, x in enumerate(data_points):
             if "search_results" in x:
                 msg, raw_msg = llm.create_message(
                     x["user_prompt"], list_docs=x["search_results"]
@@ -58,19 +114,53 @@ class Engine:
                     msg,
                     developer_prompt,
                     i,
+                    custom_id=(
+                        encode_custom_id(custom_id_prefix, i)
+                        if custom_id_prefix is not None
+                        else None
+                    ),
                 )
             )
-            raw_prompt = f"System: {developer_prompt}\n\n{raw_msg}"
+            raw_prompts.append(f"System: {developer_prompt}\n\n{raw_msg}")
+        return list_requests, raw_prompts
+
+    def create_table(self, data_points: list, developer_prompt: str, raw_prompts: list):
+        """
+        Creates the input data of a benchmark run, saved in `requests.parquet`.
+
+        Args:
+            data_points (list): The data points of a benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            raw_prompts (list): The raw prompt of each data point (see `convert_requests`).
+
+        Returns:
+            pd.DataFrame: One row per data point, without responses.
+        """
+        import pandas as pd
+
+        list_columns = [
+            "Prompt",
+            "Response",
+            "Search Query",
+            "Boost Product Index",
+            "Citation Order",
+        ]
+        list_rows = []
+        list_context_orders = []
+        list_packings = []
+        for x, raw_prompt in zip(data_points, raw_prompts):
             list_rows.append([raw_prompt, "", x["query"], x["boosted_indices"], None])
+            list_context_orders.append(x.get("context_order"))
+            list_packings.append(x.get("packing"))
 
-        # Save the input data
         df = pd.DataFrame(list_rows, columns=list_columns)
-        os.makedirs(running_folder, exist_ok=True)
-        df.to_parquet(os.path.join(running_folder, "requests.parquet"))
-
-        # Run the requests
-        batch_id = llm.run_batch(list_requests, running_folder)
-        return batch_id
+        if any(order is not None for order in list_context_orders):
+            # original index of the document at each position (e.g., PermutedBenchmark)
+            df["Context Order"] = list_context_orders
+        if any(packing is not None for packing in list_packings):
+            # what the token budget cut from each context (see Benchmark.pack), as JSON
+            df["Packing"] = [json.dumps(packing) for packing in list_packings]
+        return df
 
     def get_citation_order(self, text):
         # Regular expression to find numbers inside square brackets
@@ -85,29 +175,81 @@ class Engine:
         citations = list(dict.fromkeys(citations_w_dups))
         return citations, citations_w_dups
 
-    def process_benchmark_responses(self, responses_txt, output_folder):
-        running_folder = output_folder.replace("results", "running")
-        df = pd.read_parquet(os.path.join(running_folder, "requests.parquet"))
+    def map_citations(self, citations, context_order):
+        """
+        Maps cited positions in a permuted context back to the original document indices.
+
+        Args:
+            citations (list): Cited positions (0-based).
+            context_order (list): Original index of the document at each position.
+
+        Returns:
+            list: The original index of each cited document. Positions outside the context are removed.
+        """
+        return [
+            int(context_order[position])
+            for position in citations
+            if 0 <= position < len(context_order)
+        ]
+
+    def process_benchmark_responses(
+        self, responses_txt, output_folder, requests_path: str = None
+    ):
+        """
+        Parses the citations of the responses of a run and adds them to its input data.
+
+        Args:
+            responses_txt (list): The text of each response, in the order of the requests.
+            output_folder (str): The results folder of the run.
+            requests_path (str, optional): Path of the `requests.parquet` of the run. Defaults to the one in the
+                running folder (`output_folder` with "results" replaced by "running").
+
+        Returns:
+            pd.DataFrame: The input data with the responses and their citation orders.
+        """
+        import pandas as pd
+
+        if requests_path is None:
+            running_folder = output_folder.replace("results", "running")
+            requests_path = os.path.join(running_folder, "requests.parquet")
+        df = pd.read_parquet(requests_path)
 
         list_citation_orders = []
         list_citation_orders_w_dups = []
         cnt_errors = 0
 
-        for idx, response in enumerate(responses_txt):
-            try:
-                citations, citations_w_dups = self.get_citation_order(response)
-
-            except Exception as e:
-                print(f"Error in index {idx}")
-                citations = []
-                citations_w_dups = []
-                cnt_errors += 1
-            list_citation_orders.append(citations)
-            list_citation_orders_w_dups.append(citations_w_dups)
+        with profiler.timer("engine.parse_citations"):
+            for idx, response in enumerate(responses_txt):
+                try:
+                    citations, citations_w_dups = self.get_citation_order(response)
+
+                except Exception as e:
+                    print(f"Error in index {idx}")
+                    citations = []
+                    citations_w_dups = []
+                    cnt_errors += 1
+                list_citation_orders.append(citations)
+                list_citation_orders_w_dups.append(citations_w_dups)
+
+        if "Context Order" in df.columns:
+            # the citations are positions in the context: map them back to the original documents
+            df["Citation Positions"] = list_citation_orders
+            list_citation_orders = [
+                self.map_citations(citations, order)
+                for citations, order in zip(list_citation_orders, df["Context Order"])
+            ]
+            list_citation_orders_w_dups = [
+                self.map_citations(citations, order)
+                for citations, order in zip(
+                    list_citation_orders_w_dups, df["Context Order"]
+                )
+            ]
 
         df["Response"] = responses_txt
         df["Citation Order"] = list_citation_orders
         df["Citation Order w. Duplicates"] = list_citation_orders_w_dups
 
         print(f"Errors in {cnt_errors} out of {len(df)}")
+        profiler.count("engine.citation_parsing_errors", cnt_errors)
+        profiler.write_report(output_folder)
         return df
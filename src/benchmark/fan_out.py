@@ -0,0 +1,207 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from data import Benchmark
+from llms import LLMInterface
+from profiling import profiler
+
+from .engine import Engine
+
+MANIFEST_FILENAME = "fan_out.json"
+
+
+def model_folder_name(llm_name: str) -> str:
+    """
+    Returns the folder name of a model (names of local models may contain "/", e.g. "meta-llama/Llama-3.1-8B").
+
+    Args:
+        llm_name (str): The name of the model.
+
+    Returns:
+        str: The folder name.
+    """
+    return llm_name.replace("/", "_")
+
+
+class FanOutRunner:
+    """
+    The FanOutRunner class runs the same benchmark on several LLMs (e.g., to compare conversational
+    search engines) without running `Engine.run_benchmark` once per model.
+
+    The data points are rendered once, converted into the requests of each provider with its
+    `create_message`/`create_request`, and the input data is written once as a shared `requests.parquet`
+    in the running folder of the run (`{split}/{method}`). The batches of all the models are submitted
+    concurrently, and each model keeps its batch and results under `{split}/{method}/{model}`.
+
+    Usage:
+        fan_out = FanOutRunner([OpenAIHelper("gpt-4o-mini"), AnthropicHelper("claude-3-5-haiku-20241022")])
+        fan_out.submit(Benchmark(...), developer_prompt, "experiments/running/retail/Fluency")
+        ...
+        fan_out.retrieve_results()  # fan_out.load(running_folder) in a new session
+    """
+
+    def __init__(self, llms: List[LLMInterface], max_workers: int = None):
+        """
+        Initializes the FanOutRunner.
+
+        Args:
+            llms (List[LLMInterface]): The LLM interfaces of the models to compare. Their names must be different.
+            max_workers (int, optional): Number of models submitted or retrieved at the same time. Defaults to all.
+        """
+        self.llms = {llm.llm_name: llm for llm in llms}
+        if len(self.llms) != len(llms):
+            raise ValueError("The names of the models must be different.")
+        self.max_workers = max_workers or max(len(llms), 1)
+        self.engine = Engine()
+        self.running_folder = None
+        self.batches = {}
+
+    def model_folder(self, llm_name: str, results: bool = False) -> str:
+        """
+        Returns the running (or results) folder of a model.
+
+        Args:
+            llm_name (str): The name of the model.
+            results (bool): Whether to return the results folder. Defaults to False.
+
+        Returns:
+            str: `{running_folder}/{model}`, with "running" replaced by "results" if `results`.
+        """
+        folder = self.running_folder
+        if results:
+            folder = folder.replace("running", "results")
+        return os.path.join(folder, model_folder_name(llm_name))
+
+    def submit(
+        self, dataset: Benchmark, developer_prompt: str, running_folder: str
+    ) -> dict:
+        """
+        Renders the benchmark once, writes the shared request table and submits one batch per model.
+
+        Args:
+            dataset (Benchmark): The dataset to benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            running_folder (str): The running folder of the run (e.g., `experiments/running/{split}/{method}`).
+                The results are saved in the same path with "running" replaced by "results".
+
+        Returns:
+            dict: {model: batch ID}.
+        """
+        self.running_folder = running_folder
+        with profiler.timer("fan_out.render"):
+            data_points = list(dataset)
+
+        def convert(llm):
+            return self.engine.convert_requests(data_points, developer_prompt, llm)
+
+        # the conversions are independent, and the uploads of the batches wait on the network
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            converted = dict(zip(self.llms, executor.map(convert, self.llms.values())))
+
+        # the raw prompt only depends on the rendered data point, so the table is shared by all the models
+        raw_prompts = next(iter(converted.values()))[1] if converted else []
+        with profiler.timer("fan_out.write_requests_parquet"):
+            os.makedirs(running_folder, exist_ok=True)
+            df = self.engine.create_table(data_points, developer_prompt, raw_prompts)
+            df.to_parquet(os.path.join(running_folder, "requests.parquet"))
+
+        def run_batch(llm_name):
+            model_folder = self.model_folder(llm_name)
+            os.makedirs(model_folder, exist_ok=True)
+            return self.llms[llm_name].run_batch(converted[llm_name][0], model_folder)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            batch_ids = list(executor.map(run_batch, self.llms))
+        self.batches = {
+            llm_name: {"batch_id": batch_id, "num_requests": len(data_points)}
+            for llm_name, batch_id in zip(self.llms, batch_ids)
+        }
+        print(
+            f"{len(data_points)} requests submitted to {len(self.llms)} model(s): {', '.join(self.llms)}"
+        )
+        self.save()
+        profiler.write_report(running_folder)
+        return {llm_name: batch["batch_id"] for llm_name, batch in self.batches.items()}
+
+    def save(self):
+        """
+        Saves the manifest of the run (models and batches) in the running folder.
+        """
+        os.makedirs(self.running_folder, exist_ok=True)
+        with open(
+            os.path.join(self.running_folder, MANIFEST_FILENAME), "w", encoding="utf-8"
+        ) as f:
+            json.dump({"batches": self.batches}, f, indent=4)
+
+    def load(self, running_folder: str):
+        """
+        Loads the manifest of a run submitted before (e.g., from another process). The LLM interfaces
+        of its models must be the ones passed to the constructor.
+
+        Args:
+            running_folder (str): The running folder used in `submit`.
+        """
+        self.running_folder = running_folder
+        with open(
+            os.path.join(running_folder, MANIFEST_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            self.batches = json.load(f)["batches"]
+        missing = [llm_name for llm_name in self.batches if llm_name not in self.llms]
+        if missing:
+            raise ValueError(f"No LLM interface for the models {missing}.")
+
+    def get_status(self) -> dict:
+        """
+        Returns the status of the batch of each model.
+
+        Returns:
+            dict: {model: status}.
+        """
+        return {
+            llm_name: self.llms[llm_name].get_status(batch["batch_id"])
+            for llm_name, batch in self.batches.items()
+        }
+
+    def retrieve_results(self):
+        """
+        Retrieves the batches of all the models and saves `responses.parquet`, `usage.parquet` and
+        `cost.json` in the results folder of each model. Models whose batch is not completed are skipped,
+        so the results can be retrieved as the batches finish.
+
+        Returns:
+            tuple: {model: results folder} of the completed models and their total cost.
+        """
+
+        def retrieve(llm_name):
+            results_folder = self.model_folder(llm_name, results=True)
+            os.makedirs(results_folder, exist_ok=True)
+            responses, cost = self.llms[llm_name].retrieve_results(
+                self.batches[llm_name]["batch_id"], output_folder=results_folder
+            )
+            return results_folder, responses, cost
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            retrieved = dict(zip(self.batches, executor.map(retrieve, self.batches)))
+
+        results_folders = {}
+        total_cost = 0
+        requests_path = os.path.join(self.running_folder, "requests.parquet")
+        for llm_name, (results_folder, responses, cost) in retrieved.items():
+            if responses is None:
+                print(f"Results for {llm_name} are not ready yet.")
+                continue
+            df = self.engine.process_benchmark_responses(
+                responses, results_folder, requests_path=requests_path
+            )
+            df.to_parquet(
+                os.path.join(results_folder, "responses.parquet"), index=False
+            )
+            with open(
+                os.path.join(results_folder, "cost.json"), "w", encoding="utf-8"
+            ) as f:
+                json.dump({"cost": cost}, f)
+            results_folders[llm_name] = results_folder
+            total_cost += cost
+        return results_folders, total_cost
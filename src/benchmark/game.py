@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+from typing import List
+
+from data import Benchmark, ResponseStore, SelectedDocsStore, load_split
+from data.selected_docs_store import ORIGINAL
+from llms import LLMInterface
+
+from .engine import Engine
+
+GAME_METHOD = "game"
+RESULTS_FILENAME = "game.json"
+
+
+def reciprocal_rank_utility(citations: List[int], actor: int) -> float:
+    """
+    Utility of an actor given the citation order of a response: 1 / (1 + rank) if the document of the
+    actor is cited, 0 otherwise.
+
+    Args:
+        citations (List[int]): Citation order (0-based document positions, without duplicates).
+        actor (int): Position of the document of the actor in the context.
+
+    Returns:
+        float: The utility.
+    """
+    if actor not in citations:
+        return 0.0
+    return 1.0 / (1 + citations.index(actor))
+
+
+class BestResponseGame:
+    """
+    The BestResponseGame class simulates the competition between the documents of each query (the actors),
+    which choose to publish their original text or the rewrite of a C-SEO method (their strategy) given
+    the choices of the others.
+
+    Every round, all the unilateral deviations of every actor from the current strategy profile of each
+    query are evaluated with the conversational search engine, and the actor with the largest improvement
+    of each query switches to its best response. The simulation stops when no actor improves (a pure Nash
+    equilibrium of the observed utilities) or after `max_rounds`.
+
+    The contexts are built with `Benchmark` and the requests with `Engine.create_requests`. Every
+    evaluated (query, profile) response is memoized in a `ResponseStore`, keyed by the profile and a hash
+    of its rendered request (see `profile_key`), so a profile is never sent twice
+    (across rounds, queries that already converged, and later simulations), and all the new profiles of a
+    round are sent together with `llm.run_requests`.
+
+    Usage:
+        game = BestResponseGame(llm, developer_prompt, store, ResponseStore(path), ["Fluency", "Statistics"], df=df)
+        results = game.run(output_folder)
+    """
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        developer_prompt: str,
+        store: SelectedDocsStore,
+        response_store: ResponseStore,
+        methods: List[str],
+        actors: List[int] = None,
+        utility=reciprocal_rank_utility,
+        num_docs_in_context: int = 10,
+        sample_size: int = None,
+        data_path: str = "cseo/cseo-bench",
+        split: str = "retail",
+        doc_type: str = "document",
+        df=None,
+        max_workers: int = 8,
+    ):
+        """
+        Initializes the BestResponseGame.
+
+        Args:
+            llm (LLMInterface): The LLM of the conversational search engine.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            store (SelectedDocsStore): Store with the rewrites of every actor for every method.
+            response_store (ResponseStore): Store where the responses are memoized.
+            methods (List[str]): Names of the C-SEO methods the actors can adopt. Keeping the original document
+                ("doc") is always a strategy.
+            actors (List[int], optional): Positions of the documents that play. Defaults to all the documents in the context.
+            utility (callable): Function (citations, actor) -> float. Defaults to `reciprocal_rank_utility`.
+            num_docs_in_context (int): Number of documents in the context. Defaults to 10.
+            sample_size (int, optional): Number of queries. If None, all queries are used.
+            data_path (str): Path or identifier for the dataset. Defaults to "cseo/cseo-bench".
+            split (str): Dataset split to use. Defaults to "retail".
+            doc_type (str): Type of document, used in the user prompts.
+            df (pd.DataFrame, optional): The split already loaded as a DataFrame. If None, it is loaded once here.
+            max_workers (int): Number of concurrent requests. Defaults to 8.
+        """
+        if df is None:
+            df = load_split(data_path, split)
+        self.df = df
+        self.llm = llm
+        self.developer_prompt = developer_prompt
+        self.response_store = response_store
+        self.strategies = [ORIGINAL] + list(methods)
+        self.actors = actors if actors is not None else list(range(num_docs_in_context))
+        self.utility = utility
+        self.num_docs_in_context = num_docs_in_context
+        self.sample_size = sample_size
+        self.data_path = data_path
+        self.split = split
+        self.doc_type = doc_type
+        self.max_workers = max_workers
+        self.engine = Engine()
+        self.cost = 0.0
+
+        num_queries = len(self.df["query_id"].unique())
+        if sample_size:
+            num_queries = min(num_queries, sample_size)
+        self.num_queries = num_queries
+        self.rewrites = {method: store.read(method) for method in methods}
+        for method, rewrites in self.rewrites.items():
+            for query_idx in range(self.num_queries):
+                missing = [
+                    actor
+                    for actor in self.actors
+                    if actor not in rewrites.get(query_idx, {})
+                ]
+                if missing:
+                    raise ValueError(
+                        f"Query {query_idx} has actors without {method} rewrites: {missing}."
+                    )
+
+    def profile_key(self, profile: List[str], request: dict) -> str:
+        """
+        Returns the key of a strategy profile in the response store: the strategies and a hash of the
+        rendered request. The request contains the system prompt, the query and every document of the
+        context, so games with other actors, prompts, context sizes or rewrites never share a response.
+
+        Args:
+            profile (List[str]): Strategy of each actor.
+            request (dict): The request of the profile, created with `llm.create_request`.
+
+        Returns:
+            str: "{strategies joined with ','}#{sha256 of the request without its custom_id}".
+        """
+        content = {key: value for key, value in request.items() if key != "custom_id"}
+        digest = hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return f"{','.join(profile)}#{digest}"
+
+    def _benchmark(self, profiles: List[List[str]]) -> Benchmark:
+        # each query has its own profile; the documents of the actors that adopt a method are
+        # replaced by their rewrite ("game(doc)"), the others keep the original document
+        selected_docs = {}
+        for query_idx, profile in enumerate(profiles):
+            selected_docs[str(query_idx)] = {
+                str(actor): {
+                    f"{GAME_METHOD}({ORIGINAL})": self.rewrites[strategy][query_idx][
+                        actor
+                    ]
+                }
+                for actor, strategy in zip(self.actors, profile)
+                if strategy != ORIGINAL
+            }
+        return Benchmark(
+            num_docs_in_context=self.num_docs_in_context,
+            method=GAME_METHOD,
+            sample_size=self.sample_size,
+            data_path=self.data_path,
+            split=self.split,
+            doc_type=self.doc_type,
+            df=self.df,
+            selected_docs=selected_docs,
+        )
+
+    def evaluate(self, list_profiles: List[List[List[str]]]) -> List[dict]:
+        """
+        Evaluates several profiles of every query, sending only the ones that are not in the response store.
+
+        Args:
+            list_profiles (List[List[List[str]]]): Each element has one profile per query.
+
+        Returns:
+            List[dict]: For each element, {query_idx: citation order}.
+        """
+        # the requests of every element are rendered, so the keys identify their exact content
+        list_requests = [
+            self.engine.create_requests(
+                self._benchmark(profiles),
+                self.developer_prompt,
+                self.llm,
+                custom_id_prefix=f"p{element_idx}",
+            )[0]
+            for element_idx, profiles in enumerate(list_profiles)
+        ]
+        keys = [
+            [
+                (query_idx, self.profile_key(profile, element_requests[query_idx]))
+                for query_idx, profile in enumerate(profiles)
+            ]
+            for profiles, element_requests in zip(list_profiles, list_requests)
+        ]
+        responses = self.response_store.read(
+            self.llm.llm_name, self.split, [key for k in keys for key in k]
+        )
+
+        # identical (query, request) pairs in several elements are sent once
+        unique_requests = {}
+        custom_id2key = {}
+        for element_keys, element_requests in zip(keys, list_requests):
+            for key in element_keys:
+                if key in responses or key in unique_requests:
+                    continue
+                request = element_requests[key[0]]
+                unique_requests[key] = request
+                custom_id2key[request["custom_id"]] = key
+        if unique_requests:
+            print(f"Sending {len(unique_requests)} new profiles")
+            results, cost = self.llm.run_requests(
+                list(unique_requests.values()), self.max_workers
+            )
+            self.cost += cost
+            new_responses = {
+                custom_id2key[custom_id]: text for custom_id, text in results.items()
+            }
+            self.response_store.write(
+                self.llm.llm_name,
+                self.split,
+                [
+                    (query_idx, profile, text)
+                    for (query_idx, profile), text in new_responses.items()
+                ],
+            )
+            responses.update(new_responses)
+
+        list_citations = []
+        for element_keys in keys:
+            citations = {}
+            for query_idx, profile in element_keys:
+                if (query_idx, profile) in responses:
+                    citations[query_idx] = self.engine.get_citation_order(
+                        responses[(query_idx, profile)]
+                    )[0]
+            list_citations.append(citations)
+        return list_citations
+
+    def run(
+        self,
+        output_folder: str = None,
+        max_rounds: int = 20,
+        min_gain: float = 0.0,
+        initial_strategy: str = ORIGINAL,
+    ) -> dict:
+        """
+        Runs the best-response dynamics until no actor improves.
+
+        Args:
+            output_folder (str, optional): If given, the history and final profiles are saved there as `game.json`.
+            max_rounds (int): Maximum number of rounds. Defaults to 20.
+            min_gain (float): Minimum improvement of the utility for an actor to switch. Defaults to 0.
+            initial_strategy (str): Strategy of every actor in the first round. Defaults to "doc" (no adoption).
+
+        Returns:
+            dict: The final profile and utilities of each query, the moves of each round, whether each query
+                converged, and the cost of the new requests.
+        """
+        self.cost = 0.0
+        profiles = [
+            [initial_strategy] * len(self.actors) for _ in range(self.num_queries)
+        ]
+        converged = [False] * self.num_queries
+        history = []
+        for round_idx in range(max_rounds):
+            # the current profiles and all the unilateral deviations, evaluated together
+            deviations = [
+                (actor_idx, strategy)
+                for actor_idx in range(len(self.actors))
+                for strategy in self.strategies
+            ]
+            list_profiles = [profiles]
+            for actor_idx, strategy in deviations:
+                list_profiles.append(
+                    [
+                        profile[:actor_idx] + [strategy] + profile[actor_idx + 1 :]
+                        for profile in profiles
+                    ]
+                )
+            list_citations = self.evaluate(list_profiles)
+
+            moves = []
+            for query_idx in range(self.num_queries):
+                if query_idx not in list_citations[0]:
+                    # failed request, the query keeps its profile
+                    continue
+                best_move = None
+                for (actor_idx, strategy), citations in zip(
+                    deviations, list_citations[1:]
+                ):
+                    if (
+                        strategy == profiles[query_idx][actor_idx]
+                        or query_idx not in citations
+                    ):
+                        continue
+                    actor = self.actors[actor_idx]
+                    gain = self.utility(citations[query_idx], actor) - self.utility(
+                        list_citations[0][query_idx], actor
+                    )
+                    if gain > min_gain and (best_move is None or gain > best_move[2]):
+                        best_move = (actor_idx, strategy, gain)
+                converged[query_idx] = best_move is None
+                if best_move is not None:
+                    actor_idx, strategy, gain = best_move
+                    moves.append(
+                        {
+                            "query_idx": query_idx,
+                            "actor": self.actors[actor_idx],
+                            "from": profiles[query_idx][actor_idx],
+                            "to": strategy,
+                            "gain": gain,
+                        }
+                    )
+                    profiles[query_idx][actor_idx] = strategy
+            history.append(moves)
+            print(f"Round {round_idx}: {len(moves)} actors switched strategy")
+            if not moves:
+                break
+
+        final_citations = self.evaluate([profiles])[0]
+        results = {
+            "strategies": self.strategies,
+            "actors": self.actors,
+            "profiles": profiles,
+            "utilities": [
+                (
+                    [
+                        self.utility(final_citations[query_idx], actor)
+                        for actor in self.actors
+                    ]
+                    if query_idx in final_citations
+                    else None
+                )
+                for query_idx in range(self.num_queries)
+            ],
+            "converged": converged,
+            "history": history,
+            "cost": self.cost,
+        }
+        if output_folder is not None:
+            os.makedirs(output_folder, exist_ok=True)
+            with open(
+                os.path.join(output_folder, RESULTS_FILENAME), "w", encoding="utf-8"
+            ) as f:
+                json.dump(results, f)
+        return results
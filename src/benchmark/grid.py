@@ -0,0 +1,217 @@
+import json
+import os
+
+from data import Benchmark
+from llms import LLMInterface
+from llms.batching import (
+    MAX_BYTES_PER_BATCH,
+    MAX_REQUESTS_PER_BATCH,
+    decode_custom_id,
+    shard_requests,
+)
+from .engine import Engine
+
+MANIFEST_FILENAME = "grid.json"
+
+
+class GridRunner:
+    """
+    The GridRunner class runs many benchmark runs (e.g., all the splits and methods of the README grid) with
+    shared batches instead of one batch per (split, method).
+
+    The requests of every run are packed into size-limited batches. The custom_id of each request is
+    "run{run_idx}-{i}", so the responses are split back into the usual layout of each run:
+    `requests.parquet` in its running folder, and `responses.parquet`, `usage.parquet` and `cost.json`
+    in its results folder.
+
+    Usage:
+        grid = GridRunner(llm, grid_folder)
+        for split, method in ...:
+            grid.add_run(Benchmark(...), developer_prompt, running_folder)
+        grid.submit()
+        ...
+        grid.retrieve_results()
+    """
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        grid_folder: str,
+        max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+        max_bytes_per_batch: int = MAX_BYTES_PER_BATCH,
+    ):
+        """
+        Initializes the GridRunner.
+
+        Args:
+            llm (LLMInterface): The LLM interface used to run all the requests.
+            grid_folder (str): Folder where the shared batches and the manifest of the grid are saved.
+            max_requests_per_batch (int): Maximum number of requests per batch.
+            max_bytes_per_batch (int): Maximum size of a batch in JSONL format.
+        """
+        self.llm = llm
+        self.grid_folder = grid_folder
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_bytes_per_batch = max_bytes_per_batch
+        self.engine = Engine()
+        self.runs = []
+        self.batch_ids = []
+        self.shard_folders = []
+
+    def add_run(self, dataset: Benchmark, developer_prompt: str, running_folder: str):
+        """
+        Adds a run to the grid.
+
+        Args:
+            dataset (Benchmark): The dataset to benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            running_folder (str): The running folder of the run (e.g., `experiments/running/{split}/{method}`).
+                The results are saved in the same path with "running" replaced by "results".
+        """
+        self.runs.append(
+            {
+                "dataset": dataset,
+                "developer_prompt": developer_prompt,
+                "running_folder": running_folder,
+            }
+        )
+
+    def create_requests(self):
+        """
+        Creates the requests of all the runs and saves the `requests.parquet` of each run.
+
+        Returns:
+            list: The requests of all the runs.
+        """
+        list_requests = []
+        for run_idx, run in enumerate(self.runs):
+            run_requests, df = self.engine.create_requests(
+                run["dataset"],
+                run["developer_prompt"],
+                self.llm,
+                custom_id_prefix=f"run{run_idx}",
+            )
+            os.makedirs(run["running_folder"], exist_ok=True)
+            df.to_parquet(os.path.join(run["running_folder"], "requests.parquet"))
+            run["num_requests"] = len(run_requests)
+            list_requests.extend(run_requests)
+        return list_requests
+
+    def submit(self):
+        """
+        Creates the requests of all the runs and submits them in shared batches.
+
+        Returns:
+            list: The IDs of the batches.
+        """
+        list_requests = self.create_requests()
+        shards = shard_requests(
+            list_requests, self.max_requests_per_batch, self.max_bytes_per_batch
+        )
+        print(
+            f"{len(list_requests)} requests for {len(self.runs)} runs in {len(shards)} batch(es)"
+        )
+        self.batch_ids = []
+        self.shard_folders = []
+        for shard_idx, shard in enumerate(shards):
+            shard_folder = os.path.join(self.grid_folder, f"shard-{shard_idx}")
+            os.makedirs(shard_folder, exist_ok=True)
+            self.batch_ids.append(self.llm.run_batch(shard, shard_folder))
+            self.shard_folders.append(shard_folder)
+        self.save()
+        return self.batch_ids
+
+    def save(self):
+        """
+        Saves the manifest of the grid (runs, batches and shard folders) in the grid folder.
+        """
+        os.makedirs(self.grid_folder, exist_ok=True)
+        manifest = {
+            "batch_ids": self.batch_ids,
+            "shard_folders": self.shard_folders,
+            "runs": [
+                {
+                    "running_folder": run["running_folder"],
+                    "num_requests": run["num_requests"],
+                }
+                for run in self.runs
+            ],
+        }
+        with open(
+            os.path.join(self.grid_folder, MANIFEST_FILENAME), "w", encoding="utf-8"
+        ) as f:
+            json.dump(manifest, f, indent=4)
+
+    def load(self):
+        """
+        Loads the manifest of a grid submitted before (e.g., from another process).
+        """
+        with open(
+            os.path.join(self.grid_folder, MANIFEST_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            manifest = json.load(f)
+        self.batch_ids = manifest["batch_ids"]
+        self.shard_folders = manifest["shard_folders"]
+        self.runs = manifest["runs"]
+
+    def get_status(self):
+        """
+        Returns the status of each batch.
+
+        Returns:
+            list: The status of each batch.
+        """
+        return [self.llm.get_status(batch_id) for batch_id in self.batch_ids]
+
+    def retrieve_results(self):
+        """
+        Retrieves all the batches and saves `responses.parquet`, `usage.parquet` and `cost.json` in the
+        results folder of each run.
+
+        Returns:
+            tuple: The list of results folders and the total cost, or (None, None) if a batch is not completed.
+        """
+        import pandas as pd
+
+        from llms.usage_ledger import USAGE_FILENAME, save_usage_ledger
+
+        results = {}
+        list_ledgers = []
+        for batch_id, shard_folder in zip(self.batch_ids, self.shard_folders):
+            batch_results, _ = self.llm.retrieve_results_by_custom_id(
+                batch_id, output_folder=shard_folder
+            )
+            if batch_results is None:
+                print(f"Results for batch {batch_id} are not ready yet.")
+                return None, None
+            results.update(batch_results)
+            list_ledgers.append(
+                pd.read_parquet(os.path.join(shard_folder, USAGE_FILENAME))
+            )
+        ledger = pd.concat(list_ledgers, ignore_index=True)
+        ledger_run = ledger["custom_id"].map(lambda x: decode_custom_id(x)[0])
+
+        # split the responses back into each run
+        responses = [[None] * run["num_requests"] for run in self.runs]
+        for custom_id, text in results.items():
+            run_name, i = decode_custom_id(custom_id)
+            responses[int(run_name[len("run") :])][int(i)] = text
+
+        list_results_folders = []
+        for run_idx, run in enumerate(self.runs):
+            results_folder = run["running_folder"].replace("running", "results")
+            os.makedirs(results_folder, exist_ok=True)
+            df = self.engine.process_benchmark_responses(
+                responses[run_idx], results_folder
+            )
+            df.to_parquet(
+                os.path.join(results_folder, "responses.parquet"), index=False
+            )
+            run_ledger = ledger[ledger_run == f"run{run_idx}"]
+            save_usage_ledger(run_ledger, results_folder)
+            with open(
+                os.path.join(results_folder, "cost.json"), "w", encoding="utf-8"
+            ) as f:
+                json.dump({"cost": float(run_ledger["cost"].sum())}, f)
+            list_results_folders.append(results_folder)
+        return list_results_folders, float(ledger["cost"].sum())
@@ -0,0 +1,465 @@
+import json
+import os
+import time
+from typing import List
+
+import pandas as pd
+
+from data import Benchmark
+from llms import LLMInterface
+from llms.batching import MAX_BYTES_PER_BATCH, MAX_REQUESTS_PER_BATCH, shard_requests
+from llms.token_counter import TokenCounter
+from methods.citation_boosting import deduplicate_texts
+
+from .cost_estimator import CostEstimator
+from .engine import Engine
+
+MANIFEST_FILENAME = "router.json"
+REALTIME_RESULTS_FILENAME = "realtime_results.json"
+
+BATCH = "batch"
+REALTIME = "realtime"
+
+# Statuses of finished batches (OpenAI: completed / failed / expired / cancelled, Anthropic: ended)
+_COMPLETED_STATUSES = ("completed", "ended")
+_FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+
+class ExecutionRouter:
+    """
+    The ExecutionRouter class decides, for each shard of a job, whether it runs with the Batch API
+    (half the price, up to 24 hours) or with the real-time API (`llm.run_requests`), given a deadline
+    and a budget.
+
+    Shards run in batch while the expected batch turnaround fits in the deadline. Otherwise, shards are
+    moved to real-time (cheapest first) as long as the estimated cost fits in the budget. The budget covers
+    the batch shards too: a job whose batch estimate alone exceeds it is not submitted. Batch shards
+    that are still running (or failed) when the deadline gets close are cancelled and promoted to
+    real-time by `poll`. The results have the same shape in both modes.
+
+    Usage:
+        router = ExecutionRouter(llm, deadline_hours=2, budget=5.0)
+        router.run_benchmark(dataset, developer_prompt, running_folder)
+        ...
+        responses, cost = router.retrieve_results()  # same as llm.retrieve_results
+    """
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        deadline_hours: float = 24,
+        budget: float = None,
+        batch_turnaround_hours: float = 24,
+        seconds_per_request: float = 10,
+        max_workers: int = 8,
+        safety_factor: float = 1.5,
+        max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+        max_bytes_per_batch: int = MAX_BYTES_PER_BATCH,
+        token_counter: TokenCounter = None,
+    ):
+        """
+        Initializes the ExecutionRouter.
+
+        Args:
+            llm (LLMInterface): The LLM interface used to run the requests.
+            deadline_hours (float): Hours from the submission until all the results are needed. Defaults to 24.
+            budget (float, optional): Maximum expected cost in dollars. If None, the cost is not limited.
+            batch_turnaround_hours (float): Expected time until a batch is completed. Defaults to 24 (the batch window).
+            seconds_per_request (float): Expected latency of a real-time request. Defaults to 10.
+            max_workers (int): Number of concurrent real-time requests. Defaults to 8.
+            safety_factor (float): Margin applied to the real-time time estimates. Defaults to 1.5.
+            max_requests_per_batch (int): Maximum number of requests per shard.
+            max_bytes_per_batch (int): Maximum size of a shard in JSONL format.
+            token_counter (TokenCounter, optional): Counter used to estimate the tokens of the requests.
+        """
+        self.llm = llm
+        self.deadline_hours = deadline_hours
+        self.budget = budget
+        self.batch_turnaround_hours = batch_turnaround_hours
+        self.seconds_per_request = seconds_per_request
+        self.max_workers = max_workers
+        self.safety_factor = safety_factor
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_bytes_per_batch = max_bytes_per_batch
+        token_counter = (
+            token_counter if token_counter is not None else TokenCounter(llm.llm_name)
+        )
+        self.batch_estimator = CostEstimator(llm, token_counter, batch=True)
+        self.realtime_estimator = CostEstimator(llm, token_counter, batch=False)
+        self.output_folder = None
+        self.deadline = None
+        self.num_requests = 0
+        self.shards = []
+
+    def estimate_realtime_seconds(self, num_requests: int, input_tokens: int) -> float:
+        """
+        Estimates the time to run requests with the real-time API, limited by the concurrency and by the
+        rate limiter of the LLM helper.
+
+        Args:
+            num_requests (int): Number of requests.
+            input_tokens (int): Number of input tokens of the requests.
+
+        Returns:
+            float: The estimated time in seconds, including the safety factor.
+        """
+        seconds = num_requests * self.seconds_per_request / self.max_workers
+        rate_limiter = getattr(self.llm, "rate_limiter", None)
+        if rate_limiter is not None:
+            seconds = max(seconds, 60 * num_requests / rate_limiter.requests_per_minute)
+            if rate_limiter.tokens_per_minute is not None:
+                seconds = max(
+                    seconds, 60 * input_tokens / rate_limiter.tokens_per_minute
+                )
+        return seconds * self.safety_factor
+
+    def plan(self, list_requests: List, output_tokens=400) -> pd.DataFrame:
+        """
+        Splits the requests into shards and chooses batch or real-time execution for each one.
+
+        Args:
+            list_requests (List): Requests created with `llm.create_request`.
+            output_tokens (int or List[int]): Expected number of output tokens, for all requests or per request.
+
+        Returns:
+            pd.DataFrame: One row per shard with the columns "Shard", "Requests", "Input Tokens",
+                "Output Tokens", "Batch Cost", "Realtime Cost", "Realtime Seconds" and "Mode".
+        """
+        if isinstance(output_tokens, int):
+            output_tokens = [output_tokens] * len(list_requests)
+        shards = shard_requests(
+            list_requests, self.max_requests_per_batch, self.max_bytes_per_batch
+        )
+        list_rows = []
+        start = 0
+        for shard_idx, shard in enumerate(shards):
+            shard_output_tokens = output_tokens[start : start + len(shard)]
+            start += len(shard)
+            batch = self.batch_estimator.estimate_requests(shard, shard_output_tokens)
+            realtime = self.realtime_estimator.estimate_requests(
+                shard, shard_output_tokens
+            )
+            list_rows.append(
+                [
+                    shard_idx,
+                    len(shard),
+                    int(batch["Input Tokens"].sum()),
+                    int(batch["Output Tokens"].sum()),
+                    float(batch["Cost"].sum()),
+                    float(realtime["Cost"].sum()),
+                    self.estimate_realtime_seconds(
+                        len(shard), int(batch["Input Tokens"].sum())
+                    ),
+                ]
+            )
+        df = pd.DataFrame(
+            list_rows,
+            columns=[
+                "Shard",
+                "Requests",
+                "Input Tokens",
+                "Output Tokens",
+                "Batch Cost",
+                "Realtime Cost",
+                "Realtime Seconds",
+            ],
+        )
+        df["Mode"] = BATCH
+        if self.deadline_hours >= self.batch_turnaround_hours:
+            return df
+
+        # the batch is not expected to finish on time: move shards to real-time while they fit in
+        # the deadline (real-time shards run one after the other) and in the budget
+        cost = df["Batch Cost"].sum()
+        seconds = 0
+        for idx in df.sort_values("Realtime Cost").index:
+            extra_cost = df.at[idx, "Realtime Cost"] - df.at[idx, "Batch Cost"]
+            if self.budget is not None and cost + extra_cost > self.budget:
+                continue
+            if seconds + df.at[idx, "Realtime Seconds"] > self.deadline_hours * 3600:
+                continue
+            df.at[idx, "Mode"] = REALTIME
+            cost += extra_cost
+            seconds += df.at[idx, "Realtime Seconds"]
+        if (df["Mode"] == BATCH).any():
+            print(
+                f"{(df['Mode'] == BATCH).sum()} shard(s) do not fit in the deadline or budget in real-time "
+                "and run in batch. They may finish after the deadline."
+            )
+        return df
+
+    def planned_cost(self, df_plan: pd.DataFrame) -> float:
+        """
+        Returns the estimated cost of a plan, with the price of the mode of each shard.
+
+        Args:
+            df_plan (pd.DataFrame): The plan (see `plan`).
+
+        Returns:
+            float: The estimated cost in dollars.
+        """
+        realtime = df_plan["Mode"] == REALTIME
+        return float(
+            df_plan.loc[realtime, "Realtime Cost"].sum()
+            + df_plan.loc[~realtime, "Batch Cost"].sum()
+        )
+
+    def submit(self, list_requests: List, output_folder: str, output_tokens=400):
+        """
+        Submits the batch shards and runs the real-time shards. The plan and the state of each shard are
+        saved in `output_folder/router.json`. Raises a ValueError without submitting anything if the
+        estimated cost of the plan (including the batch shards) exceeds the budget.
+
+        Args:
+            list_requests (List): Requests created with `llm.create_request`.
+            output_folder (str): Folder where the shards and the manifest are saved.
+            output_tokens (int or List[int]): Expected number of output tokens, for all requests or per request.
+
+        Returns:
+            pd.DataFrame: The plan (see `plan`).
+        """
+        df_plan = self.plan(list_requests, output_tokens)
+        print(df_plan)
+        cost = self.planned_cost(df_plan)
+        if self.budget is not None and cost > self.budget:
+            # the batch is the cheapest mode, so no plan fits in the budget
+            raise ValueError(
+                f"The estimated cost of the job (${cost:.2f}) exceeds the budget (${self.budget:.2f}). "
+                "Nothing was submitted."
+            )
+        self.output_folder = output_folder
+        self.deadline = time.time() + self.deadline_hours * 3600
+        self.num_requests = len(list_requests)
+        self.shards = []
+        start = 0
+        for row in df_plan.to_dict("records"):
+            shard = list_requests[start : start + row["Requests"]]
+            start += row["Requests"]
+            shard_folder = os.path.join(output_folder, f"shard-{row['Shard']}")
+            os.makedirs(shard_folder, exist_ok=True)
+            batch_id = None
+            if row["Mode"] == BATCH:
+                batch_id = self.llm.run_batch(shard, shard_folder)
+            else:
+                # saved as in a batch, so every shard can be (re)run in real-time from its folder
+                with open(
+                    os.path.join(shard_folder, "requests.jsonl"), "w", encoding="utf-8"
+                ) as f:
+                    for request in shard:
+                        f.write(json.dumps(request) + "\n")
+            self.shards.append(
+                {
+                    "folder": shard_folder,
+                    "mode": row["Mode"],
+                    "batch_id": batch_id,
+                    "done": False,
+                    "batch_cost": row["Batch Cost"],
+                    "realtime_cost": row["Realtime Cost"],
+                    "realtime_seconds": row["Realtime Seconds"],
+                }
+            )
+        self.save()
+        for shard_idx, shard in enumerate(self.shards):
+            if shard["mode"] == REALTIME:
+                self._run_realtime(shard_idx)
+        return df_plan
+
+    def run_benchmark(
+        self,
+        dataset: Benchmark,
+        developer_prompt: str,
+        running_folder: str,
+        output_tokens: int = 400,
+    ) -> pd.DataFrame:
+        """
+        Routed version of `Engine.run_benchmark`. The responses are obtained with `retrieve_results`
+        and processed with `Engine.process_benchmark_responses`.
+
+        Args:
+            dataset (Benchmark): The dataset to benchmark.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            running_folder (str): The folder where the requests and the shards are saved.
+            output_tokens (int): Expected length of each response in tokens. Defaults to 400.
+
+        Returns:
+            pd.DataFrame: The plan (see `plan`).
+        """
+        list_requests, df = Engine().create_requests(
+            dataset, developer_prompt, self.llm
+        )
+        os.makedirs(running_folder, exist_ok=True)
+        df.to_parquet(os.path.join(running_folder, "requests.parquet"))
+        return self.submit(list_requests, running_folder, output_tokens)
+
+    def improve_texts(
+        self,
+        method,
+        texts: List[str],
+        output_folder: str,
+        output_ratio: float = 1.2,
+        deduplicate: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Routed version of `CitationBoosting.improve_texts`. The improved texts are obtained with
+        `method.process_results(router.retrieve_results()[0], output_folder)`.
+
+        Args:
+            method (CitationBoosting): The C-SEO method used to rewrite the texts.
+            texts (List[str]): List of texts to improve.
+            output_folder (str): Folder to save the output.
+            output_ratio (float): Expected length of each rewrite relative to the original text. Defaults to 1.2.
+            deduplicate (bool): Whether to send one request per unique text. Defaults to True.
+
+        Returns:
+            pd.DataFrame: The plan (see `plan`).
+        """
+        list_requests = method.create_deduplicated_requests(
+            texts, output_folder, deduplicate
+        )
+        # one request per unique text, in the order of the requests
+        unique_texts = deduplicate_texts(texts)[0] if deduplicate else texts
+        token_counter = self.batch_estimator.token_counter
+        output_tokens = [
+            int(token_counter.count(text) * output_ratio) for text in unique_texts
+        ]
+        return self.submit(list_requests, output_folder, output_tokens)
+
+    def save(self):
+        """
+        Saves the state of the shards in the manifest.
+        """
+        with open(
+            os.path.join(self.output_folder, MANIFEST_FILENAME), "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "deadline": self.deadline,
+                    "num_requests": self.num_requests,
+                    "shards": self.shards,
+                },
+                f,
+                indent=4,
+            )
+
+    def load(self, output_folder: str):
+        """
+        Loads the state of a job submitted before (e.g., from another process).
+
+        Args:
+            output_folder (str): The output folder used in `submit`.
+        """
+        with open(
+            os.path.join(output_folder, MANIFEST_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            manifest = json.load(f)
+        self.output_folder = output_folder
+        self.deadline = manifest["deadline"]
+        self.num_requests = manifest["num_requests"]
+        self.shards = manifest["shards"]
+
+    def _run_realtime(self, shard_idx: int):
+        shard = self.shards[shard_idx]
+        with open(
+            os.path.join(shard["folder"], "requests.jsonl"), "r", encoding="utf-8"
+        ) as f:
+            list_requests = [json.loads(line) for line in f if line.strip()]
+        results, cost = self.llm.run_requests(list_requests, self.max_workers)
+        with open(
+            os.path.join(shard["folder"], REALTIME_RESULTS_FILENAME),
+            "w",
+            encoding="utf-8",
+        ) as f:
+            json.dump({"results": results, "cost": cost}, f)
+        shard["mode"] = REALTIME
+        shard["done"] = True
+        self.save()
+
+    def poll(self) -> List[str]:
+        """
+        Checks the batch shards and promotes to real-time the ones that failed, or that are still running
+        when the remaining time is close to their real-time estimate (if the budget allows it).
+
+        Returns:
+            List[str]: The status of each shard ("done", "promoted" or the status of its batch).
+        """
+        list_status = []
+        spent = sum(
+            shard["realtime_cost"] if shard["mode"] == REALTIME else shard["batch_cost"]
+            for shard in self.shards
+        )
+        for shard_idx, shard in enumerate(self.shards):
+            if shard["done"]:
+                list_status.append("done")
+                continue
+            status = self.llm.get_status(shard["batch_id"])
+            if status in _COMPLETED_STATUSES:
+                list_status.append(status)
+                continue
+            seconds_left = self.deadline - time.time()
+            if status in _FAILED_STATUSES or seconds_left <= shard["realtime_seconds"]:
+                extra_cost = shard["realtime_cost"] - shard["batch_cost"]
+                if self.budget is not None and spent + extra_cost > self.budget:
+                    print(
+                        f"Shard {shard_idx} is {status} but promoting it to real-time exceeds the budget."
+                    )
+                    list_status.append(status)
+                    continue
+                print(f"Shard {shard_idx} is {status}. Promoting it to real-time.")
+                if status not in _FAILED_STATUSES:
+                    self.llm.cancel_batch(shard["batch_id"])
+                # the results of the real-time requests replace the batch
+                self._run_realtime(shard_idx)
+                spent += extra_cost
+                list_status.append("promoted")
+                continue
+            list_status.append(status)
+        return list_status
+
+    def retrieve_results_by_custom_id(self):
+        """
+        Polls the shards (see `poll`) and retrieves the results of all of them.
+
+        Returns:
+            tuple: A dictionary {custom_id: text} and the total cost if all the shards are completed,
+                otherwise (None, None).
+        """
+        self.poll()
+        results = {}
+        total_cost = 0.0
+        for shard in self.shards:
+            if shard["mode"] == REALTIME:
+                with open(
+                    os.path.join(shard["folder"], REALTIME_RESULTS_FILENAME),
+                    "r",
+                    encoding="utf-8",
+                ) as f:
+                    realtime_results = json.load(f)
+                results.update(realtime_results["results"])
+                total_cost += realtime_results["cost"]
+                continue
+            batch_results, cost = self.llm.retrieve_results_by_custom_id(
+                shard["batch_id"], output_folder=shard["folder"]
+            )
+            if batch_results is None:
+                print(f"Results for batch {shard['batch_id']} are not ready yet.")
+                return None, None
+            results.update(batch_results)
+            total_cost += cost
+        return results, total_cost
+
+    def retrieve_results(self):
+        """
+        Polls the shards (see `poll`) and retrieves the results of all of them, in the same format as
+        `llm.retrieve_results`.
+
+        Returns:
+            tuple: The list of results sorted by request (None for failed requests) and the total cost
+                if all the shards are completed, otherwise (None, None).
+        """
+        results, total_cost = self.retrieve_results_by_custom_id()
+        if results is None:
+            return None, None
+        sorted_results = [None] * self.num_requests
+        for custom_id, text in results.items():
+            sorted_results[int(custom_id.split("-")[-1])] = text
+        return sorted_results, total_cost
@@ -0,0 +1,248 @@
+import json
+import os
+
+import numpy as np
+
+from data import Benchmark
+from evaluation.sequential import CONTINUE, MixtureSPRT
+from evaluation.statistics import calculate_rank_differences
+from llms import LLMInterface
+
+from .engine import Engine
+
+RESULTS_FILENAME = "sequential.json"
+RESPONSES_FILENAME = "responses.parquet"
+
+
+class SequentialRunner:
+    """
+    The SequentialRunner class evaluates a C-SEO method against the baseline in shards of queries and
+    stops as soon as a sequential test (`evaluation.MixtureSPRT`) reaches efficacy or futility, instead
+    of running the whole split before computing the Wilcoxon test. Methods without effect usually stop
+    after a few shards, at a fraction of the cost of a full run.
+
+    The queries are visited in a seeded random order, so every shard is a random sample of the split.
+    The requests of the baseline and the method of each shard are created with `Engine.create_requests`
+    and sent together with `llm.run_requests`. The responses of each shard are saved as
+    `shard-{k}.json`, so an interrupted run resumes without sending them again. The design of the test
+    (pre-registration), the statistics after each shard and the decision are saved in `sequential.json`,
+    and the responses of the evaluated queries in `{output_folder}/{method}/responses.parquet` (same
+    columns as the results of `Engine`).
+
+    Usage:
+        runner = SequentialRunner(llm, developer_prompt, Benchmark(method="baseline", ...), Benchmark(method="Fluency", ...))
+        results = runner.run("experiments/sequential/retail/Fluency")
+    """
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        developer_prompt: str,
+        baseline: Benchmark,
+        method: Benchmark,
+        test: MixtureSPRT = None,
+        shard_size: int = 100,
+        max_citations: int = 5,
+        seed: int = 42,
+        max_workers: int = 8,
+        df_baseline=None,
+    ):
+        """
+        Initializes the SequentialRunner.
+
+        Args:
+            llm (LLMInterface): The LLM of the conversational search engine.
+            developer_prompt (str): The system-level prompt to guide the LLM's behavior.
+            baseline (Benchmark): The benchmark without C-SEO method.
+            method (Benchmark): The benchmark of the method, with the same queries as `baseline`.
+            test (MixtureSPRT, optional): The sequential test. Defaults to `MixtureSPRT()`.
+            shard_size (int): Number of queries per shard. Defaults to 100.
+            max_citations (int): Citations after this rank are ignored. Defaults to 5.
+            seed (int): Seed of the order of the queries. Defaults to 42.
+            max_workers (int): Number of concurrent requests. Defaults to 8.
+            df_baseline (pd.DataFrame, optional): Existing results of the baseline (`responses.parquet`). If given,
+                only the requests of the method are sent.
+        """
+        if len(baseline) != len(method):
+            raise ValueError(
+                f"The baseline has {len(baseline)} queries and the method {len(method)}."
+            )
+        self.llm = llm
+        self.developer_prompt = developer_prompt
+        self.baseline = baseline
+        self.method = method
+        self.test = test if test is not None else MixtureSPRT()
+        self.shard_size = shard_size
+        self.max_citations = max_citations
+        self.seed = seed
+        self.max_workers = max_workers
+        self.df_baseline = (
+            df_baseline.reset_index(drop=True) if df_baseline is not None else None
+        )
+        self.engine = Engine()
+        self.query_order = np.random.default_rng(seed).permutation(len(method)).tolist()
+
+    @property
+    def num_shards(self) -> int:
+        """
+        Returns the number of shards of the split.
+
+        Returns:
+            int: Number of shards.
+        """
+        return -(-len(self.query_order) // self.shard_size)
+
+    def shard(self, k: int) -> list:
+        """
+        Returns the queries of a shard.
+
+        Args:
+            k (int): Index of the shard.
+
+        Returns:
+            list: Indices of the queries of the shard.
+        """
+        return self.query_order[k * self.shard_size : (k + 1) * self.shard_size]
+
+    def _run_shard(self, k: int, output_folder: str):
+        queries = self.shard(k)
+        runs = {"method": self.method}
+        if self.df_baseline is None:
+            runs["baseline"] = self.baseline
+        list_requests = []
+        custom_ids = {}
+        dfs = {}
+        for name, dataset in runs.items():
+            requests, df = self.engine.create_requests(
+                [dataset[query_idx] for query_idx in queries],
+                self.developer_prompt,
+                self.llm,
+                custom_id_prefix=f"{name}{k}",
+            )
+            df["Query Index"] = queries
+            list_requests.extend(requests)
+            custom_ids[name] = [request["custom_id"] for request in requests]
+            dfs[name] = df
+
+        shard_path = os.path.join(output_folder, f"shard-{k}.json")
+        if os.path.exists(shard_path):
+            with open(shard_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            results, cost = saved["responses"], saved["cost"]
+        else:
+            print(f"Shard {k}: sending {len(list_requests)} requests")
+            results, cost = self.llm.run_requests(list_requests, self.max_workers)
+            with open(shard_path, "w", encoding="utf-8") as f:
+                json.dump({"responses": results, "cost": cost}, f)
+
+        for name, df in dfs.items():
+            responses = [results.get(custom_id) for custom_id in custom_ids[name]]
+            citations = []
+            for response, order in zip(
+                responses,
+                (
+                    df["Context Order"]
+                    if "Context Order" in df.columns
+                    else [None] * len(df)
+                ),
+            ):
+                if response is None:
+                    citations.append(None)
+                    continue
+                citation_order = self.engine.get_citation_order(response)[0]
+                if order is not None:
+                    citation_order = self.engine.map_citations(citation_order, order)
+                citations.append(citation_order)
+            df["Response"] = responses
+            df["Citation Order"] = citations
+        if self.df_baseline is not None:
+            dfs["baseline"] = self.df_baseline.iloc[queries].reset_index(drop=True)
+            dfs["baseline"]["Query Index"] = queries
+        return dfs, cost
+
+    def _rank_differences(self, df_baseline, df_method) -> list:
+        # failed requests are skipped in both runs, so the rows stay paired
+        answered = (
+            df_baseline["Citation Order"].notna().to_numpy()
+            & df_method["Citation Order"].notna().to_numpy()
+        )
+        df_baseline = df_baseline[answered].copy()
+        df_method = df_method[answered].copy()
+        for df in (df_baseline, df_method):
+            df["Citation Order"] = [
+                list(order)[: self.max_citations] for order in df["Citation Order"]
+            ]
+        return calculate_rank_differences(df_baseline, df_method, self.max_citations)
+
+    def run(self, output_folder: str, max_queries: int = None) -> dict:
+        """
+        Runs the shards until the test stops or all the queries are evaluated. The test starts from
+        scratch, so a run resumed with the same runner feeds the cached shards to the test only once.
+
+        Args:
+            output_folder (str): Folder of the shards, `sequential.json` and the responses.
+            max_queries (int, optional): Maximum number of queries to evaluate. Defaults to all the queries.
+
+        Returns:
+            dict: The design of the test, the statistics after each shard, the decision, the number of
+                evaluated queries and the cost of the requests.
+        """
+        import pandas as pd
+
+        os.makedirs(output_folder, exist_ok=True)
+        self.test.reset()
+        num_shards = self.num_shards
+        if max_queries is not None:
+            num_shards = min(num_shards, -(-max_queries // self.shard_size))
+        results = {
+            "design": {
+                **self.test.design(),
+                "shard_size": self.shard_size,
+                "max_citations": self.max_citations,
+                "seed": self.seed,
+                "num_queries": len(self.query_order),
+                "max_queries": max_queries,
+            },
+            "method": self.method.method,
+            "model": self.llm.llm_name,
+            "history": [],
+            "decision": CONTINUE,
+            "num_queries": 0,
+            "cost": 0.0,
+        }
+        list_dfs = {"baseline": [], self.method.method: []}
+        for k in range(num_shards):
+            dfs, cost = self._run_shard(k, output_folder)
+            list_dfs["baseline"].append(dfs["baseline"])
+            list_dfs[self.method.method].append(dfs["method"])
+            state = self.test.update(
+                self._rank_differences(dfs["baseline"], dfs["method"])
+            )
+            results["cost"] += cost
+            results["num_queries"] += len(dfs["method"])
+            results["history"].append(
+                {"shard": k, "num_queries": results["num_queries"], **state}
+            )
+            results["decision"] = state["decision"]
+            print(
+                f"Shard {k}: {results['num_queries']} queries, mean diff {state['mean_diff']:.3f} "
+                f"[{state['ci_low']:.3f}, {state['ci_high']:.3f}], decision: {state['decision']}"
+            )
+            with open(
+                os.path.join(output_folder, RESULTS_FILENAME), "w", encoding="utf-8"
+            ) as f:
+                json.dump(results, f)
+            if state["decision"] != CONTINUE:
+                break
+
+        for name, dfs in list_dfs.items():
+            if not dfs:
+                continue
+            df = pd.concat(dfs, ignore_index=True)
+            df["Response"] = df["Response"].fillna("")
+            df["Citation Order"] = [
+                order if order is not None else [] for order in df["Citation Order"]
+            ]
+            os.makedirs(os.path.join(output_folder, name), exist_ok=True)
+            df.to_parquet(os.path.join(output_folder, name, RESPONSES_FILENAME))
+        return results
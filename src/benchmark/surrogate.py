@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+
+from data import Benchmark
+from data.lexical import LexicalIndex
+
+from .engine import Engine
+
+
+class SurrogateEngine:
+    """
+    The SurrogateEngine class replaces the LLM of the conversational search engine with a local BM25
+    scorer, to pre-screen C-SEO methods and exercise the evaluation pipeline before paying for real runs.
+
+    Each document of the context is scored against the query of its data point (with the statistics of a
+    `data.LexicalIndex` over the documents of the split), and the synthetic response cites the documents
+    with a positive score from the best to the worst, up to `max_citations`. Ties keep the order of the
+    context. All the (query, document) pairs of a benchmark are scored with one sparse product, so a whole
+    split runs in seconds on CPU. The responses are saved in the same `responses.parquet` schema as the
+    results of `Engine`.
+
+    Usage:
+        surrogate = SurrogateEngine()
+        df = surrogate.run_benchmark(Benchmark(method="Fluency", ...), developer_prompt, "experiments/surrogate/retail/Fluency")
+    """
+
+    def __init__(self, index: LexicalIndex = None, max_citations: int = 5):
+        """
+        Initializes the SurrogateEngine.
+
+        Args:
+            index (LexicalIndex, optional): The index whose statistics are used to weight the documents. Defaults to
+                an index over the original documents of the first benchmark that is run.
+            max_citations (int): Maximum number of citations of each response. Defaults to 5.
+        """
+        self.index = index
+        self.max_citations = max_citations
+        self.engine = Engine()
+
+    def cite(self, dataset: Benchmark) -> list:
+        """
+        Computes the synthetic citation order of every data point.
+
+        Args:
+            dataset (Benchmark): The benchmark (or any iterable of data points with "query" and "list_docs").
+
+        Returns:
+            list: For each data point, the cited positions (0-based) in the context.
+        """
+        self._build_index(dataset)
+        return self._cite(list(dataset))
+
+    def _build_index(self, dataset):
+        if self.index is None:
+            # PermutedBenchmark wraps a Benchmark
+            df = dataset.df if hasattr(dataset, "df") else dataset.benchmark.df
+            self.index = LexicalIndex(df["document"].unique())
+
+    def _cite(self, data_points: list) -> list:
+        documents = [doc for x in data_points for doc in x["list_docs"]]
+        num_docs = np.array([len(x["list_docs"]) for x in data_points], dtype=np.int64)
+        pair_query = np.repeat(np.arange(len(data_points)), num_docs)
+        scores = self.index.score_pairs(
+            self.index.query_matrix([x["query"] for x in data_points]),
+            self.index.weights(documents),
+            pair_query,
+            np.arange(len(documents)),
+        )
+
+        # sort the pairs by query, then by decreasing score (stable, so ties keep the order of the context)
+        offsets = np.concatenate([[0], np.cumsum(num_docs)[:-1]])
+        order = np.lexsort((-scores, pair_query))
+        position = order - offsets[pair_query[order]]
+        list_citations = []
+        for start, n in zip(offsets, num_docs):
+            block = order[start : start + n]
+            cited = position[start : start + n][scores[block] > 0]
+            list_citations.append(cited[: self.max_citations].tolist())
+        return list_citations
+
+    def run_benchmark(
+        self, dataset: Benchmark, developer_prompt: str, output_folder: str = None
+    ):
+        """
+        Runs the surrogate engine on a benchmark.
+
+        Args:
+            dataset (Benchmark): The benchmark.
+            developer_prompt (str): The system-level prompt, only saved in the "Prompt" column.
+            output_folder (str, optional): If given, the responses are saved there as `responses.parquet`.
+
+        Returns:
+            pd.DataFrame: The responses, with the columns of the results of `Engine`.
+        """
+        import pandas as pd
+
+        self._build_index(dataset)
+        data_points = list(dataset)
+        list_citations = self._cite(data_points)
+        list_rows = []
+        list_context_orders = []
+        for x, citations in zip(data_points, list_citations):
+            response = " ".join(f"[{position + 1}]" for position in citations)
+            list_rows.append(
+                [
+                    f"System: {developer_prompt}\n\nUser: {x['user_prompt']}",
+                    response,
+                    x["query"],
+                    x["boosted_indices"],
+                    citations,
+                    citations,
+                ]
+            )
+            list_context_orders.append(x.get("context_order"))
+        df = pd.DataFrame(
+            list_rows,
+            columns=[
+                "Prompt",
+                "Response",
+                "Search Query",
+                "Boost Product Index",
+                "Citation Order",
+                "Citation Order w. Duplicates",
+            ],
+        )
+        if any(order is not None for order in list_context_orders):
+            # the citations are positions in the context: map them back to the original documents
+            df["Context Order"] = list_context_orders
+            df["Citation Positions"] = list_citations
+            df["Citation Order"] = [
+                self.engine.map_citations(citations, order)
+                for citations, order in zip(list_citations, list_context_orders)
+            ]
+            df["Citation Order w. Duplicates"] = df["Citation Order"]
+
+        if output_folder is not None:
+            os.makedirs(output_folder, exist_ok=True)
+            df.to_parquet(os.path.join(output_folder, "responses.parquet"))
+        return df
@@ -1,5 +1,32 @@
-from .benchmark import Benchmark
+from .benchmark import Benchmark, load_split
+from .response_store import ResponseStore
+from .selected_docs_store import SelectedDocsStore
+
+# Imported on first access (see `llms/__init__.py`): they import numpy or scipy
+_LAZY_IMPORTS = {
+    "PermutedBenchmark": ".permuted_benchmark",
+    "LexicalIndex": ".lexical",
+    "SparseRetriever": ".retrieval",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "Benchmark",
+    "load_split",
+    "SelectedDocsStore",
+    "ResponseStore",
+    "PermutedBenchmark",
+    "LexicalIndex",
+    "SparseRetriever",
 ]
@@ -1,10 +1,31 @@
+import copy
 import json
 import random
 
-import requests
-from datasets import load_dataset
-
 from config.adoption_mode import AdoptionMode
+from llms.token_counter import DOCUMENT_SEPARATOR, TokenCounter
+from profiling import profiler
+
+from .selected_docs_store import STORE_EXTENSIONS, SelectedDocsStore
+
+PACKING_POLICIES = ("truncate_each", "truncate_tail", "drop_tail")
+
+
+def load_split(data_path="cseo/cseo-bench", split="retail"):
+    """
+    Loads a split of the dataset as a DataFrame.
+
+    Args:
+        data_path (str): Path or identifier for the dataset. Defaults to "cseo/cseo-bench".
+        split (str): Dataset split to use. Defaults to "retail".
+
+    Returns:
+        pd.DataFrame: The split, with the columns "query_id", "query" and "document".
+    """
+    from datasets import load_dataset
+
+    ds = load_dataset(data_path, split=split)  # , download_mode="force_redownload"
+    return ds.to_pandas()
 
 
 class Benchmark:
@@ -26,6 +47,12 @@ class Benchmark:
         split="retail",
         doc_type="document",
         selected_documents_path=None,
+        df=None,
+        selected_docs=None,
+        retriever=None,
+        token_budget=None,
+        packing_policy="truncate_tail",
+        token_counter=None,
     ):
         """
         Initializes the Benchmark class.
@@ -37,7 +64,28 @@ class Benchmark:
             data_path (str): Path or identifier for the dataset. Defaults to "cseo/cseo-bench".
             split (str): Dataset split to use (e.g., "nq_snippets"). Defaults to "retail".
             doc_type (str): Type of document (e.g., product, game, news article). Used in user prompts.
-            selected_documents_path (str): Path to the selected documents JSON file.
+            selected_documents_path (str): Path to the selected documents JSON file, or to a `SelectedDocsStore`
+                database (.db, .sqlite, .sqlite3). From a database, only the documents of `method` are read.
+            df (pd.DataFrame, optional): The split already loaded as a DataFrame (columns "query_id", "query" and "document").
+                If given, the dataset is not loaded from `data_path`. Defaults to None.
+            selected_docs (dict, optional): The selected documents already loaded, in the `selected_docs.json` format.
+                If given, `selected_documents_path` is not read. Defaults to None.
+            retriever (SparseRetriever, optional): If given, the context of each query is the top `num_docs_in_context`
+                documents of the query ranked by the retriever, with the documents rewritten by the method instead of
+                the original ones. The boosted indices are the original indices of the boosted documents (also when
+                they are not retrieved), and each data point has a "context_order" (the original index of the
+                document at each position). Defaults to None.
+            token_budget (int, optional): Maximum number of tokens of the user prompt (question and documents). If
+                None, the documents are included at full length. Defaults to None.
+            packing_policy (str): How the documents are fit in `token_budget`:
+                - "truncate_each": every document is truncated to an equal share of the budget. If the share does not
+                  fit the header of a document, the last documents are dropped.
+                - "truncate_tail": the documents are added in order; the one that exceeds the budget is truncated
+                  and the next ones are dropped.
+                - "drop_tail": the documents are added in order; from the one that exceeds the budget on, they are dropped.
+                Defaults to "truncate_tail".
+            token_counter (TokenCounter, optional): Counter of the tokens of the documents (cached per document). Use the
+                counter of the model of the run for exact counts. Defaults to the approximation of `TokenCounter`.
         """
         self.num_docs_in_context = num_docs_in_context
         self.data_path = data_path
@@ -45,15 +93,43 @@ class Benchmark:
         self.name = split
         self.method = method
         self.doc_type = doc_type
+        self.retriever = retriever
+        if packing_policy not in PACKING_POLICIES:
+            raise ValueError(
+                f"Unknown packing policy {packing_policy}, use one of {PACKING_POLICIES}."
+            )
+        self.token_budget = token_budget
+        self.packing_policy = packing_policy
+        self.token_counter = (
+            token_counter
+            if token_counter is not None or token_budget is None
+            else TokenCounter()
+        )
+        if retriever is not None and method.startswith("seo_baseline"):
+            raise ValueError(
+                "The seo_baseline methods already move documents and cannot be retrieved."
+            )
         print(f"Loading Benchmark - {split} dataset...")
-        ds = load_dataset(
-            self.data_path, split=split
-        )  # , download_mode="force_redownload"
-        # setting main components of the object
-        self.df = ds.to_pandas()
+        with profiler.timer("benchmark.load_dataset"):
+            if df is None:
+                df = load_split(self.data_path, split)
+            # setting main components of the object
+            self.df = df
+        if retriever is not None and len(retriever.df) != len(self.df):
+            raise ValueError("The retriever must be built with the same split.")
         self.query_ids = self.df["query_id"].unique()
 
-        if selected_documents_path is not None:
+        if selected_docs is not None:
+            # Shared with the caller (e.g., the variants of an adoption sweep), not copied
+            self.selected_docs = selected_docs
+        elif selected_documents_path is not None and selected_documents_path.endswith(
+            STORE_EXTENSIONS
+        ):
+            # Load the original documents and the ones rewritten by the method from the store
+            self.selected_docs = SelectedDocsStore(
+                selected_documents_path
+            ).to_selected_docs(methods=[self.method])
+        elif selected_documents_path is not None:
             # Load selected documents from a JSON file
             with open(selected_documents_path, "r", encoding="utf-8") as f:
                 self.selected_docs = json.load(f)
@@ -67,8 +143,11 @@ class Benchmark:
         if sample_size:
             self.query_ids = self.query_ids[:sample_size]
         self.list_data_points = self.preload_data()
+        profiler.count("benchmark.data_points", len(self.list_data_points))
+        profiler.snapshot(f"benchmark.{self.split}.loaded")
         print(f"{self.split} dataset loaded.")
 
+    @profiler.timed("benchmark.preload_data")
     def preload_data(self):
         """
         Preloads all data points.
@@ -76,11 +155,33 @@ class Benchmark:
         Returns:
             list: List of data points, each as a dictionary with user prompt, query, boosted indices, and documents.
         """
+        self.context_orders = self.retrieve() if self.retriever is not None else None
         list_data_points = []
         for idx in range(len(self)):
             list_data_points.append(self.data_point_docs_in_context(idx))
         return list_data_points
 
+    @profiler.timed("benchmark.retrieve")
+    def retrieve(self):
+        """
+        Ranks the documents of every query with the retriever, replacing the boosted documents by their rewrite.
+
+        Returns:
+            list: For each query, the original indices of the retrieved documents, from the best to the worst.
+        """
+        queries = [
+            self.df["query"].iloc[self.retriever.candidates(query_id)[0]]
+            for query_id in self.query_ids
+        ]
+        rewrites = {}
+        if self.method != "baseline":
+            for idx in range(len(self)):
+                for doc_idx, versions in self.selected_docs[str(idx)].items():
+                    rewrites[(idx, int(doc_idx))] = versions[f"{self.method}(doc)"]
+        return self.retriever.rank(
+            self.query_ids, queries, rewrites, k=self.num_docs_in_context
+        )
+
     def data_point_docs_in_context(self, idx):
         """
         Generates a user query string with search results for a given query index.
@@ -96,30 +197,149 @@ class Benchmark:
                 - list_docs (list): List of document strings in context.
         """
         query_id = self.query_ids[idx]
-        hits = self.df[self.df["query_id"] == query_id][: self.num_docs_in_context]
+        context_order = None
+        if self.retriever is not None:
+            context_order = self.context_orders[idx]
+            candidates = self.retriever.candidates(query_id)
+            hits = self.df.iloc[candidates[context_order]]
+        else:
+            hits = self.df[self.df["query_id"] == query_id][: self.num_docs_in_context]
         query = hits["query"].values[0]
         try:
             search_results, list_docs, boost_list = self.search_results_string(
-                hits, idx
+                hits, idx, context_order
             )
         except Exception as e:
             print(f"Error in index {idx}")
             raise e
+        packing = None
+        if self.token_budget is not None:
+            num_docs = len(list_docs)
+            list_docs, packing = self.pack(query, list_docs)
+            search_results = "".join(
+                f"{self.doc_type} {i+1}:\n{doc}{DOCUMENT_SEPARATOR}"
+                for i, doc in enumerate(list_docs)
+            )
+            if packing["dropped"]:
+                # boosted documents dropped by the budget are out of the context, as in
+                # `with_context_size`; the dropped positions are only kept in the packing metadata
+                order = (
+                    context_order
+                    if context_order is not None
+                    else self._position_order(num_docs, boost_list)
+                )
+                dropped = {int(order[i]) for i in packing["dropped"]}
+                boost_list = [i for i in boost_list if i not in dropped]
+            if context_order is not None:
+                context_order = context_order[: len(list_docs)]
         user_query = f"Question: {query}\n\n" f"Search Results:\n{search_results}"
-        return {
+        data_point = {
             "user_prompt": user_query,
             "query": query,
             "boosted_indices": boost_list,
             "list_docs": list_docs,
         }
+        if context_order is not None:
+            data_point["context_order"] = context_order
+        if packing is not None:
+            data_point["packing"] = packing
+        return data_point
+
+    def _position_order(self, num_docs, boost_list):
+        # original index of the document at each position of a context that was not retrieved
+        order = list(range(num_docs))
+        if self.method.startswith("seo_baseline-") and boost_list:
+            order.insert(int(self.method.split("-")[1]) - 1, order.pop(boost_list[0]))
+        elif self.method == "seo_baseline_game_theory":
+            order = sorted(boost_list) + [i for i in order if i not in boost_list]
+        return order
 
-    def search_results_string(self, tag_hits, idx):
+    def pack(self, query, list_docs):
+        """
+        Fits the documents of a context in the token budget with the packing policy.
+
+        Args:
+            query (str): The query string.
+            list_docs (list): The documents of the context, in order.
+
+        Returns:
+            tuple:
+                - list_docs (list): The documents that fit, truncated if needed.
+                - packing (dict): "budget", "policy", "tokens" (of the packed user prompt), "original_tokens",
+                  "truncated" and "dropped" (positions of the documents that were truncated or dropped).
+        """
+        counter = self.token_counter
+        # the question, the headers of the documents and the separators are never cut
+        fixed = counter.count_document(f"Question: {query}\n\nSearch Results:\n")
+        separator = counter.count_document(DOCUMENT_SEPARATOR)
+        headers = [
+            counter.count_document(f"{self.doc_type} {i+1}:\n") + separator
+            for i in range(len(list_docs))
+        ]
+        doc_tokens = [counter.count_document(doc) for doc in list_docs]
+        original_tokens = fixed + sum(headers) + sum(doc_tokens)
+        available = self.token_budget - fixed
+
+        packed_docs = []
+        truncated = []
+        dropped = []
+        if self.packing_policy == "truncate_each":
+            # the last documents are dropped until the share of each one fits its header and some text
+            num_kept = len(list_docs)
+            while num_kept > 0 and available // num_kept <= max(headers[:num_kept]):
+                num_kept -= 1
+            if num_kept == 0 and list_docs:
+                raise ValueError(
+                    f"The token budget ({self.token_budget}) is too small for the question and one document."
+                )
+            share = available // max(num_kept, 1)
+            for i, doc in enumerate(list_docs):
+                if i >= num_kept:
+                    dropped.append(i)
+                    continue
+                if doc_tokens[i] + headers[i] > share:
+                    doc = counter.truncate(doc, share - headers[i])
+                    truncated.append(i)
+                packed_docs.append(doc)
+        else:
+            for i, doc in enumerate(list_docs):
+                if available >= headers[i] + doc_tokens[i] and not dropped:
+                    packed_docs.append(doc)
+                    available -= headers[i] + doc_tokens[i]
+                elif (
+                    self.packing_policy == "truncate_tail"
+                    and not dropped
+                    and available > headers[i]
+                ):
+                    packed_docs.append(counter.truncate(doc, available - headers[i]))
+                    truncated.append(i)
+                    available = 0
+                else:
+                    dropped.append(i)
+
+        tokens = (
+            fixed
+            + sum(headers[: len(packed_docs)])
+            + sum(counter.count_document(doc) for doc in packed_docs)
+        )
+        return packed_docs, {
+            "budget": self.token_budget,
+            "policy": self.packing_policy,
+            "tokens": tokens,
+            "original_tokens": original_tokens,
+            "truncated": truncated,
+            "dropped": dropped,
+        }
+
+    def search_results_string(self, tag_hits, idx, context_order=None):
         """
         Generates a formatted string of search results and identifies boosted indices.
 
         Args:
             tag_hits (pd.DataFrame): DataFrame rows for the current query.
             idx (int): Index of the query.
+            context_order (list, optional): Original index of each document of `tag_hits` (retrieved contexts).
+                Defaults to the position of the document.
 
         Returns:
             tuple:
@@ -142,8 +362,11 @@ class Benchmark:
             search_results = ""
             list_docs = []
             for i, (_, hit) in enumerate(tag_hits.iterrows()):
-                if i in boost_set and self.method != "baseline":
-                    doc = self.selected_docs[str(idx)][str(i)][f"{self.method}(doc)"]
+                doc_idx = context_order[i] if context_order is not None else i
+                if doc_idx in boost_set and self.method != "baseline":
+                    doc = self.selected_docs[str(idx)][str(doc_idx)][
+                        f"{self.method}(doc)"
+                    ]
                 else:
                     doc = hit["document"]
                 search_results += (
@@ -227,6 +450,73 @@ class Benchmark:
 
         return search_results, list_docs, sorted(list(boost_set))
 
+    def with_context_size(self, num_docs_in_context):
+        """
+        Returns a copy of the benchmark with fewer documents in the context, derived from the data points
+        already loaded instead of reloading the split and rendering the prompts again.
+
+        The context of each query is the prefix with the first `num_docs_in_context` documents of the current
+        one, and boosted documents outside of it are removed from the boosted indices (the data point is then
+        equivalent to the baseline), except for retrieved contexts (see `retriever`). The `seo_baseline` methods, which move documents, are rendered again
+        with the boosted documents inside the new context.
+
+        Args:
+            num_docs_in_context (int): Number of documents in the context. It must not be larger than the current one.
+
+        Returns:
+            Benchmark: The benchmark with the smaller context.
+        """
+        if num_docs_in_context > self.num_docs_in_context:
+            raise ValueError(
+                f"The context can only be reduced ({num_docs_in_context} > {self.num_docs_in_context})."
+            )
+        derived = copy.copy(self)
+        derived.num_docs_in_context = num_docs_in_context
+        if self.token_budget is not None and not self.method.startswith("seo_baseline"):
+            # the budget is shared by fewer documents, so the contexts are packed again
+            derived.list_data_points = derived.preload_data()
+            return derived
+        if self.method.startswith("seo_baseline"):
+            derived.selected_docs = {
+                query_idx: {
+                    doc_idx: versions
+                    for doc_idx, versions in docs.items()
+                    if int(doc_idx) < num_docs_in_context
+                }
+                for query_idx, docs in self.selected_docs.items()
+            }
+            derived.list_data_points = derived.preload_data()
+            return derived
+
+        derived.list_data_points = []
+        for x in self.list_data_points:
+            list_docs = x["list_docs"][:num_docs_in_context]
+            # the user prompt is the header followed by one block per document
+            prompt_length = len(f"Question: {x['query']}\n\nSearch Results:\n")
+            for i, doc in enumerate(list_docs):
+                prompt_length += len(
+                    f"{self.doc_type} {i+1}:\n{doc}\n\n##########################\n\n"
+                )
+            data_point = {
+                "user_prompt": x["user_prompt"][:prompt_length],
+                "query": x["query"],
+                "boosted_indices": [
+                    i for i in x["boosted_indices"] if i < num_docs_in_context
+                ],
+                "list_docs": list_docs,
+            }
+            if "context_order" in x:
+                # retrieved contexts: the prefix is the top of the ranking, and the boosted indices are
+                # original indices, kept also when the document is not retrieved
+                data_point["context_order"] = x["context_order"][:num_docs_in_context]
+                data_point["boosted_indices"] = x["boosted_indices"]
+            derived.list_data_points.append(data_point)
+        if self.context_orders is not None:
+            derived.context_orders = [
+                order[:num_docs_in_context] for order in self.context_orders
+            ]
+        return derived
+
     def __len__(self):
         """
         Returns the number of unique queries in the benchmark.
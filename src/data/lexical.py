@@ -0,0 +1,150 @@
+import re
+
+import numpy as np
+from scipy import sparse
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits a text into lowercase word tokens.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The tokens.
+    """
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class LexicalIndex:
+    """
+    Sparse BM25 index over a collection of documents (e.g., all the documents of a split).
+
+    The collection fixes the vocabulary and the statistics of BM25 (document frequencies and average
+    length). Any text (e.g., a document rewritten by a C-SEO method) can then be weighted with those
+    statistics with `weights`, so original and rewritten documents are scored on the same scale. The term
+    counts are stored as a CSR matrix (documents x terms), and the scores of many (query, document) pairs
+    are computed together with `score_pairs`.
+
+    Usage:
+        index = LexicalIndex(df["document"].unique())
+        scores = index.score_pairs(index.query_matrix(queries), index.weights(documents), pair_query, pair_doc)
+    """
+
+    def __init__(self, documents, k1: float = 1.5, b: float = 0.75):
+        """
+        Builds the index.
+
+        Args:
+            documents (iterable): Texts of the collection.
+            k1 (float): BM25 saturation of the term frequencies. Defaults to 1.5.
+            b (float): BM25 normalization by the length of the document. Defaults to 0.75.
+        """
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        counts = self._count(documents, grow=True)
+        self.counts = counts
+        self.num_documents = counts.shape[0]
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        self.avg_length = float(lengths.mean()) if self.num_documents > 0 else 0.0
+        document_frequency = np.bincount(counts.indices, minlength=len(self.vocabulary))
+        self.idf = np.log(
+            1
+            + (self.num_documents - document_frequency + 0.5)
+            / (document_frequency + 0.5)
+        )
+
+    def _count(self, texts, grow: bool = False) -> sparse.csr_matrix:
+        # term counts (texts x terms); unknown terms are added to the vocabulary only if `grow`
+        indptr = [0]
+        indices = []
+        vocabulary = self.vocabulary
+        for text in texts:
+            tokens = tokenize(text)
+            if grow:
+                # setdefault evaluates len(vocabulary) before adding a new term
+                indices.extend(
+                    [vocabulary.setdefault(t, len(vocabulary)) for t in tokens]
+                )
+            else:
+                indices.extend([vocabulary[t] for t in tokens if t in vocabulary])
+            indptr.append(len(indices))
+        counts = sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int64), indptr),
+            shape=(len(indptr) - 1, len(self.vocabulary)),
+        )
+        # duplicated terms of a text are summed into its term frequency
+        counts.sum_duplicates()
+        return counts
+
+    def weights(self, texts) -> sparse.csr_matrix:
+        """
+        Computes the BM25 weight of every term of each text with the statistics of the collection.
+
+        Args:
+            texts (iterable): The texts (documents of the collection or new ones).
+
+        Returns:
+            sparse.csr_matrix: Shape (texts, terms).
+        """
+        return self._bm25(self._count(texts))
+
+    def collection_weights(self) -> sparse.csr_matrix:
+        """
+        Computes the BM25 weights of the documents of the collection, without tokenizing them again.
+
+        Returns:
+            sparse.csr_matrix: Shape (documents, terms).
+        """
+        return self._bm25(self.counts.copy())
+
+    def _bm25(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        # the length normalization of each stored value, repeated from the length of its row
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(self.avg_length, 1e-9))
+        norm = np.repeat(norm, np.diff(counts.indptr))
+        tf = counts.data
+        counts.data = self.idf[counts.indices] * tf * (self.k1 + 1) / (tf + norm)
+        return counts
+
+    def query_matrix(self, queries) -> sparse.csr_matrix:
+        """
+        Computes the binary term matrix of the queries (repeated terms count once).
+
+        Args:
+            queries (iterable): The query texts.
+
+        Returns:
+            sparse.csr_matrix: Shape (queries, terms).
+        """
+        matrix = self._count(queries)
+        matrix.data = np.ones_like(matrix.data)
+        return matrix
+
+    def score_pairs(
+        self,
+        query_matrix: sparse.csr_matrix,
+        document_weights: sparse.csr_matrix,
+        pair_query: np.ndarray,
+        pair_document: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Scores (query, document) pairs with a single element-wise product of two sparse matrices.
+
+        Args:
+            query_matrix (sparse.csr_matrix): Output of `query_matrix`.
+            document_weights (sparse.csr_matrix): Output of `weights`.
+            pair_query (np.ndarray): Row of `query_matrix` of each pair.
+            pair_document (np.ndarray): Row of `document_weights` of each pair.
+
+        Returns:
+            np.ndarray: The BM25 score of each pair.
+        """
+        if len(pair_query) == 0:
+            return np.zeros(0)
+        product = query_matrix[pair_query].multiply(document_weights[pair_document])
+        return np.asarray(product.sum(axis=1)).ravel()
@@ -0,0 +1,138 @@
+import numpy as np
+
+from .benchmark import Benchmark
+
+# Separator between documents in the user prompt (same as Benchmark)
+_SEPARATOR = "\n\n##########################\n\n"
+
+
+class PermutedBenchmark:
+    """
+    Benchmark where the documents of each query are shown in K seeded random orders, to estimate the
+    effect of C-SEO methods independently of the position of the documents in the context.
+
+    The orders are stored as a small integer array of shape (queries, K, documents) against the documents
+    of the wrapped `Benchmark`, and the prompts are rendered when a data point is accessed, instead of
+    storing K full prompts per query. Each data point has a "context_order" key (the original index of
+    the document at each position), which `Engine` saves in the "Context Order" column and uses to map the
+    citations back to the original document indices.
+
+    The data points are ordered by query and then by permutation: data point `i` is permutation
+    `i % K` of query `i // K`.
+    """
+
+    def __init__(
+        self,
+        benchmark: Benchmark,
+        num_permutations: int = 10,
+        seed: int = 42,
+        include_identity: bool = True,
+    ):
+        """
+        Initializes the PermutedBenchmark and draws the permutations of every query.
+
+        Args:
+            benchmark (Benchmark): The benchmark to permute. Methods that move documents (`seo_baseline`) are not supported.
+            num_permutations (int): Number of orders per query (K). Defaults to 10.
+            seed (int): Seed of the RNG that draws the permutations. Defaults to 42.
+            include_identity (bool): Whether the first order of each query is the original one. Defaults to True.
+        """
+        if benchmark.method.startswith("seo_baseline"):
+            raise ValueError(
+                "The seo_baseline methods already move documents and cannot be permuted."
+            )
+        self.benchmark = benchmark
+        self.num_permutations = num_permutations
+        self.seed = seed
+        self.name = benchmark.name
+        self.split = benchmark.split
+        self.method = benchmark.method
+        self.doc_type = benchmark.doc_type
+
+        # one pass of the RNG for all the queries: the order of each query is the argsort of random keys,
+        # with the padding (queries with fewer documents) sorted last
+        num_docs = np.array([len(x["list_docs"]) for x in benchmark])
+        max_docs = int(num_docs.max()) if len(num_docs) > 0 else 0
+        rng = np.random.default_rng(seed)
+        keys = rng.random((len(benchmark), num_permutations, max_docs))
+        padding = np.broadcast_to(
+            np.arange(max_docs)[None, None, :] >= num_docs[:, None, None], keys.shape
+        )
+        if include_identity:
+            keys[:, 0, :] = np.arange(max_docs)
+        keys[padding] = np.inf
+        permutations = np.argsort(keys, axis=-1, kind="stable").astype(np.int16)
+        permutations[padding] = -1
+        self.permutations = permutations
+        self.num_docs = num_docs
+
+    def context_order(self, idx):
+        """
+        Returns the order of the documents of a data point.
+
+        Args:
+            idx (int): Index of the data point.
+
+        Returns:
+            list: The original index of the document at each position.
+        """
+        query_idx, permutation_idx = divmod(idx, self.num_permutations)
+        order = self.permutations[query_idx, permutation_idx]
+        return order[: self.num_docs[query_idx]].tolist()
+
+    def __len__(self):
+        """
+        Returns the number of data points (queries times permutations).
+
+        Returns:
+            int: Number of data points.
+        """
+        return len(self.benchmark) * self.num_permutations
+
+    def __getitem__(self, idx):
+        """
+        Renders a data point.
+
+        Args:
+            idx (int): Index of the data point.
+
+        Returns:
+            dict: Data point dictionary with the keys of `Benchmark` and "context_order". The boosted indices
+                are the original indices of the boosted documents.
+        """
+        x = self.benchmark[idx // self.num_permutations]
+        order = self.context_order(idx)
+        list_docs = [x["list_docs"][i] for i in order]
+        if "context_order" in x:
+            # retrieved contexts: map the positions to the original indices of the documents
+            order = [x["context_order"][i] for i in order]
+        search_results = "".join(
+            f"{self.doc_type} {position+1}:\n{doc}{_SEPARATOR}"
+            for position, doc in enumerate(list_docs)
+        )
+        return {
+            "user_prompt": f"Question: {x['query']}\n\nSearch Results:\n{search_results}",
+            "query": x["query"],
+            "boosted_indices": x["boosted_indices"],
+            "list_docs": list_docs,
+            "context_order": order,
+        }
+
+    def __iter__(self):
+        """
+        Iterates over all the data points, rendering them one at a time.
+
+        Yields:
+            dict: Data point dictionary.
+        """
+        for idx in range(len(self)):
+            yield self.__getitem__(idx)
+
+    def get_name(self):
+        """
+        Returns the name of the benchmark (usually the split name).
+
+        Returns:
+            str: Name of the benchmark.
+        """
+        return self.name
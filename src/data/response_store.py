@@ -0,0 +1,109 @@
+import contextlib
+import sqlite3
+
+
+class ResponseStore:
+    """
+    Indexed store (SQLite) for the responses of the conversational search engine, keyed by model,
+    split, query and the version of each document in the context (a "profile", e.g. "doc,Fluency,doc",
+    followed by a hash of the rendered request so that different prompts or contexts never share a key).
+
+    It memoizes responses across runs, so a context that was already evaluated (e.g., by a previous round
+    of `benchmark.BestResponseGame`) is never sent to the LLM again. Several processes can write to the
+    same store at the same time.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        """
+        Initializes the store, creating the database if it does not exist.
+
+        Args:
+            path (str): Path of the SQLite database (e.g., `experiments/responses.db`).
+            timeout (float): Seconds to wait for other writers to release the database. Defaults to 60.
+        """
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as conn:
+            # WAL allows readers to run while another process is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "model TEXT NOT NULL, "
+                "split TEXT NOT NULL, "
+                "query_idx INTEGER NOT NULL, "
+                "profile TEXT NOT NULL, "
+                "response TEXT NOT NULL, "
+                "PRIMARY KEY (model, split, query_idx, profile)"
+                ") WITHOUT ROWID"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def write(self, model: str, split: str, rows):
+        """
+        Writes responses in a single transaction. Existing responses with the same key are replaced.
+
+        Args:
+            model (str): Name of the LLM.
+            split (str): Name of the split.
+            rows (iterable): Tuples (query_idx, profile, response).
+        """
+        rows = [
+            (model, split, int(query_idx), profile, response)
+            for query_idx, profile, response in rows
+        ]
+        with self._connect() as conn:
+            # take the write lock at the beginning so concurrent writers wait instead of failing
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses (model, split, query_idx, profile, response) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def read(self, model: str, split: str, keys) -> dict:
+        """
+        Reads the responses of several (query_idx, profile) keys.
+
+        Args:
+            model (str): Name of the LLM.
+            split (str): Name of the split.
+            keys (iterable): Tuples (query_idx, profile).
+
+        Returns:
+            dict: {(query_idx, profile): response} for the keys in the store.
+        """
+        keys = set((int(query_idx), profile) for query_idx, profile in keys)
+        responses = {}
+        with self._connect() as conn:
+            for query_idx in sorted(set(query_idx for query_idx, _ in keys)):
+                cursor = conn.execute(
+                    "SELECT profile, response FROM responses "
+                    "WHERE model = ? AND split = ? AND query_idx = ?",
+                    (model, split, query_idx),
+                )
+                for profile, response in cursor:
+                    if (query_idx, profile) in keys:
+                        responses[(query_idx, profile)] = response
+        return responses
+
+    def __len__(self):
+        """
+        Returns the number of responses in the store.
+
+        Returns:
+            int: Number of responses.
+        """
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
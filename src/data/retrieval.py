@@ -0,0 +1,108 @@
+import numpy as np
+from scipy import sparse
+
+from .lexical import LexicalIndex
+
+
+class SparseRetriever:
+    """
+    Retrieval stage of a conversational search engine: it ranks all the documents of each query with BM25
+    and the context is the top of the ranking, instead of the first documents of the split.
+
+    The BM25 weights of all the documents of the split are precomputed once as a sparse matrix (one row
+    per row of the split). The documents rewritten by a C-SEO method replace the original ones in the
+    ranking of their query, weighted with the same statistics, so a rewrite that changes the retrieval rank
+    of a document changes the context. All the (query, candidate) pairs of a benchmark are scored together
+    with one sparse product.
+
+    Usage:
+        retriever = SparseRetriever(df)
+        benchmark = Benchmark(method="Fluency", df=df, retriever=retriever, ...)
+    """
+
+    def __init__(self, df, k1: float = 1.5, b: float = 0.75, num_candidates=None):
+        """
+        Builds the index over the documents of a split.
+
+        Args:
+            df (pd.DataFrame): The split (columns "query_id", "query" and "document"). Benchmarks that use the
+                retriever must be built with the same DataFrame.
+            k1 (float): BM25 saturation of the term frequencies. Defaults to 1.5.
+            b (float): BM25 normalization by the length of the document. Defaults to 0.75.
+            num_candidates (int, optional): Number of first documents of each query that are ranked. Defaults to all.
+        """
+        self.df = df
+        self.num_candidates = num_candidates
+        self.index = LexicalIndex(df["document"], k1=k1, b=b)
+        self.document_weights = self.index.collection_weights()
+        # row positions of the documents of each query, in the order of the split
+        self.query_rows = {
+            query_id: rows[:num_candidates]
+            for query_id, rows in df.groupby("query_id", sort=False).indices.items()
+        }
+
+    def candidates(self, query_id) -> np.ndarray:
+        """
+        Returns the rows of the split of the candidate documents of a query.
+
+        Args:
+            query_id: Identifier of the query.
+
+        Returns:
+            np.ndarray: Row positions in the split, in the original order of the documents.
+        """
+        return self.query_rows[query_id]
+
+    def rank(self, query_ids, queries, rewrites: dict = None, k: int = 10) -> list:
+        """
+        Ranks the candidates of several queries and keeps the top k of each one.
+
+        Args:
+            query_ids (list): Identifiers of the queries.
+            queries (list): Text of each query.
+            rewrites (dict, optional): {(query position in `query_ids`, document index): text} of the documents
+                rewritten by a method. The document index is the position of the document among the candidates.
+            k (int): Number of documents to keep per query. Defaults to 10.
+
+        Returns:
+            list: For each query, the indices of the retrieved documents (positions among the candidates),
+                from the best to the worst score. Ties keep the original order.
+        """
+        rewrites = rewrites or {}
+        list_rows = [self.candidates(query_id) for query_id in query_ids]
+        num_candidates = np.array([len(rows) for rows in list_rows], dtype=np.int64)
+        pair_query = np.repeat(np.arange(len(query_ids)), num_candidates)
+        offsets = np.concatenate([[0], np.cumsum(num_candidates)[:-1]]).astype(np.int64)
+        pair_document = (
+            np.concatenate(list_rows).astype(np.int64)
+            if len(list_rows) > 0
+            else np.zeros(0, dtype=np.int64)
+        )
+
+        # the rewritten documents are weighted together and appended after the rows of the split
+        rewrite_keys = [
+            (query_pos, doc_idx)
+            for query_pos, doc_idx in rewrites
+            if doc_idx < num_candidates[query_pos]
+        ]
+        weights = self.document_weights
+        if rewrite_keys:
+            weights = sparse.vstack(
+                [weights, self.index.weights([rewrites[key] for key in rewrite_keys])],
+                format="csr",
+            )
+            pairs = np.array(
+                [offsets[query_pos] + doc_idx for query_pos, doc_idx in rewrite_keys]
+            )
+            pair_document[pairs] = len(self.df) + np.arange(len(rewrite_keys))
+
+        scores = self.index.score_pairs(
+            self.index.query_matrix(queries), weights, pair_query, pair_document
+        )
+        # by query, then by decreasing score; lexsort is stable, so ties keep the original order
+        order = np.lexsort((-scores, pair_query))
+        position = order - offsets[pair_query[order]]
+        return [
+            position[start : start + min(n, k)].tolist()
+            for start, n in zip(offsets, num_candidates)
+        ]
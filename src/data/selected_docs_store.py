@@ -0,0 +1,211 @@
+import contextlib
+import json
+import sqlite3
+
+ORIGINAL = "doc"
+
+STORE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+class SelectedDocsStore:
+    """
+    Indexed store (SQLite) for the selected documents and their versions rewritten with C-SEO methods.
+
+    It replaces `selected_docs.json`: each document is stored once per method, keyed by
+    (method, query_idx, doc_idx), so the rewrites of one method can be appended without touching the
+    other methods, and `Benchmark` only reads the methods it needs. Several processes can write to the
+    same store at the same time (e.g., one per C-SEO method).
+
+    The original documents are stored with the method name "doc" and define the selection: rewrites of
+    documents without an original (e.g., the adopters of an `AdoptionSweep`) are only a cache. The store
+    can be converted from and to the JSON format `{data_point_index: {document_index: {'doc': ..., f"{method}(doc)": ...}}}`.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        """
+        Initializes the store, creating the database if it does not exist.
+
+        Args:
+            path (str): Path of the SQLite database (e.g., `data/{split}/selected_docs.db`).
+            timeout (float): Seconds to wait for other writers to release the database. Defaults to 60.
+        """
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as conn:
+            # WAL allows readers to run while another process is writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "method TEXT NOT NULL, "
+                "query_idx INTEGER NOT NULL, "
+                "doc_idx INTEGER NOT NULL, "
+                "text TEXT NOT NULL, "
+                "PRIMARY KEY (method, query_idx, doc_idx)"
+                ") WITHOUT ROWID"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def write(self, method: str, rows):
+        """
+        Writes the documents of one method in a single transaction. Existing documents of the same
+        method, query and document index are replaced; other methods are not touched.
+
+        Args:
+            method (str): Name of the method (e.g., "Statistics"), or "doc" for the original documents.
+            rows (iterable): Tuples (query_idx, doc_idx, text).
+        """
+        rows = [
+            (method, int(query_idx), int(doc_idx), text)
+            for query_idx, doc_idx, text in rows
+        ]
+        with self._connect() as conn:
+            # take the write lock at the beginning so concurrent writers wait instead of failing
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO documents (method, query_idx, doc_idx, text) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def read(self, method: str = ORIGINAL) -> dict:
+        """
+        Reads the documents of one method.
+
+        Args:
+            method (str): Name of the method. Defaults to "doc" (the original documents).
+
+        Returns:
+            dict: {query_idx: {doc_idx: text}} with integer keys.
+        """
+        documents = {}
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT query_idx, doc_idx, text FROM documents WHERE method = ? "
+                "ORDER BY query_idx, doc_idx",
+                (method,),
+            )
+            for query_idx, doc_idx, text in cursor:
+                documents.setdefault(query_idx, {})[doc_idx] = text
+        return documents
+
+    def get(self, query_idx: int, doc_idx: int, method: str = ORIGINAL) -> str:
+        """
+        Reads a single document.
+
+        Args:
+            query_idx (int): Index of the query.
+            doc_idx (int): Index of the document in the query.
+            method (str): Name of the method. Defaults to "doc" (the original document).
+
+        Returns:
+            str: The document, or None if it is not in the store.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT text FROM documents WHERE method = ? AND query_idx = ? AND doc_idx = ?",
+                (method, int(query_idx), int(doc_idx)),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def methods(self) -> list:
+        """
+        Returns the methods in the store.
+
+        Returns:
+            list: Names of the methods, including "doc" for the original documents.
+        """
+        with self._connect() as conn:
+            return [
+                row[0] for row in conn.execute("SELECT DISTINCT method FROM documents")
+            ]
+
+    def to_selected_docs(self, methods=None) -> dict:
+        """
+        Converts the store to the `selected_docs.json` format. Only the selected documents (the ones with
+        an original document) are included; the other rewrites are kept in the store but are not selected.
+
+        Args:
+            methods (list, optional): Methods to include. The original documents ("doc") are always included.
+                If None, all the methods are included.
+
+        Returns:
+            dict: {str(query_idx): {str(doc_idx): {'doc': ..., f"{method}(doc)": ...}}}
+        """
+        if methods is None:
+            methods = self.methods()
+        selected_docs = {
+            str(query_idx): {
+                str(doc_idx): {ORIGINAL: text} for doc_idx, text in docs.items()
+            }
+            for query_idx, docs in self.read(ORIGINAL).items()
+        }
+        for method in [m for m in methods if m != ORIGINAL]:
+            key = f"{method}({ORIGINAL})"
+            for query_idx, docs in self.read(method).items():
+                for doc_idx, text in docs.items():
+                    versions = selected_docs.get(str(query_idx), {}).get(str(doc_idx))
+                    if versions is not None:
+                        versions[key] = text
+        return selected_docs
+
+    def import_selected_docs(self, selected_docs: dict):
+        """
+        Writes documents in the `selected_docs.json` format into the store.
+
+        Args:
+            selected_docs (dict): {data_point_index: {document_index: {'doc': ..., f"{method}(doc)": ...}}}.
+                Keys that are neither the original document nor a rewrite are skipped.
+        """
+        suffix = f"({ORIGINAL})"
+        rows_by_method = {}
+        skipped_keys = set()
+        for query_idx, docs in selected_docs.items():
+            for doc_idx, versions in docs.items():
+                for key, text in versions.items():
+                    if key == ORIGINAL:
+                        method = ORIGINAL
+                    elif key.endswith(suffix) and len(key) > len(suffix):
+                        method = key[: -len(suffix)]
+                    else:
+                        skipped_keys.add(key)
+                        continue
+                    rows_by_method.setdefault(method, []).append(
+                        (query_idx, doc_idx, text)
+                    )
+        if skipped_keys:
+            print(f"Skipped keys that are not documents: {sorted(skipped_keys)}")
+        for method, rows in rows_by_method.items():
+            self.write(method, rows)
+
+    def import_json(self, json_path: str):
+        """
+        Imports a `selected_docs.json` file into the store.
+
+        Args:
+            json_path (str): Path of the JSON file.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            self.import_selected_docs(json.load(f))
+
+    def export_json(self, json_path: str, methods=None):
+        """
+        Exports the store as a `selected_docs.json` file.
+
+        Args:
+            json_path (str): Path of the JSON file.
+            methods (list, optional): Methods to export. If None, all the methods are exported.
+        """
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_selected_docs(methods), f)
@@ -0,0 +1,47 @@
+from .sequential import MixtureSPRT
+from .statistics import (
+    calculate_rank_differences,
+    calculate_significant_improvements,
+    calculate_seo_baseline_improvements,
+    bonferroni_holm_correction,
+)
+
+# Imported on first access (see `llms/__init__.py`): they import pandas
+_LAZY_IMPORTS = {
+    "flatten_citation_events": ".position_bias",
+    "load_citation_events": ".position_bias",
+    "fit_position_bias": ".position_bias",
+    "bootstrap_ratio": ".bootstrap",
+    "bootstrap_comparisons": ".bootstrap",
+    "bootstrap_adoption_curve": ".bootstrap",
+    "build_sentence_index": ".visibility",
+    "visibility_metrics": ".visibility",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "calculate_rank_differences",
+    "calculate_significant_improvements",
+    "calculate_seo_baseline_improvements",
+    "bonferroni_holm_correction",
+    "MixtureSPRT",
+    "flatten_citation_events",
+    "load_citation_events",
+    "fit_position_bias",
+    "bootstrap_ratio",
+    "bootstrap_comparisons",
+    "bootstrap_adoption_curve",
+    "build_sentence_index",
+    "visibility_metrics",
+]
@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .position_bias import _to_list
+from .statistics import calculate_rank_differences
+
+METRICS = ["Delta Rank", "Top-k Method", "Top-k Baseline", "Top-k Delta"]
+
+
+def query_statistics(
+    df_baseline: pd.DataFrame, df_method: pd.DataFrame, k: int = 3, max_citations=5
+) -> tuple:
+    """
+    Computes the sums of each metric per query (row), which are the units resampled by the bootstrap.
+
+    Args:
+        df_baseline (pd.DataFrame): Results of the baseline, with the "Citation Order" column.
+        df_method (pd.DataFrame): Results of the method, with the "Citation Order" and "Boost Product Index" columns.
+        k (int): Number of first citations for the top-k inclusion. Defaults to 3.
+        max_citations (int): Citations after this rank are ignored. Defaults to 5.
+
+    Returns:
+        tuple:
+            - sums (np.ndarray): Shape (queries, len(METRICS)). Sum over the boosted documents of each query of
+                the rank difference and of the top-k inclusion in the method, the baseline and their difference.
+            - counts (np.ndarray): Shape (queries,). Number of boosted documents of each query.
+    """
+    differences = calculate_rank_differences(
+        df_baseline, df_method, max_citations, by_query=True
+    )
+    n = len(differences)
+    sums = np.zeros((n, len(METRICS)))
+    counts = np.array([len(d) for d in differences], dtype=float)
+    sums[:, 0] = [sum(d) for d in differences]
+    for i, (baseline_order, method_order, boosted) in enumerate(
+        zip(
+            df_baseline["Citation Order"].iloc[:n],
+            df_method["Citation Order"].iloc[:n],
+            df_method["Boost Product Index"].iloc[:n],
+        )
+    ):
+        top_method = set(_to_list(method_order)[: min(k, max_citations)])
+        top_baseline = set(_to_list(baseline_order)[: min(k, max_citations)])
+        boosted = _to_list(boosted)
+        sums[i, 1] = sum(item in top_method for item in boosted)
+        sums[i, 2] = sum(item in top_baseline for item in boosted)
+    sums[:, 3] = sums[:, 1] - sums[:, 2]
+    return sums, counts
+
+
+def bootstrap_ratio(
+    numerators: np.ndarray,
+    denominators: np.ndarray,
+    num_resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 42,
+    max_memory_mb: int = 256,
+) -> dict:
+    """
+    Bootstrap of ratios of sums over queries (e.g., the mean rank difference over all the boosted
+    documents), resampling the queries with replacement.
+
+    Each chunk of resamples draws one index matrix of shape (resamples, queries), turns it into a matrix
+    of counts with a single `np.bincount`, and computes the statistics of all the resamples and columns
+    with two matrix products. The chunks bound the memory to about `max_memory_mb`.
+
+    Args:
+        numerators (np.ndarray): Shape (queries,) or (queries, columns). Sum of each statistic per query.
+        denominators (np.ndarray): Shape (queries,) or (queries, columns). Number of units per query.
+        num_resamples (int): Number of bootstrap resamples. Defaults to 2000.
+        confidence (float): Level of the percentile intervals. Defaults to 0.95.
+        seed (int): Seed of the resampling. The same seed and number of queries give the same resamples,
+            so the intervals of several comparisons are paired. Defaults to 42.
+        max_memory_mb (int): Approximate memory of each chunk in MB. Defaults to 256.
+
+    Returns:
+        dict: "estimate", "se", "ci_low" and "ci_high", each with one value per column.
+    """
+    numerators = np.asarray(numerators, dtype=float)
+    denominators = np.asarray(denominators, dtype=float)
+    squeeze = numerators.ndim == 1
+    if squeeze:
+        numerators = numerators[:, None]
+    if denominators.ndim == 1:
+        denominators = denominators[:, None]
+    num_queries = len(numerators)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimate = numerators.sum(axis=0) / denominators.sum(axis=0)
+    if num_queries == 0:
+        nan = np.full(numerators.shape[1], np.nan)
+        result = {"estimate": nan, "se": nan, "ci_low": nan, "ci_high": nan}
+    else:
+        # the index matrix (int64) and the count matrix (float64) dominate the memory of a chunk
+        chunk_size = max(1, int(max_memory_mb * 2**20 // (16 * num_queries)))
+        rng = np.random.default_rng(seed)
+        statistics = np.empty((num_resamples, numerators.shape[1]))
+        for start in range(0, num_resamples, chunk_size):
+            size = min(chunk_size, num_resamples - start)
+            idx = rng.integers(0, num_queries, size=(size, num_queries))
+            # row r of the counts is the number of times each query is drawn in resample r
+            offsets = np.arange(size)[:, None] * num_queries
+            counts = np.bincount(
+                (idx + offsets).ravel(), minlength=size * num_queries
+            ).reshape(size, num_queries)
+            counts = counts.astype(float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                statistics[start : start + size] = (counts @ numerators) / (
+                    counts @ denominators
+                )
+        alpha = (1 - confidence) / 2
+        result = {
+            "estimate": estimate,
+            "se": np.nanstd(statistics, axis=0, ddof=1),
+            "ci_low": np.nanquantile(statistics, alpha, axis=0),
+            "ci_high": np.nanquantile(statistics, 1 - alpha, axis=0),
+        }
+    if squeeze:
+        result = {key: float(value[0]) for key, value in result.items()}
+    return result
+
+
+def bootstrap_comparisons(
+    comparisons: dict,
+    k: int = 3,
+    max_citations: int = 5,
+    num_resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 42,
+    max_workers: int = 8,
+) -> pd.DataFrame:
+    """
+    Bootstrap confidence intervals of the mean rank difference and the top-k inclusion rates of several
+    comparisons. Comparisons with the same number of queries (e.g., the methods of a split) share the
+    resamples, so they are stacked as columns of a single `bootstrap_ratio`, and the groups of different
+    sizes are computed in parallel (the matrix products release the GIL).
+
+    Args:
+        comparisons (dict): {name: (df_baseline, df_method)}, e.g. one entry per split and method.
+        k (int): Number of first citations for the top-k inclusion. Defaults to 3.
+        max_citations (int): Citations after this rank are ignored. Defaults to 5.
+        num_resamples (int): Number of bootstrap resamples. Defaults to 2000.
+        confidence (float): Level of the percentile intervals. Defaults to 0.95.
+        seed (int): Seed of the resampling. Defaults to 42.
+        max_workers (int): Number of groups computed at the same time. Defaults to 8.
+
+    Returns:
+        pd.DataFrame: One row per comparison and metric ("Delta Rank", "Top-k Method", "Top-k Baseline",
+            "Top-k Delta"), with the estimate, the bootstrap standard error and the confidence interval.
+    """
+    statistics = {
+        name: query_statistics(df_baseline, df_method, k, max_citations)
+        for name, (df_baseline, df_method) in comparisons.items()
+    }
+    groups = {}
+    for name, (sums, counts) in statistics.items():
+        groups.setdefault(len(counts), []).append(name)
+
+    def compute(names):
+        numerators = np.concatenate([statistics[name][0] for name in names], axis=1)
+        denominators = np.repeat(
+            np.stack([statistics[name][1] for name in names], axis=1),
+            len(METRICS),
+            axis=1,
+        )
+        result = bootstrap_ratio(
+            numerators, denominators, num_resamples, confidence, seed
+        )
+        return pd.DataFrame(
+            {
+                "Comparison": np.repeat(names, len(METRICS)),
+                "Metric": METRICS * len(names),
+                "Estimate": result["estimate"],
+                "SE": result["se"],
+                "CI Low": result["ci_low"],
+                "CI High": result["ci_high"],
+                "Queries": np.repeat(
+                    [len(statistics[name][1]) for name in names], len(METRICS)
+                ),
+                "Boosted": np.repeat(
+                    [int(statistics[name][1].sum()) for name in names], len(METRICS)
+                ),
+            }
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list_dfs = list(executor.map(compute, groups.values()))
+    if not list_dfs:
+        return pd.DataFrame(
+            columns=[
+                "Comparison",
+                "Metric",
+                "Estimate",
+                "SE",
+                "CI Low",
+                "CI High",
+                "Queries",
+                "Boosted",
+            ]
+        )
+    df = pd.concat(list_dfs, ignore_index=True)
+    # keep the order of the comparisons
+    order = {name: i for i, name in enumerate(comparisons)}
+    return df.sort_values(
+        "Comparison", key=lambda names: names.map(order), kind="stable"
+    ).reset_index(drop=True)
+
+
+def bootstrap_adoption_curve(
+    df_baseline: pd.DataFrame,
+    dfs_levels: dict,
+    k: int = 3,
+    max_citations: int = 5,
+    num_resamples: int = 2000,
+    confidence: float = 0.95,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Bootstrap confidence bands of the metrics of the adopters along an adoption curve (the runs of
+    `benchmark.AdoptionSweep`). All the levels are resampled with the same queries, so the band of the
+    curve is consistent across levels.
+
+    Args:
+        df_baseline (pd.DataFrame): Results of the baseline (no adoption).
+        dfs_levels (dict): {level: results of the level}, with the same queries in the same order as the baseline.
+            The "Boost Product Index" of each level are its adopters.
+        k (int): Number of first citations for the top-k inclusion. Defaults to 3.
+        max_citations (int): Citations after this rank are ignored. Defaults to 5.
+        num_resamples (int): Number of bootstrap resamples. Defaults to 2000.
+        confidence (float): Level of the percentile intervals. Defaults to 0.95.
+        seed (int): Seed of the resampling. Defaults to 42.
+
+    Returns:
+        pd.DataFrame: One row per level and metric, with the estimate, the bootstrap standard error and the
+            confidence interval.
+    """
+    levels = list(dfs_levels)
+    list_sums, list_counts = [], []
+    for level in levels:
+        sums, counts = query_statistics(
+            df_baseline, dfs_levels[level], k, max_citations
+        )
+        list_sums.append(sums)
+        list_counts.append(counts)
+    num_queries = min((len(counts) for counts in list_counts), default=0)
+    # one column per (level, metric), all resampled with the same index matrix
+    numerators = np.concatenate([sums[:num_queries] for sums in list_sums], axis=1)
+    denominators = np.repeat(
+        np.stack([counts[:num_queries] for counts in list_counts], axis=1),
+        len(METRICS),
+        axis=1,
+    )
+    result = bootstrap_ratio(numerators, denominators, num_resamples, confidence, seed)
+    return pd.DataFrame(
+        {
+            "Level": np.repeat(levels, len(METRICS)),
+            "Metric": METRICS * len(levels),
+            "Estimate": result["estimate"],
+            "SE": result["se"],
+            "CI Low": result["ci_low"],
+            "CI High": result["ci_high"],
+        }
+    )
@@ -0,0 +1,281 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from llms.token_counter import DOCUMENT_SEPARATOR
+
+RESPONSES_FILENAME = "responses.parquet"
+
+
+def _to_list(x):
+    if x is None:
+        return []
+    if isinstance(x, np.ndarray):
+        return x.tolist()
+    if not isinstance(x, list):
+        # for compatibility with older results
+        return [x]
+    return x
+
+
+def flatten_citation_events(
+    df: pd.DataFrame, method: str, split: str = None, max_citations: int = 5
+) -> pd.DataFrame:
+    """
+    Flattens the responses of a run into one event per (query, document in the context).
+
+    Args:
+        df (pd.DataFrame): The responses of a run (`responses.parquet`).
+        method (str): Name of the method of the run.
+        split (str, optional): Name of the split of the run.
+        max_citations (int): Citations after this rank are considered as not cited. Defaults to 5.
+
+    Returns:
+        pd.DataFrame: One row per event with the columns "query_idx", "doc_idx" (original index of the document),
+            "position" (0-based position in the context), "treated" (whether the document was rewritten with the
+            method), "rank" (0-based citation rank, -1 if not cited), "method" and "split".
+    """
+    df = df.reset_index(drop=True)
+    if "Context Order" in df.columns:
+        orders = [_to_list(order) for order in df["Context Order"]]
+        num_docs = np.array([len(order) for order in orders])
+    else:
+        orders = None
+        num_docs = df["Prompt"].str.count(DOCUMENT_SEPARATOR).to_numpy()
+
+    # positions of every event with one concatenated arange
+    offsets = np.concatenate([[0], np.cumsum(num_docs)[:-1]]).astype(np.int64)
+    num_events = int(num_docs.sum())
+    query_idx = np.repeat(np.arange(len(df)), num_docs)
+    position = np.arange(num_events) - np.repeat(offsets, num_docs)
+    doc_idx = (
+        np.concatenate([np.asarray(order, dtype=np.int64) for order in orders])
+        if orders is not None and num_events > 0
+        else position.copy()
+    )
+
+    # the boosted documents and the citations are few per query, so they are scattered row by row
+    treated = np.zeros(num_events, dtype=bool)
+    rank = np.full(num_events, -1, dtype=np.int64)
+    for i, (boosted, citations) in enumerate(
+        zip(df["Boost Product Index"], df["Citation Order"])
+    ):
+        start = offsets[i]
+        # the position of each original document in the context
+        if orders is not None:
+            doc2position = {doc: p for p, doc in enumerate(orders[i])}
+        else:
+            doc2position = None
+        for doc in _to_list(boosted):
+            p = doc2position.get(doc) if doc2position is not None else doc
+            if p is not None and 0 <= p < num_docs[i]:
+                treated[start + p] = True
+        # citations of documents outside of the context are skipped, so the ranks stay contiguous
+        r = 0
+        for doc in _to_list(citations):
+            p = doc2position.get(doc) if doc2position is not None else doc
+            if r < max_citations and p is not None and 0 <= p < num_docs[i]:
+                rank[start + p] = r
+                r += 1
+
+    return pd.DataFrame(
+        {
+            "query_idx": query_idx,
+            "doc_idx": doc_idx,
+            "position": position,
+            "treated": treated,
+            "rank": rank,
+            "method": method,
+            "split": split,
+        }
+    )
+
+
+def load_citation_events(results_folder: str, max_citations: int = 5) -> pd.DataFrame:
+    """
+    Loads the citation events of all the runs of a results folder with the structure `{split}/{method}/...`.
+    The `seo_baseline` runs are skipped, since they move documents instead of rewriting them.
+
+    Args:
+        results_folder (str): Root of the results.
+        max_citations (int): Citations after this rank are considered as not cited. Defaults to 5.
+
+    Returns:
+        pd.DataFrame: The events of all the runs (see `flatten_citation_events`), with an extra column "run"
+            (the path of the run relative to `results_folder`).
+    """
+    list_events = []
+    for root, _, files in os.walk(results_folder):
+        if RESPONSES_FILENAME not in files:
+            continue
+        run = os.path.relpath(root, results_folder)
+        parts = run.split(os.sep) + [None] * 2
+        split, method = parts[:2]
+        if method is None or method.startswith("seo_baseline"):
+            continue
+        df = pd.read_parquet(os.path.join(root, RESPONSES_FILENAME))
+        events = flatten_citation_events(df, method, split, max_citations)
+        events["run"] = run
+        list_events.append(events)
+    if len(list_events) == 0:
+        return flatten_citation_events(
+            pd.DataFrame(columns=["Prompt", "Boost Product Index", "Citation Order"]),
+            None,
+        ).assign(run=None)
+    return pd.concat(list_events, ignore_index=True)
+
+
+def fit_position_bias(
+    events: pd.DataFrame, max_citations: int = 5, confidence: float = 0.95
+) -> dict:
+    """
+    Fits a rank-ordered (exploded) logit model to the citation events. At each citation rank, the cited
+    document is chosen among the documents of the context not cited yet, with utility
+
+        u = position_effect[position] + method_effect[method] * treated
+
+    The position effects (relative to the first position) absorb the position bias, so the method effects
+    are the debiased effects of rewriting a document with each method, in log-odds of being cited at each
+    rank. The model is fitted with L-BFGS on the analytic gradient (computed with `np.bincount` over all the
+    events), and the confidence intervals use the Hessian at the optimum.
+
+    Args:
+        events (pd.DataFrame): Citation events (see `load_citation_events`). Each (run, query_idx) is a context.
+        max_citations (int): Number of citation ranks in the model. Defaults to 5.
+        confidence (float): Level of the confidence intervals. Defaults to 0.95.
+
+    Returns:
+        dict:
+            - "methods" (pd.DataFrame): Effect, standard error, confidence interval, odds ratio and p-value per method.
+            - "positions" (pd.DataFrame): Effect, standard error and confidence interval per position.
+            - "log_likelihood" (float): Log-likelihood at the optimum.
+            - "converged" (bool): Whether the optimizer converged.
+    """
+    from scipy.optimize import minimize
+    from scipy.stats import norm
+
+    run = events["run"] if "run" in events.columns else events["method"]
+    group = pd.MultiIndex.from_arrays(
+        [run.to_numpy(), events["query_idx"].to_numpy()]
+    ).factorize()[0]
+    position = events["position"].to_numpy()
+    rank = events["rank"].to_numpy()
+    rank = np.where(rank >= max_citations, -1, rank)
+    treated = events["treated"].to_numpy()
+    method_names = sorted(events.loc[treated, "method"].unique())
+    method_codes = {method: i for i, method in enumerate(method_names)}
+    treated_param = np.where(
+        treated, events["method"].map(method_codes).fillna(-1).to_numpy(), -1
+    ).astype(np.int64)
+
+    num_groups = int(group.max()) + 1 if len(group) > 0 else 0
+    num_positions = int(position.max()) + 1 if len(position) > 0 else 1
+    num_methods = len(method_names)
+    num_cited = np.bincount(group[rank >= 0], minlength=num_groups)
+
+    # for each rank, the events still in the choice set and the chosen ones
+    stages = []
+    for s in range(max_citations):
+        eligible = np.flatnonzero((num_cited[group] > s) & ((rank < 0) | (rank >= s)))
+        chosen = np.flatnonzero(rank == s)
+        if len(chosen) == 0:
+            break
+        stages.append(
+            (
+                eligible,
+                chosen,
+                treated_param[eligible],
+                treated_param[chosen],
+            )
+        )
+
+    def negative_log_likelihood(theta):
+        position_effect = np.concatenate([[0.0], theta[: num_positions - 1]])
+        method_effect = np.concatenate([theta[num_positions - 1 :], [0.0]])
+        # treated_param = -1 selects the trailing 0 (untreated documents)
+        u = position_effect[position] + method_effect[treated_param]
+        shift = u.max() if len(u) > 0 else 0.0
+        log_likelihood = 0.0
+        grad_position = np.zeros(num_positions)
+        grad_method = np.zeros(num_methods)
+        for eligible, chosen, eligible_param, chosen_param in stages:
+            exp_u = np.exp(u[eligible] - shift)
+            denominator = np.bincount(
+                group[eligible], weights=exp_u, minlength=num_groups
+            )
+            log_likelihood += (
+                u[chosen].sum()
+                - np.log(denominator[group[chosen]]).sum()
+                - shift * len(chosen)
+            )
+            p = exp_u / denominator[group[eligible]]
+            grad_position += np.bincount(position[chosen], minlength=num_positions)
+            grad_position -= np.bincount(
+                position[eligible], weights=p, minlength=num_positions
+            )
+            grad_method += np.bincount(
+                chosen_param[chosen_param >= 0], minlength=num_methods
+            )
+            grad_method -= np.bincount(
+                eligible_param[eligible_param >= 0],
+                weights=p[eligible_param >= 0],
+                minlength=num_methods,
+            )
+        gradient = np.concatenate([grad_position[1:], grad_method])
+        return -log_likelihood, -gradient
+
+    num_params = num_positions - 1 + num_methods
+    result = minimize(
+        negative_log_likelihood,
+        np.zeros(num_params),
+        jac=True,
+        method="L-BFGS-B",
+    )
+    theta = result.x
+
+    # Hessian by central differences of the analytic gradient
+    eps = 1e-4
+    hessian = np.zeros((num_params, num_params))
+    for k in range(num_params):
+        step = np.zeros(num_params)
+        step[k] = eps
+        hessian[k] = (
+            negative_log_likelihood(theta + step)[1]
+            - negative_log_likelihood(theta - step)[1]
+        ) / (2 * eps)
+    hessian = (hessian + hessian.T) / 2
+    covariance = np.linalg.pinv(hessian)
+    standard_error = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    z = norm.ppf(0.5 + confidence / 2)
+
+    df_positions = pd.DataFrame(
+        {
+            "Position": np.arange(num_positions),
+            "Effect": np.concatenate([[0.0], theta[: num_positions - 1]]),
+            "SE": np.concatenate([[0.0], standard_error[: num_positions - 1]]),
+        }
+    )
+    df_positions["CI Low"] = df_positions["Effect"] - z * df_positions["SE"]
+    df_positions["CI High"] = df_positions["Effect"] + z * df_positions["SE"]
+
+    df_methods = pd.DataFrame(
+        {
+            "Method": method_names,
+            "Effect": theta[num_positions - 1 :],
+            "SE": standard_error[num_positions - 1 :],
+        }
+    )
+    df_methods["CI Low"] = df_methods["Effect"] - z * df_methods["SE"]
+    df_methods["CI High"] = df_methods["Effect"] + z * df_methods["SE"]
+    df_methods["Odds Ratio"] = np.exp(df_methods["Effect"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df_methods["pvalue"] = 2 * norm.sf(
+            np.abs(df_methods["Effect"] / df_methods["SE"])
+        )
+    return {
+        "methods": df_methods,
+        "positions": df_positions,
+        "log_likelihood": -float(result.fun),
+        "converged": bool(result.success),
+    }
@@ -0,0 +1,192 @@
+import math
+
+import numpy as np
+
+EFFICACY = "efficacy"
+FUTILITY = "futility"
+CONTINUE = "continue"
+
+
+class MixtureSPRT:
+    """
+    Mixture sequential probability ratio test (mSPRT) on the rank differences (baseline - method) of the
+    boosted documents. Unlike the Wilcoxon test of `calculate_significant_improvements`, it can be checked
+    after every new shard of queries without inflating the type I error, so a run can stop as soon as the
+    result is clear.
+
+    With a normal mixture N(0, tau^2) over the mean difference and the variance estimated from the data,
+    the likelihood ratio after n differences with mean m and variance v is
+
+        Lambda_n = sqrt(v / (v + n tau^2)) * exp(n^2 tau^2 m^2 / (2 v (v + n tau^2)))
+
+    H0 (no difference) is rejected when Lambda_n >= 1 / alpha. Inverting the test gives an always-valid
+    confidence interval for the mean difference, which is used for both decisions:
+
+        - efficacy: the lower bound of the interval is above 0 (the method improves the rank).
+        - futility: the upper bound of the interval is below `min_effect` (any improvement is too small to matter).
+
+    The statistics are updated incrementally (count, mean and sum of squared deviations), so each update
+    only processes the differences of the new shard.
+
+    Usage:
+        test = MixtureSPRT(alpha=0.05, min_effect=0.2)
+        for diffs in shards:
+            if test.update(diffs)["decision"] != "continue":
+                break
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        tau: float = 1.0,
+        min_effect: float = 0.2,
+        min_samples: int = 50,
+    ):
+        """
+        Initializes the test. The parameters should be fixed before the first shard (pre-registered).
+
+        Args:
+            alpha (float): Type I error of the test. Defaults to 0.05.
+            tau (float): Standard deviation of the mixture over the mean rank difference. Defaults to 1.0.
+            min_effect (float): Smallest mean rank difference worth detecting, used for futility. Defaults to 0.2.
+            min_samples (int): Minimum number of differences before a decision. Defaults to 50.
+        """
+        self.alpha = alpha
+        self.tau = tau
+        self.min_effect = min_effect
+        self.min_samples = min_samples
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the differences seen so far, keeping the design of the test.
+        """
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.pvalue = 1.0
+
+    @property
+    def variance(self) -> float:
+        """
+        Returns the sample variance of the differences (0 with fewer than 2 differences).
+
+        Returns:
+            float: The variance.
+        """
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def log_likelihood_ratio(self) -> float:
+        """
+        Returns the logarithm of the mixture likelihood ratio against H0 (mean difference = 0).
+
+        Returns:
+            float: log(Lambda_n). 0 before the first update or if the variance is 0.
+        """
+        v = self.variance
+        if self.n == 0 or v == 0:
+            return 0.0
+        n_tau2 = self.n * self.tau**2
+        return 0.5 * math.log(v / (v + n_tau2)) + (self.n * n_tau2 * self.mean**2) / (
+            2 * v * (v + n_tau2)
+        )
+
+    def confidence_interval(self) -> tuple:
+        """
+        Returns the always-valid (1 - alpha) confidence interval of the mean difference.
+
+        Returns:
+            tuple: (low, high). (-inf, inf) before the first two differences.
+        """
+        v = self.variance
+        if self.n < 2:
+            return (-math.inf, math.inf)
+        n_tau2 = self.n * self.tau**2
+        half_width = math.sqrt(
+            v
+            * (v + n_tau2)
+            / (self.n * n_tau2)
+            * (
+                2 * math.log(1 / self.alpha)
+                + math.log((v + n_tau2) / v if v > 0 else 1)
+            )
+        )
+        return (self.mean - half_width, self.mean + half_width)
+
+    def decision(self) -> str:
+        """
+        Returns the decision with the differences seen so far.
+
+        Returns:
+            str: "efficacy", "futility" or "continue".
+        """
+        if self.n < self.min_samples:
+            return CONTINUE
+        low, high = self.confidence_interval()
+        if low > 0:
+            return EFFICACY
+        if high < self.min_effect:
+            return FUTILITY
+        return CONTINUE
+
+    def update(self, diffs) -> dict:
+        """
+        Adds the differences of a new shard.
+
+        Args:
+            diffs (list): Rank differences (baseline - method) of the boosted documents of the shard
+                (see `calculate_rank_differences`).
+
+        Returns:
+            dict: The state of the test after the update (see `state`).
+        """
+        diffs = np.asarray(diffs, dtype=float)
+        if len(diffs) > 0:
+            # merge the mean and the sum of squared deviations of the shard (Chan et al.)
+            n_new = len(diffs)
+            mean_new = float(diffs.mean())
+            m2_new = float(((diffs - mean_new) ** 2).sum())
+            n = self.n + n_new
+            delta = mean_new - self.mean
+            self.mean += delta * n_new / n
+            self.m2 += m2_new + delta**2 * self.n * n_new / n
+            self.n = n
+            # always-valid p-value: the running minimum of 1 / Lambda_n
+            self.pvalue = min(
+                self.pvalue, math.exp(-max(self.log_likelihood_ratio(), 0.0))
+            )
+        return self.state()
+
+    def state(self) -> dict:
+        """
+        Returns the current statistics of the test.
+
+        Returns:
+            dict: "n", "mean_diff", "std_diff", "log_lr", "pvalue" (always valid), "ci_low", "ci_high" and "decision".
+        """
+        low, high = self.confidence_interval()
+        return {
+            "n": self.n,
+            "mean_diff": self.mean,
+            "std_diff": math.sqrt(self.variance),
+            "log_lr": self.log_likelihood_ratio(),
+            "pvalue": self.pvalue,
+            "ci_low": low,
+            "ci_high": high,
+            "decision": self.decision(),
+        }
+
+    def design(self) -> dict:
+        """
+        Returns the parameters of the test, to save them with the results.
+
+        Returns:
+            dict: "test", "alpha", "tau", "min_effect" and "min_samples".
+        """
+        return {
+            "test": "mSPRT",
+            "alpha": self.alpha,
+            "tau": self.tau,
+            "min_effect": self.min_effect,
+            "min_samples": self.min_samples,
+        }
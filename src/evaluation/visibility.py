@@ -0,0 +1,196 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from llms.token_counter import DOCUMENT_SEPARATOR
+
+from .position_bias import _to_list
+
+# Sentences end with ".", "!" or "?" (not before a citation mark, which belongs to the sentence) or a new line
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?!\[\d)|\n+")
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def build_sentence_index(responses) -> dict:
+    """
+    Splits every response into sentences once and indexes the citations of each sentence in CSR form
+    (offsets plus values), so the visibility metrics are computed with array operations.
+
+    Args:
+        responses (iterable): The text of each response.
+
+    Returns:
+        dict:
+            - "response_offsets" (np.ndarray): Shape (responses + 1,). Sentences of response r are
+                `response_offsets[r]:response_offsets[r + 1]`.
+            - "sentence_offsets" (np.ndarray): Shape (sentences + 1,). Citations of sentence s are
+                `citations[sentence_offsets[s]:sentence_offsets[s + 1]]`.
+            - "citations" (np.ndarray): Cited positions (0-based) in the order of the response, with duplicates.
+            - "words" (np.ndarray): Number of words of each sentence, without the citation marks.
+    """
+    response_offsets = [0]
+    sentence_offsets = [0]
+    citations = []
+    words = []
+    for response in responses:
+        sentences = [s for s in SENTENCE_PATTERN.split(response or "") if s.strip()]
+        for sentence in sentences:
+            citations.extend(int(c) - 1 for c in CITATION_PATTERN.findall(sentence))
+            sentence_offsets.append(len(citations))
+            words.append(len(WORD_PATTERN.findall(CITATION_PATTERN.sub(" ", sentence))))
+        response_offsets.append(response_offsets[-1] + len(sentences))
+    return {
+        "response_offsets": np.array(response_offsets, dtype=np.int64),
+        "sentence_offsets": np.array(sentence_offsets, dtype=np.int64),
+        "citations": np.array(citations, dtype=np.int64),
+        "words": np.array(words, dtype=np.int64),
+    }
+
+
+def _split_rows(values: np.ndarray, num_docs: np.ndarray) -> list:
+    # one array per row from the flat (row, document) array
+    return np.split(values, np.cumsum(num_docs)[:-1]) if len(num_docs) > 0 else []
+
+
+def visibility_metrics(df: pd.DataFrame, k: int = 3) -> pd.DataFrame:
+    """
+    Computes the visibility of every document of the context in each response, beyond the rank of its
+    first citation:
+
+        - "Position-Adjusted Word Count": the words of each sentence are split equally among the documents it
+            cites, weighted by exp(-sentence position / number of sentences), and normalized by the words of
+            the response (the impression metric of GEO).
+        - "Citation Share": fraction of the citation marks of the response (with duplicates) that cite the document.
+        - "First Citation": the document cited first (-1 if there are no citations).
+        - "Top-k Inclusion": whether the document is among the first k distinct documents cited.
+
+    The responses are parsed in one pass with `build_sentence_index`, and the metrics of all the (response,
+    document) pairs are computed with `np.bincount` over the flat citation array. The documents are the
+    original ones (mapped with "Context Order" if the run was permuted).
+
+    Args:
+        df (pd.DataFrame): The responses of a run (`responses.parquet`).
+        k (int): Number of first distinct citations for the top-k inclusion. Defaults to 3.
+
+    Returns:
+        pd.DataFrame: A copy of `df` with the four per-document columns above (one value per document of the
+            context) and their averages over the boosted documents of each response ("Boosted Word Count",
+            "Boosted Citation Share", "Boosted First Citation" and "Boosted Top-k").
+    """
+    df = df.reset_index(drop=True).copy()
+    if "Context Order" in df.columns:
+        orders = [_to_list(order) for order in df["Context Order"]]
+        num_docs = np.array([len(order) for order in orders], dtype=np.int64)
+    else:
+        orders = None
+        num_docs = df["Prompt"].str.count(DOCUMENT_SEPARATOR).to_numpy(dtype=np.int64)
+    num_rows = len(df)
+    doc_offsets = np.concatenate([[0], np.cumsum(num_docs)]).astype(np.int64)
+    num_pairs = int(doc_offsets[-1])
+
+    index = build_sentence_index(df["Response"])
+    response_offsets = index["response_offsets"]
+    sentence_offsets = index["sentence_offsets"]
+    num_sentences = np.diff(response_offsets)
+    sentence_row = np.repeat(np.arange(num_rows), num_sentences)
+    sentence_position = np.arange(len(sentence_row)) - np.repeat(
+        response_offsets[:-1], num_sentences
+    )
+    citation_sentence = np.repeat(
+        np.arange(len(sentence_row)), np.diff(sentence_offsets)
+    )
+    citation_row = sentence_row[citation_sentence]
+    position = index["citations"]
+
+    # keep the citations of documents in the context and map them to the original documents
+    valid = (position >= 0) & (position < num_docs[citation_row])
+    citation_sentence = citation_sentence[valid]
+    citation_row = citation_row[valid]
+    position = position[valid]
+    if orders is not None:
+        max_docs = int(num_docs.max()) if num_rows > 0 else 0
+        padded = np.full((num_rows, max_docs), -1, dtype=np.int64)
+        for i, order in enumerate(orders):
+            padded[i, : len(order)] = order
+        # the original documents of each row are 0..num_docs-1
+        pair = doc_offsets[citation_row] + padded[citation_row, position]
+    else:
+        pair = doc_offsets[citation_row] + position
+
+    # citation share: citation marks of each (row, document) over the marks of the row
+    marks = np.bincount(pair, minlength=num_pairs).astype(float)
+    marks_per_row = np.bincount(citation_row, minlength=num_rows).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        citation_share = np.nan_to_num(
+            marks / np.repeat(marks_per_row, num_docs), nan=0.0
+        )
+
+    # position-adjusted word count: each sentence counts once per cited document
+    _, first = np.unique(citation_sentence * num_pairs + pair, return_index=True)
+    sentence_pair_sentence = citation_sentence[first]
+    sentence_pair = pair[first]
+    docs_per_sentence = np.bincount(sentence_pair_sentence, minlength=len(sentence_row))
+    weight = (
+        np.exp(-sentence_position / np.maximum(num_sentences[sentence_row], 1))
+        * index["words"]
+        / np.maximum(docs_per_sentence, 1)
+    )
+    words_per_row = np.bincount(
+        sentence_row, weights=index["words"], minlength=num_rows
+    )
+    word_count = np.bincount(
+        sentence_pair, weights=weight[sentence_pair_sentence], minlength=num_pairs
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        word_count = np.nan_to_num(
+            word_count / np.repeat(words_per_row, num_docs), nan=0.0
+        )
+
+    # first distinct citations: the first mark of each (row, document), in the order of the response
+    _, first = np.unique(pair, return_index=True)
+    first = np.sort(first)
+    first_row = citation_row[first]
+    row_start = np.searchsorted(first_row, np.arange(num_rows))
+    rank = np.arange(len(first)) - row_start[first_row]
+    top_k = np.zeros(num_pairs, dtype=bool)
+    top_k[pair[first][rank < k]] = True
+    first_citation = np.full(num_rows, -1, dtype=np.int64)
+    is_first = rank == 0
+    first_citation[first_row[is_first]] = (
+        pair[first][is_first] - doc_offsets[first_row[is_first]]
+    )
+
+    df["Position-Adjusted Word Count"] = _split_rows(word_count, num_docs)
+    df["Citation Share"] = _split_rows(citation_share, num_docs)
+    df["First Citation"] = first_citation
+    df["Top-k Inclusion"] = _split_rows(top_k, num_docs)
+
+    # averages over the boosted documents of each row
+    boosted = [
+        [doc for doc in _to_list(boost) if 0 <= doc < n]
+        for boost, n in zip(df["Boost Product Index"], num_docs)
+    ]
+    num_boosted = np.array([len(b) for b in boosted], dtype=np.int64)
+    boosted_row = np.repeat(np.arange(num_rows), num_boosted)
+    boosted_pair = (
+        doc_offsets[boosted_row] + np.concatenate(boosted).astype(np.int64)
+        if len(boosted_row) > 0
+        else np.zeros(0, dtype=np.int64)
+    )
+    boosted_values = {
+        "Boosted Word Count": word_count[boosted_pair],
+        "Boosted Citation Share": citation_share[boosted_pair],
+        "Boosted First Citation": (
+            first_citation[boosted_row] == boosted_pair - doc_offsets[boosted_row]
+        ).astype(float),
+        "Boosted Top-k": top_k[boosted_pair].astype(float),
+    }
+    for column, values in boosted_values.items():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df[column] = (
+                np.bincount(boosted_row, weights=values, minlength=num_rows)
+                / num_boosted
+            )
+    return df
@@ -1,7 +1,27 @@
 # Import necessary modules
-from .openai import OpenAIHelper
-from .anthropic import AnthropicHelper
 from .llm_interface import LLMInterface
 
+# The heavy libraries (the provider SDKs, datasets, pandas, numpy, scipy, statsmodels) take from tenths of a
+# second to seconds to import, so the packages only import them when they are used: the exports that need
+# them are resolved on first access (PEP 562, `_LAZY_IMPORTS`), and the other modules import them inside the
+# functions that need them. The provider helpers import their SDKs (openai, anthropic).
+_LAZY_IMPORTS = {
+    "OpenAIHelper": ".openai",
+    "AnthropicHelper": ".anthropic",
+    "LocalOpenAIHelper": ".local",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # Set up basic configurations
-__all__ = ["OpenAIHelper", "AnthropicHelper", "LLMInterface"]
+__all__ = ["OpenAIHelper", "AnthropicHelper", "LocalOpenAIHelper", "LLMInterface"]
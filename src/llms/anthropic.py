@@ -4,16 +4,37 @@ import os
 from typing import List
 
 import anthropic
+import httpx
 from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
 from anthropic.types.messages.batch_create_params import Request
 
+from profiling import profiler
+
 from .llm_interface import LLMInterface
+from .rate_limiter import get_rate_limiter
+from .token_counter import TokenCounter, count_request_tokens
+from .usage_ledger import compute_cost, create_usage_ledger, save_usage_ledger
+
+# Connections kept open for the real-time requests of `run_requests` and retries of failed calls
+# (rate limits, overloaded errors and timeouts are retried with exponential backoff by the client)
+MAX_CONNECTIONS = 32
+MAX_RETRIES = 5
 
 
 class AnthropicHelper(LLMInterface):
-    def __init__(self, llm_name: str):
+    def __init__(
+        self,
+        llm_name: str,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
         """
         Initialize the AnthropicHelper class with an API key.
+
+        Args:
+            llm_name (str): The name of the LLM model.
+            requests_per_minute (float, optional): Requests per minute of the real-time API (see `run_requests`).
+            tokens_per_minute (float, optional): Input tokens per minute of the real-time API.
         """
         if not os.environ.get("ANTHROPIC_API_KEY"):
             os.environ["ANTHROPIC_API_KEY"] = getpass.getpass(
@@ -21,7 +42,21 @@ class AnthropicHelper(LLMInterface):
             )
         api_key = os.environ["ANTHROPIC_API_KEY"]
         self.llm_name = llm_name
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # one connection pool shared by all the threads of `run_requests`
+        self.client = anthropic.Anthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                )
+            ),
+            max_retries=MAX_RETRIES,
+        )
+        self.rate_limiter = get_rate_limiter(
+            "anthropic", requests_per_minute, tokens_per_minute
+        )
+        self.token_counter = None
 
         self.PRICES = {
             "claude-3-7-sonnet-20250224": {
@@ -50,6 +85,21 @@ class AnthropicHelper(LLMInterface):
             },
         }
 
+    def get_token_prices(self, batch=True):
+        """
+        Get the price per million tokens of the model.
+
+        Args:
+            batch (bool, optional): Whether to return the prices of the Batch API (50% discount). Default is True.
+
+        Returns:
+            dict: Prices for "input", "output", "prompt_caching_write" and "prompt_caching_read" tokens.
+        """
+        discount = 0.5 if batch else 1.0
+        return {
+            key: price * discount for key, price in self.PRICES[self.llm_name].items()
+        }
+
     def create_message(self, user_query, list_docs=None):
         """
         Create a message for the Anthropic API.
@@ -86,7 +136,7 @@ class AnthropicHelper(LLMInterface):
         raw_prompt = "User: " + user_query
         return messages, raw_prompt
 
-    def create_request(self, messages, system, i, max_tokens=8192):
+    def create_request(self, messages, system, i, max_tokens=8192, custom_id=None):
         """
         Create a request for the Anthropic API.
 
@@ -96,12 +146,13 @@ class AnthropicHelper(LLMInterface):
             llm_model (str): The LLM model to be used.
             i (int): The request index.
             max_tokens (int, optional): The maximum number of tokens. Default is 8192.
+            custom_id (str, optional): ID used to route the result of the request. Default is "request-{i}".
 
         Returns:
             Request: The request object.
         """
         request = Request(
-            custom_id=f"request-{i}",
+            custom_id=custom_id if custom_id is not None else f"request-{i}",
             params=MessageCreateParamsNonStreaming(
                 model=self.llm_name,
                 max_tokens=max_tokens,
@@ -111,9 +162,45 @@ class AnthropicHelper(LLMInterface):
         )
         return request
 
-    def generate(self, messages):
-        raise NotImplementedError(
-            "The generate method is not implemented in the AnthropicHelper class."
+    def generate(self, messages, system=None, max_tokens=8192):
+        """
+        Generate a response with the real-time API.
+
+        Args:
+            messages (list): List of messages.
+            system (str, optional): The system prompt.
+            max_tokens (int, optional): The maximum number of tokens. Default is 8192.
+
+        Returns:
+            tuple: The response message and its cost.
+        """
+        params = {
+            "model": self.llm_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+        }
+        if system:
+            params["system"] = [{"type": "text", "text": system}]
+        self.rate_limiter.acquire()
+        message = self.client.messages.create(**params)
+        return message, self.calculate_response_cost(message)
+
+    def run_request(self, request: Request):
+        """
+        Run a single request created with `create_request` with the real-time API.
+
+        Args:
+            request (Request): The request object.
+
+        Returns:
+            tuple: The text response and its cost.
+        """
+        if self.token_counter is None:
+            self.token_counter = TokenCounter(self.llm_name)
+        self.rate_limiter.acquire(count_request_tokens(request, self.token_counter))
+        message = self.client.messages.create(**request["params"])
+        return self.retrieve_text_response(message), self.calculate_response_cost(
+            message
         )
 
     def run_batch(self, list_requests: List[Request], output_folder):
@@ -128,13 +215,16 @@ class AnthropicHelper(LLMInterface):
         """
         # 1) Save batch requests as JSONL format (required by OpenAI API)
         batch_filename = os.path.join(output_folder, "requests.jsonl")
-        with open(batch_filename, "w", encoding="utf-8") as f:
-            for request in list_requests:
-                f.write(json.dumps(request) + "\n")
+        with profiler.timer("anthropic.serialize_requests"):
+            with open(batch_filename, "w", encoding="utf-8") as f:
+                for request in list_requests:
+                    f.write(json.dumps(request) + "\n")
+        profiler.count("anthropic.requests", len(list_requests))
 
-        batch_response_id = self.client.messages.batches.create(
-            requests=list_requests
-        ).id
+        with profiler.timer("anthropic.upload"):
+            batch_response_id = self.client.messages.batches.create(
+                requests=list_requests
+            ).id
 
         with open(
             os.path.join(output_folder, "metadata.jsonl"), "a", encoding="utf-8"
@@ -143,38 +233,72 @@ class AnthropicHelper(LLMInterface):
 
         return batch_response_id
 
-    def retrieve_results(self, batch_id):
+    @profiler.timed("anthropic.retrieve_results")
+    def retrieve_results(self, batch_id, output_folder=None):
         """
         Retrieve the results of a batch request.
 
         Args:
             batch_id (str): The ID of the batch request.
+            output_folder (str, optional): If given, the usage ledger of the batch is saved there as `usage.parquet`.
 
         Returns:
             object: The response object if processing is complete, otherwise None.
         """
+        results, total_requests_num, cost = self._download_results(
+            batch_id, output_folder
+        )
+        if results is None:
+            return None, None
+        # The results might not be in the same order as the requests. That's why we assinged custom_id to each request.
+        # sort them by custom_id
+        sorted_results = [None] * total_requests_num
+        for custom_id, text in results.items():
+            i = int(custom_id.split("-")[-1])
+            sorted_results[i] = text  # sort by custom_id
+        return sorted_results, cost
+
+    def retrieve_results_by_custom_id(self, batch_id, output_folder=None):
+        """
+        Retrieve the results of a batch request, keyed by the custom_id of each request.
+
+        Args:
+            batch_id (str): The ID of the batch request.
+            output_folder (str, optional): If given, the usage ledger of the batch is saved there as `usage.parquet`.
+
+        Returns:
+            tuple: A dictionary {custom_id: text} and the total cost if processing is complete, otherwise (None, None).
+        """
+        results, _, cost = self._download_results(batch_id, output_folder)
+        return results, cost
+
+    def _download_results(self, batch_id, output_folder=None):
         status = self.client.messages.batches.retrieve(batch_id)
         request_counts = status.request_counts
         total_requests_num = sum(request_counts.model_dump().values())
-        if status.processing_status == "ended":
-            num_errors = request_counts.errored
-            if num_errors > 0:
-                print(f"Number of errors: {num_errors}. Saving successful results.")
-            # results is a .jsonl file. It has one response line for every successful request line in the input file.
-            list_responses = [x for x in self.client.messages.batches.results(batch_id)]
-            # The results might not be in the same order as the requests. That's why we assinged custom_id to each request.
-            # sort them by custom_id
-            sorted_results = [None] * total_requests_num
-            for response in list_responses:
-                i = int(response.custom_id.split("-")[-1])
-                sorted_results[i] = self.retrieve_text_response(
-                    response.result.message
-                )  # sort by custom_id
-            cost = self.calculate_batch_cost(list_responses)
-            return sorted_results, cost
-        else:
+        if status.processing_status != "ended":
             print("Batch not completed yet")
-            return None, None
+            return None, None, None
+        num_errors = request_counts.errored
+        if num_errors > 0:
+            print(f"Number of errors: {num_errors}. Saving successful results.")
+        list_responses = [
+            x
+            for x in self.client.messages.batches.results(batch_id)
+            if x.result.type == "succeeded"
+        ]
+        results = {
+            response.custom_id: self.retrieve_text_response(response.result.message)
+            for response in list_responses
+        }
+        ledger = self.get_usage_ledger(
+            list_responses,
+            batch_id=batch_id,
+            batch_seconds=(status.ended_at - status.created_at).total_seconds(),
+        )
+        if output_folder is not None:
+            save_usage_ledger(ledger, output_folder)
+        return results, total_requests_num, float(ledger["cost"].sum())
 
     def retrieve_text_response(self, response):
         """
@@ -242,31 +366,60 @@ class AnthropicHelper(LLMInterface):
         return input_cost + output_cost
 
     def calculate_batch_cost(self, list_responses):
-        total_cost = 0
+        """
+        Calculate the total cost of a batch of responses.
+
+        Args:
+            list_responses (list): List of batch results.
+
+        Returns:
+            float: The total cost of the batch.
+        """
+        return float(self.get_usage_ledger(list_responses)["cost"].sum())
+
+    def get_usage_ledger(self, list_responses, batch_id=None, batch_seconds=None):
+        """
+        Create the usage ledger of a batch of responses, with the tokens and cost of each request.
+
+        Args:
+            list_responses (list): List of batch results.
+            batch_id (str, optional): The ID of the batch.
+            batch_seconds (float, optional): Wall-clock time of the batch in seconds.
+
+        Returns:
+            pd.DataFrame: The usage ledger, one row per response.
+        """
+        list_rows = []
         for response in list_responses:
-            input_cost = response.result.message.usage.input_tokens * (
-                (self.PRICES[self.llm_name]["input"] / 2) / 1000000
-            )
-            output_cost = response.result.message.usage.input_tokens * (
-                (self.PRICES[self.llm_name]["output"] / 2) / 1000000
-            )
-            cache_creation_input_cost = response.result.message.usage.input_tokens * (
-                (self.PRICES[self.llm_name]["prompt_caching_write"] / 2) / 1000000
+            if response.result.type != "succeeded":
+                list_rows.append([response.custom_id, 0, 0, 0, 0, 0])
+                continue
+            usage = response.result.message.usage
+            list_rows.append(
+                [
+                    response.custom_id,
+                    usage.input_tokens,
+                    usage.output_tokens,
+                    usage.cache_read_input_tokens or 0,
+                    usage.cache_creation_input_tokens or 0,
+                    0,
+                ]
             )
-            cache_read_input_tokens = response.result.message.usage.input_tokens * (
-                (self.PRICES[self.llm_name]["prompt_caching_read"] / 2) / 1000000
-            )
-            cost = (
-                input_cost
-                + output_cost
-                + cache_creation_input_cost
-                + cache_read_input_tokens
-            )
-            total_cost += cost
-        return total_cost
+        ledger = create_usage_ledger(list_rows, batch_id, batch_seconds)
+        ledger["cost"] = compute_cost(ledger, self.get_token_prices(batch=True))
+        return ledger
 
     def get_error_messages(self, batch_id):
         return super().get_error_messages(batch_id)
 
     def get_status(self, batch_id):
         return self.client.messages.batches.retrieve(batch_id).processing_status
+
+    def cancel_batch(self, batch_id):
+        """
+        Cancel a batch request that is still running. Requests that were already completed are still billed.
+
+        Args:
+            batch_id (str): The ID of the batch request.
+        """
+        self.client.messages.batches.cancel(batch_id)
@@ -0,0 +1,80 @@
+import json
+import re
+
+# Limits of the Batch APIs (OpenAI: 50,000 requests and 200 MB per batch, Anthropic: 100,000 requests and 256 MB)
+MAX_REQUESTS_PER_BATCH = 50000
+MAX_BYTES_PER_BATCH = 180 * 1024 * 1024
+
+# Anthropic only accepts custom_ids with letters, numbers, "_" and "-", and up to 64 characters
+_CUSTOM_ID_PART = re.compile(r"^[A-Za-z0-9_]+$")
+_CUSTOM_ID_MAX_LENGTH = 64
+CUSTOM_ID_SEPARATOR = "-"
+
+
+def encode_custom_id(*parts) -> str:
+    """
+    Encodes routing metadata (e.g., method, query index and document index) in a custom_id.
+
+    Args:
+        *parts: Parts of the custom_id. They can only contain letters, numbers and "_".
+
+    Returns:
+        str: The custom_id (e.g., "Statistics-12-3").
+    """
+    parts = [str(part) for part in parts]
+    for part in parts:
+        if not _CUSTOM_ID_PART.match(part):
+            raise ValueError(
+                f"Invalid custom_id part '{part}'. Only letters, numbers and '_' are allowed."
+            )
+    custom_id = CUSTOM_ID_SEPARATOR.join(parts)
+    if len(custom_id) > _CUSTOM_ID_MAX_LENGTH:
+        raise ValueError(f"custom_id '{custom_id}' is longer than 64 characters.")
+    return custom_id
+
+
+def decode_custom_id(custom_id: str) -> list:
+    """
+    Decodes a custom_id created with `encode_custom_id`.
+
+    Args:
+        custom_id (str): The custom_id.
+
+    Returns:
+        list: The parts of the custom_id as strings.
+    """
+    return custom_id.split(CUSTOM_ID_SEPARATOR)
+
+
+def shard_requests(
+    list_requests,
+    max_requests: int = MAX_REQUESTS_PER_BATCH,
+    max_bytes: int = MAX_BYTES_PER_BATCH,
+):
+    """
+    Splits a list of requests into shards that fit in one batch.
+
+    Args:
+        list_requests (list): List of requests.
+        max_requests (int): Maximum number of requests per shard.
+        max_bytes (int): Maximum size of a shard in JSONL format.
+
+    Returns:
+        list: List of shards (lists of requests).
+    """
+    shards = []
+    shard = []
+    shard_bytes = 0
+    for request in list_requests:
+        request_bytes = len(json.dumps(request).encode("utf-8")) + 1
+        if shard and (
+            len(shard) >= max_requests or shard_bytes + request_bytes > max_bytes
+        ):
+            shards.append(shard)
+            shard = []
+            shard_bytes = 0
+        shard.append(request)
+        shard_bytes += request_bytes
+    if shard:
+        shards.append(shard)
+    return shards
@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple
+
+from profiling import profiler
 
 
 class LLMInterface(ABC):
@@ -34,6 +37,15 @@ class LLMInterface(ABC):
 
         calculate_api_call_cost(response: Any, input_cost: float, output_cost: float) -> float:
             Calculate the cost of an API call based on the response and given costs.
+
+        get_token_prices(batch: bool = True) -> Dict[str, float]:
+            Get the price per million tokens of the model.
+
+        run_request(request: Any) -> Tuple[str, float]:
+            Execute a single request created with `create_request` synchronously.
+
+        run_requests(list_requests: List[Any], max_workers: int = 8) -> Tuple[Dict[str, str], float]:
+            Execute a list of requests synchronously with a thread pool, without the Batch API.
     """
 
     @abstractmethod
@@ -46,12 +58,59 @@ class LLMInterface(ABC):
         pass
 
     @abstractmethod
-    def generate(self, messages: List) -> Any:
+    def generate(self, messages: List, system: str = None) -> Any:
         """
-        Execute a single request.
+        Execute a single request. Returns the response message and its cost.
         """
         pass
 
+    @abstractmethod
+    def run_request(self, request: Any) -> Tuple[str, float]:
+        """
+        Execute a single request created with `create_request` with the real-time API, waiting for the
+        rate limiter of the provider. Returns the text response and its cost.
+        """
+        pass
+
+    def run_requests(
+        self, list_requests: List[Any], max_workers: int = 8
+    ) -> Tuple[Dict[str, str], float]:
+        """
+        Execute requests created with `create_request` with the real-time API instead of a batch.
+        The requests are sent from a thread pool sharing the HTTP connection pool and the rate limiter
+        of the helper, so a few hundred requests finish in minutes instead of waiting in the batch queue.
+        Failed requests (after the retries of the client) are skipped, as in the batch results.
+
+        Args:
+            list_requests (List[Any]): Requests created with `create_request`.
+            max_workers (int): Number of concurrent requests. Defaults to 8.
+
+        Returns:
+            tuple: A dictionary {custom_id: text} and the total cost (at real-time prices).
+        """
+        results = {}
+        total_cost = 0.0
+        num_errors = 0
+        with profiler.timer("llm.run_requests"):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(self.run_request, request): request["custom_id"]
+                    for request in list_requests
+                }
+                for future in as_completed(futures):
+                    try:
+                        text, cost = future.result()
+                    except Exception as e:
+                        num_errors += 1
+                        print(f"Request {futures[future]} failed: {e}")
+                        continue
+                    results[futures[future]] = text
+                    total_cost += cost
+        profiler.count("llm.run_requests", len(list_requests))
+        if num_errors > 0:
+            print(f"Number of errors: {num_errors}. Returning successful results.")
+        return results, total_cost
+
     @abstractmethod
     def create_request(
         self,
@@ -59,9 +118,11 @@ class LLMInterface(ABC):
         system: str,
         i: int,
         max_tokens: int = 8192,
+        custom_id: str = None,
     ) -> Any:
         """
-        Create a request with the given parameters.
+        Create a request with the given parameters. The result of the request is routed with `custom_id`
+        (by default "request-{i}").
         """
         pass
 
@@ -73,9 +134,18 @@ class LLMInterface(ABC):
         pass
 
     @abstractmethod
-    def retrieve_results(self, batch_id: str) -> Any:
+    def retrieve_results(self, batch_id: str, output_folder: str = None) -> Any:
+        """
+        Retrieve results for a given batch ID. If `output_folder` is given, the usage ledger is saved there.
+        """
+        pass
+
+    @abstractmethod
+    def retrieve_results_by_custom_id(
+        self, batch_id: str, output_folder: str = None
+    ) -> Any:
         """
-        Retrieve results for a given batch ID.
+        Retrieve results for a given batch ID as a dictionary {custom_id: text}.
         """
         pass
 
@@ -107,6 +177,13 @@ class LLMInterface(ABC):
         """
         pass
 
+    @abstractmethod
+    def get_token_prices(self, batch: bool = True) -> Dict[str, float]:
+        """
+        Get the price per million tokens of the model.
+        """
+        pass
+
     @abstractmethod
     def get_error_messages(self, batch_id: str) -> List[str]:
         """
@@ -120,3 +197,10 @@ class LLMInterface(ABC):
         Get the status of a batch request.
         """
         pass
+
+    @abstractmethod
+    def cancel_batch(self, batch_id: str) -> None:
+        """
+        Cancel a batch request that is still running.
+        """
+        pass
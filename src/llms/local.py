@@ -0,0 +1,401 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+from llms.openai import OpenAIHelper, get_json_list
+from llms.rate_limiter import get_rate_limiter
+from llms.token_counter import TokenCounter, count_request_tokens
+from llms.usage_ledger import save_usage_ledger
+from profiling import profiler
+
+RESULTS_FILENAME = "results.jsonl"
+THROUGHPUT_FILENAME = "throughput.json"
+
+# Local servers queue the requests they cannot run yet, so the timeout covers the wait in the queue
+DEFAULT_TIMEOUT = 600
+MAX_RETRIES = 2
+
+
+class LocalOpenAIHelper(OpenAIHelper):
+    """
+    A helper class to run the benchmark against a self-hosted model behind any OpenAI-compatible server
+    (vLLM, llama.cpp server, SGLang, Ollama and similar), without the hosted Batch API.
+
+    The batch workflow is emulated: `run_batch` sends the requests of the batch concurrently (at most
+    `max_workers` at a time, over one pooled HTTP client) to the chat-completions endpoint of the server
+    and writes the responses to `results.jsonl` in the batch folder, in the format of the OpenAI batch
+    output, as they complete. The ID of the batch is the path of its folder, so `get_status` and
+    `retrieve_results` also work from another process, and running the same batch again only sends the
+    requests that have no successful result yet. The throughput of each batch (requests, tokens per
+    second and latencies) is saved in `throughput.json`.
+
+    The cost of the tokens is configurable (e.g., the amortized price of the hardware) and defaults to 0.
+
+    Usage:
+        llm = LocalOpenAIHelper("meta-llama/Llama-3.1-8B-Instruct", base_url="http://localhost:8000/v1")
+        batch_id = Engine().run_benchmark(dataset, developer_prompt, llm, running_folder)  # blocks until done
+        responses, cost = llm.retrieve_results(batch_id)
+    """
+
+    def __init__(
+        self,
+        llm_name: str,
+        base_url: str = "http://localhost:8000/v1",
+        api_key: str = None,
+        input_price: float = 0.0,
+        output_price: float = 0.0,
+        max_workers: int = 16,
+        timeout: float = DEFAULT_TIMEOUT,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
+        """
+        Initializes the LocalOpenAIHelper with a client of the server.
+
+        Args:
+            llm_name (str): The name of the model served (the "model" of the requests).
+            base_url (str): URL of the OpenAI-compatible API of the server. Defaults to "http://localhost:8000/v1".
+            api_key (str, optional): API key of the server, if it requires one. Defaults to the
+                `LOCAL_LLM_API_KEY` environment variable or "EMPTY".
+            input_price (float): Price per million input tokens. Defaults to 0.
+            output_price (float): Price per million output tokens. Defaults to 0.
+            max_workers (int): Number of concurrent requests of a batch, and size of the connection pool. Defaults to 16.
+            timeout (float): Timeout of each request in seconds. Defaults to 600.
+            requests_per_minute (float, optional): If given, limits the requests per minute sent to the server.
+            tokens_per_minute (float, optional): If given, limits the input tokens per minute sent to the server.
+        """
+        self.llm_name = llm_name
+        self.base_url = base_url
+        self.max_workers = max_workers
+        # one connection pool shared by all the threads of `run_batch` and `run_requests`
+        self.client = OpenAI(
+            base_url=base_url,
+            api_key=api_key or os.environ.get("LOCAL_LLM_API_KEY", "EMPTY"),
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_workers,
+                    max_keepalive_connections=max_workers,
+                )
+            ),
+            timeout=timeout,
+            max_retries=MAX_RETRIES,
+        )
+        # the server already queues the requests, so they are only rate limited on demand
+        self.rate_limiter = (
+            get_rate_limiter(
+                f"local:{base_url}", requests_per_minute, tokens_per_minute
+            )
+            if requests_per_minute is not None or tokens_per_minute is not None
+            else None
+        )
+        self.token_counter = None
+
+        # batches are emulated with real-time requests, so both modes have the same price
+        self.STANDARD_PRICES = {
+            llm_name: {"input": input_price, "output": output_price}
+        }
+        self.BATCH_PRICES = self.STANDARD_PRICES
+
+    def create_request(
+        self,
+        messages,
+        system,
+        i,
+        max_completion_tokens=8192,
+        reasoning_effort=None,
+        custom_id=None,
+    ):
+        """
+        Creates a request payload for the chat-completions endpoint of the server.
+
+        Args:
+            messages (list): A list of message dictionaries.
+            system (str): The system message content.
+            i (int): The request index.
+            max_completion_tokens (int, optional): The maximum number of completion tokens.
+            reasoning_effort (str, optional): Not used by local servers.
+            custom_id (str, optional): ID used to route the result of the request. Defaults to "request-{i}".
+
+        Returns:
+            dict: The request payload dictionary.
+        """
+        # chat templates of open models know the "system" role, not "developer"
+        if system:
+            messages = [{"role": "system", "content": system}] + messages
+        return {
+            "custom_id": custom_id if custom_id is not None else f"request-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.llm_name,
+                "messages": messages,
+                "max_tokens": max_completion_tokens,
+            },
+        }
+
+    def generate(self, messages, system=None, response_format=None):
+        """
+        Generates a response from the server based on the provided messages.
+
+        Args:
+            messages (list): A list of message dictionaries.
+            system (str, optional): The system message content.
+            response_format (str, optional): The desired response format ("json" for a JSON object).
+
+        Returns:
+            tuple: The generated response message and its cost.
+        """
+        if system:
+            messages = [{"role": "system", "content": system}] + messages
+        kwargs = {}
+        if response_format is not None:
+            kwargs["response_format"] = (
+                {"type": "json_object"}
+                if response_format == "json"
+                else response_format
+            )
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        completion = self.client.chat.completions.create(
+            model=self.llm_name, messages=messages, **kwargs
+        )
+        return completion.choices[0].message, self.calculate_response_cost(completion)
+
+    def run_request(self, request):
+        """
+        Runs a single request created with `create_request`.
+
+        Args:
+            request (dict): The request payload dictionary.
+
+        Returns:
+            tuple: The text response and its cost.
+        """
+        completion = self._complete(request)
+        return completion.choices[0].message.content, self.calculate_response_cost(
+            completion
+        )
+
+    def _complete(self, request):
+        if self.rate_limiter is not None:
+            if self.token_counter is None:
+                self.token_counter = TokenCounter(self.llm_name)
+            self.rate_limiter.acquire(count_request_tokens(request, self.token_counter))
+        return self.client.chat.completions.create(**request["body"])
+
+    def run_batch(self, list_requests, output_folder):
+        """
+        Runs the requests of a batch concurrently against the server and saves their results.
+        Requests that already have a successful result in the folder (e.g., from an interrupted run)
+        are not sent again.
+
+        Args:
+            list_requests (list): A list of request dictionaries.
+            output_folder (str): The folder to save the requests, results and throughput of the batch.
+
+        Returns:
+            str: The ID of the batch (the absolute path of `output_folder`).
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        batch_id = os.path.abspath(output_folder)
+        with profiler.timer("local.serialize_requests"):
+            with open(
+                os.path.join(output_folder, "requests.jsonl"), "w", encoding="utf-8"
+            ) as f:
+                for request in list_requests:
+                    f.write(json.dumps(request) + "\n")
+        profiler.count("local.requests", len(list_requests))
+        throughput_path = os.path.join(output_folder, THROUGHPUT_FILENAME)
+        if os.path.exists(throughput_path):
+            # the batch is running again: it is only completed when this run ends
+            os.remove(throughput_path)
+
+        results_path = os.path.join(output_folder, RESULTS_FILENAME)
+        done = set()
+        if os.path.exists(results_path):
+            # keep only the successful results, the failed requests are sent again
+            with open(results_path, "r", encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+            lines = [line for line in lines if json.loads(line).get("error") is None]
+            done = {json.loads(line)["custom_id"] for line in lines}
+            with open(results_path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        pending = [r for r in list_requests if r["custom_id"] not in done]
+        print(
+            f"Running {len(pending)} requests on {self.base_url} ({len(done)} already done)"
+        )
+
+        latencies = []
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        num_errors = 0
+        start = time.monotonic()
+        with profiler.timer("local.run_batch"), open(
+            results_path, "a", encoding="utf-8"
+        ) as f:
+
+            def run(request):
+                request_start = time.monotonic()
+                try:
+                    completion = self._complete(request)
+                except Exception as e:
+                    return request, None, str(e), time.monotonic() - request_start
+                return request, completion, None, time.monotonic() - request_start
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [executor.submit(run, request) for request in pending]
+                for future in as_completed(futures):
+                    request, completion, error, latency = future.result()
+                    if completion is None:
+                        num_errors += 1
+                        print(f"Request {request['custom_id']} failed: {error}")
+                        result = {
+                            "custom_id": request["custom_id"],
+                            "response": None,
+                            "error": {"message": error},
+                        }
+                    else:
+                        latencies.append(latency)
+                        body = completion.model_dump()
+                        for key in usage:
+                            usage[key] += (body.get("usage") or {}).get(key) or 0
+                        result = {
+                            "custom_id": request["custom_id"],
+                            "response": {"status_code": 200, "body": body},
+                            "error": None,
+                        }
+                    # written as they complete, so an interrupted batch can be resumed
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+        seconds = time.monotonic() - start
+
+        latencies = sorted(latencies)
+        throughput = {
+            "base_url": self.base_url,
+            "model": self.llm_name,
+            "requests": len(pending),
+            "errors": num_errors,
+            "max_workers": self.max_workers,
+            "seconds": seconds,
+            "requests_per_second": len(latencies) / seconds if seconds > 0 else 0.0,
+            "input_tokens_per_second": (
+                usage["prompt_tokens"] / seconds if seconds > 0 else 0.0
+            ),
+            "output_tokens_per_second": (
+                usage["completion_tokens"] / seconds if seconds > 0 else 0.0
+            ),
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_p95": (
+                latencies[min(int(0.95 * len(latencies)), len(latencies) - 1)]
+                if latencies
+                else None
+            ),
+        }
+        with open(throughput_path, "w", encoding="utf-8") as f:
+            json.dump(throughput, f, indent=4)
+        print(
+            f"{len(latencies)} requests in {seconds:.1f}s "
+            f"({throughput['requests_per_second']:.2f} requests/s, "
+            f"{throughput['output_tokens_per_second']:.1f} output tokens/s), {num_errors} errors"
+        )
+        with open(
+            os.path.join(output_folder, "metadata.jsonl"), "a", encoding="utf-8"
+        ) as f:
+            f.write(json.dumps({"batch_response_id": batch_id}) + "\n")
+        return batch_id
+
+    def _download_results(self, batch_response_id, output_folder=None):
+        if self.get_status(batch_response_id) != "completed":
+            print("Batch not completed yet")
+            return None, None, None
+        with open(
+            os.path.join(batch_response_id, "requests.jsonl"), "r", encoding="utf-8"
+        ) as f:
+            total = sum(1 for line in f if line.strip())
+        with open(
+            os.path.join(batch_response_id, RESULTS_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            list_results = [
+                result
+                for result in get_json_list(f.read())
+                if result.get("error") is None
+            ]
+        if len(list_results) < total:
+            print(
+                f"Number of errors: {total - len(list_results)}. Saving successful results."
+            )
+        results = {
+            result["custom_id"]: self.retrieve_text_response(result)
+            for result in list_results
+        }
+        with open(
+            os.path.join(batch_response_id, THROUGHPUT_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            batch_seconds = json.load(f)["seconds"]
+        ledger = self.get_usage_ledger(
+            list_results, batch_id=batch_response_id, batch_seconds=batch_seconds
+        )
+        if output_folder is not None:
+            save_usage_ledger(ledger, output_folder)
+        return results, total, float(ledger["cost"].sum())
+
+    def get_error_messages(self, batch_id):
+        """
+        Retrieves the error messages of the failed requests of a batch.
+
+        Args:
+            batch_id (str): The ID of the batch.
+
+        Returns:
+            list: The results of the failed requests.
+        """
+        with open(os.path.join(batch_id, RESULTS_FILENAME), "r", encoding="utf-8") as f:
+            return [
+                result
+                for result in get_json_list(f.read())
+                if result.get("error") is not None
+            ]
+
+    def get_status(self, batch_id):
+        """
+        Retrieves the status of a batch.
+
+        Args:
+            batch_id (str): The ID of the batch.
+
+        Returns:
+            str: "completed" once `run_batch` has finished, otherwise "in_progress".
+        """
+        if os.path.exists(os.path.join(batch_id, THROUGHPUT_FILENAME)):
+            return "completed"
+        return "in_progress"
+
+    def cancel_batch(self, batch_id):
+        """
+        Batches run in `run_batch`, so there is nothing to cancel.
+
+        Args:
+            batch_id (str): The ID of the batch.
+        """
+        print(f"Batch {batch_id} runs locally and cannot be cancelled.")
+
+    def retrieve_openai_batch_responses(self, batch_response_id):
+        """
+        Retrieves the responses of a completed batch.
+
+        Args:
+            batch_response_id (str): The ID of the batch.
+
+        Returns:
+            list or None: A list of response dictionaries if the batch is completed, otherwise None.
+        """
+        if self.get_status(batch_response_id) != "completed":
+            print("Batch not completed yet")
+            return None
+        with open(
+            os.path.join(batch_response_id, RESULTS_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            return get_json_list(f.read())
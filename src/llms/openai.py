@@ -2,8 +2,18 @@ import getpass
 import json
 import os
 
-from openai import OpenAI
+import httpx
+from openai import DefaultHttpxClient, OpenAI
 from llms.llm_interface import LLMInterface
+from llms.rate_limiter import get_rate_limiter
+from llms.token_counter import TokenCounter, count_request_tokens
+from llms.usage_ledger import compute_cost, create_usage_ledger, save_usage_ledger
+from profiling import profiler
+
+# Connections kept open for the real-time requests of `run_requests` and retries of failed calls
+# (rate limits, timeouts and server errors are retried with exponential backoff by the client)
+MAX_CONNECTIONS = 32
+MAX_RETRIES = 5
 
 
 class OpenAIHelper(LLMInterface):
@@ -12,18 +22,39 @@ class OpenAIHelper(LLMInterface):
 
     Attributes:
         client (OpenAI): The OpenAI client instance.
+        rate_limiter (RateLimiter): The rate limiter shared by all the OpenAI helpers.
     """
 
-    def __init__(self, llm_name: str):
+    def __init__(
+        self,
+        llm_name: str,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+    ):
         """
         Initializes the OpenAIHelper with an OpenAI client instance.
         Arguments:
             llm_name {str} -- The name of the LLM model.
+            requests_per_minute {float} -- Optional requests per minute of the real-time API (see `run_requests`).
+            tokens_per_minute {float} -- Optional input tokens per minute of the real-time API.
         """
         if not os.environ.get("OPENAI_API_KEY"):
             os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter API key for OpenAI: ")
         self.llm_name = llm_name
-        self.client = OpenAI()
+        # one connection pool shared by all the threads of `run_requests`
+        self.client = OpenAI(
+            http_client=DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                )
+            ),
+            max_retries=MAX_RETRIES,
+        )
+        self.rate_limiter = get_rate_limiter(
+            "openai", requests_per_minute, tokens_per_minute
+        )
+        self.token_counter = None
 
         self.STANDARD_PRICES = {
             "gpt-4o": {"input": 2.5, "output": 10.0},
@@ -63,6 +94,25 @@ class OpenAIHelper(LLMInterface):
             "o1-mini-2024-09-12": {"input": 0.55, "output": 2.2},
         }
 
+    def get_token_prices(self, batch=True):
+        """
+        Returns the price per million tokens of the model.
+
+        Args:
+            batch (bool, optional): Whether to return the prices of the Batch API. Defaults to True.
+
+        Returns:
+            dict: Prices for "input", "output", "prompt_caching_write" and "prompt_caching_read" tokens.
+                Cached tokens are already counted in the input tokens, so their extra price is 0.
+        """
+        prices = self.BATCH_PRICES if batch else self.STANDARD_PRICES
+        return {
+            "input": prices[self.llm_name]["input"],
+            "output": prices[self.llm_name]["output"],
+            "prompt_caching_write": 0.0,
+            "prompt_caching_read": 0.0,
+        }
+
     def create_message(self, user_query, list_docs=None):
         """
         Creates a message payload for the OpenAI API.
@@ -84,17 +134,21 @@ class OpenAIHelper(LLMInterface):
         raw_prompt = "User: " + user_query
         return messages, raw_prompt
 
-    def generate(self, messages, response_format=None):
+    def generate(self, messages, system=None, response_format=None):
         """
         Generates a response from the OpenAI API based on the provided messages.
 
         Args:
             messages (list): A list of message dictionaries.
+            system (str, optional): The system message content.
             response_format (str, optional): The desired response format.
 
         Returns:
-            dict: The generated response message.
+            tuple: The generated response message and its cost.
         """
+        if system:
+            messages = [{"role": "developer", "content": system}] + messages
+        self.rate_limiter.acquire()
         if response_format is None:
             # response format is only available in new models
             completion = self.client.chat.completions.create(
@@ -118,6 +172,7 @@ class OpenAIHelper(LLMInterface):
         i,
         max_completion_tokens=8192,
         reasoning_effort=None,
+        custom_id=None,
     ):
         """
         Creates a request payload for the OpenAI API.
@@ -128,6 +183,7 @@ class OpenAIHelper(LLMInterface):
             i (int): The request index.
             max_completion_tokens (int, optional): The maximum number of completion tokens.
             reasoning_effort (str, optional): The reasoning effort parameter.
+            custom_id (str, optional): ID used to route the result of the request. Defaults to "request-{i}".
 
         Returns:
             dict: The request payload dictionary.
@@ -135,7 +191,7 @@ class OpenAIHelper(LLMInterface):
         if system != "" or system is not None:
             messages = [{"role": "developer", "content": system}] + messages
         request = {
-            "custom_id": f"request-{i}",
+            "custom_id": custom_id if custom_id is not None else f"request-{i}",
             "method": "POST",
             "url": "/v1/chat/completions",
             "body": {
@@ -148,6 +204,24 @@ class OpenAIHelper(LLMInterface):
             request["body"]["reasoning_effort"] = reasoning_effort
         return request
 
+    def run_request(self, request):
+        """
+        Runs a single request created with `create_request` with the real-time API.
+
+        Args:
+            request (dict): The request payload dictionary.
+
+        Returns:
+            tuple: The text response and its cost.
+        """
+        if self.token_counter is None:
+            self.token_counter = TokenCounter(self.llm_name)
+        self.rate_limiter.acquire(count_request_tokens(request, self.token_counter))
+        completion = self.client.chat.completions.create(**request["body"])
+        return completion.choices[0].message.content, self.calculate_response_cost(
+            completion
+        )
+
     def run_batch(self, list_requests, output_folder):
         """
         Runs a batch of OpenAI API requests and saves the response id.
@@ -161,13 +235,16 @@ class OpenAIHelper(LLMInterface):
         """
         # 1) Save batch requests as JSONL format (required by OpenAI API)
         batch_filename = os.path.join(output_folder, "requests.jsonl")
-        with open(batch_filename, "w", encoding="utf-8") as f:
-            for request in list_requests:
-                f.write(json.dumps(request) + "\n")
-
-        batch_input_file = self.client.files.create(
-            file=open(batch_filename, "rb"), purpose="batch"
-        )
+        with profiler.timer("openai.serialize_requests"):
+            with open(batch_filename, "w", encoding="utf-8") as f:
+                for request in list_requests:
+                    f.write(json.dumps(request) + "\n")
+        profiler.count("openai.requests", len(list_requests))
+
+        with profiler.timer("openai.upload"):
+            batch_input_file = self.client.files.create(
+                file=open(batch_filename, "rb"), purpose="batch"
+            )
 
         # save batch input file id
         batch_input_file_id = batch_input_file.id
@@ -178,12 +255,13 @@ class OpenAIHelper(LLMInterface):
 
         # 2) Create a batch job
         batch_input_file_id = batch_input_file.id
-        batch_response = self.client.batches.create(
-            input_file_id=batch_input_file_id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h",
-            metadata={"description": output_folder},
-        )
+        with profiler.timer("openai.create_batch"):
+            batch_response = self.client.batches.create(
+                input_file_id=batch_input_file_id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+                metadata={"description": output_folder},
+            )
         batch_response_id = batch_response.id
         with open(
             os.path.join(output_folder, "metadata.jsonl"), "a", encoding="utf-8"
@@ -192,38 +270,67 @@ class OpenAIHelper(LLMInterface):
 
         return batch_response_id
 
-    def retrieve_results(self, batch_response_id):
+    @profiler.timed("openai.retrieve_results")
+    def retrieve_results(self, batch_response_id, output_folder=None):
         """
         Retrieves the results of a completed batch job.
 
         Args:
             batch_response_id (str): The ID of the batch response.
+            output_folder (str, optional): If given, the usage ledger of the batch is saved there as `usage.parquet`.
 
         Returns:
             tuple or None: A tuple containing a list of sorted result dictionaries and the total cost if the batch is completed, otherwise None.
         """
+        results, total, cost = self._download_results(batch_response_id, output_folder)
+        if results is None:
+            return None, None
+        # The results might not be in the same order as the requests. That's why we assinged custom_id to each request.
+        # sort them by custom_id
+        sorted_results = [None] * total
+        for custom_id, text in results.items():
+            i = int(custom_id.split("-")[-1])
+            sorted_results[i] = text  # sort by custom_id
+        return sorted_results, cost
+
+    def retrieve_results_by_custom_id(self, batch_response_id, output_folder=None):
+        """
+        Retrieves the results of a completed batch job, keyed by the custom_id of each request.
+
+        Args:
+            batch_response_id (str): The ID of the batch response.
+            output_folder (str, optional): If given, the usage ledger of the batch is saved there as `usage.parquet`.
+
+        Returns:
+            tuple: A dictionary {custom_id: text} and the total cost if the batch is completed, otherwise (None, None).
+        """
+        results, _, cost = self._download_results(batch_response_id, output_folder)
+        return results, cost
+
+    def _download_results(self, batch_response_id, output_folder=None):
         status = self.client.batches.retrieve(batch_response_id)
-        if status.status == "completed":
-            num_errors = status.request_counts.failed
-            if num_errors > 0:
-                print(f"Number of errors: {num_errors}. Saving successful results.")
-            # results is a .jsonl file. It has one response line for every successful request line in the input file.
-            list_results = get_json_list(
-                self.client.files.content(status.output_file_id).text
-            )
-            # The results might not be in the same order as the requests. That's why we assinged custom_id to each request.
-            # sort them by custom_id
-            sorted_results = [None] * status.request_counts.total
-            for result in list_results:
-                i = int(result["custom_id"].split("-")[-1])
-                sorted_results[i] = self.retrieve_text_response(
-                    result
-                )  # sort by custom_id
-            cost = self.calculate_batch_cost(list_results)
-            return sorted_results, cost
-        else:
+        if status.status != "completed":
             print("Batch not completed yet")
-            return None, None
+            return None, None, None
+        num_errors = status.request_counts.failed
+        if num_errors > 0:
+            print(f"Number of errors: {num_errors}. Saving successful results.")
+        # results is a .jsonl file. It has one response line for every successful request line in the input file.
+        list_results = get_json_list(
+            self.client.files.content(status.output_file_id).text
+        )
+        results = {
+            result["custom_id"]: self.retrieve_text_response(result)
+            for result in list_results
+        }
+        ledger = self.get_usage_ledger(
+            list_results,
+            batch_id=batch_response_id,
+            batch_seconds=status.completed_at - status.created_at,
+        )
+        if output_folder is not None:
+            save_usage_ledger(ledger, output_folder)
+        return results, status.request_counts.total, float(ledger["cost"].sum())
 
     def retrieve_text_response(self, response):
         """
@@ -273,18 +380,39 @@ class OpenAIHelper(LLMInterface):
         Returns:
             float: The total calculated cost of the batch.
         """
-        input_price = self.BATCH_PRICES[self.llm_name]["input"]
-        output_price = self.BATCH_PRICES[self.llm_name]["output"]
-        total_cost = 0
+        return float(self.get_usage_ledger(responses)["cost"].sum())
+
+    def get_usage_ledger(self, responses, batch_id=None, batch_seconds=None):
+        """
+        Creates the usage ledger of a batch of responses, with the tokens and cost of each request.
+
+        Args:
+            responses (list): A list of response dictionaries.
+            batch_id (str, optional): The ID of the batch.
+            batch_seconds (float, optional): Wall-clock time of the batch in seconds.
+
+        Returns:
+            pd.DataFrame: The usage ledger, one row per response.
+        """
+        list_rows = []
         for response in responses:
-            prompt_cost = response["response"]["body"]["usage"]["prompt_tokens"] * (
-                input_price / 1000000
+            body = (response.get("response") or {}).get("body") or {}
+            usage = body.get("usage") or {}
+            prompt_details = usage.get("prompt_tokens_details") or {}
+            completion_details = usage.get("completion_tokens_details") or {}
+            list_rows.append(
+                [
+                    response["custom_id"],
+                    usage.get("prompt_tokens", 0),
+                    usage.get("completion_tokens", 0),
+                    prompt_details.get("cached_tokens", 0),
+                    0,
+                    completion_details.get("reasoning_tokens", 0),
+                ]
             )
-            completion_cost = response["response"]["body"]["usage"][
-                "completion_tokens"
-            ] * (output_price / 1000000)
-            total_cost += prompt_cost + completion_cost
-        return total_cost
+        ledger = create_usage_ledger(list_rows, batch_id, batch_seconds)
+        ledger["cost"] = compute_cost(ledger, self.get_token_prices(batch=True))
+        return ledger
 
     def retrieve_openai_batch_responses(self, batch_response_id):
         """
@@ -332,6 +460,15 @@ class OpenAIHelper(LLMInterface):
         """
         return self.client.batches.retrieve(batch_id).status
 
+    def cancel_batch(self, batch_id):
+        """
+        Cancels a batch job that is still running. Requests that were already completed are still billed.
+
+        Args:
+            batch_id (str): The ID of the batch job.
+        """
+        self.client.batches.cancel(batch_id)
+
 
 def get_json_list(jsonl_text):
     """
@@ -0,0 +1,134 @@
+import threading
+import time
+
+# Default limits per provider (requests and input tokens per minute). They match the lowest usage tiers
+# and can be raised with `get_rate_limiter` (or the arguments of the helpers).
+DEFAULT_RATE_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+    "anthropic": {"requests_per_minute": 50, "tokens_per_minute": 40000},
+}
+
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting the requests and input tokens sent per minute.
+
+    Both buckets start full and refill continuously, so short bursts up to the per-minute limit
+    are allowed and the long-run rate never exceeds it. `acquire` blocks until the request fits.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = None):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            requests_per_minute (float): Maximum number of requests per minute.
+            tokens_per_minute (float, optional): Maximum number of input tokens per minute. If None, tokens are not limited.
+        """
+        self.lock = threading.Lock()
+        self.set_limits(requests_per_minute, tokens_per_minute)
+
+    def set_limits(self, requests_per_minute: float, tokens_per_minute: float = None):
+        """
+        Updates the limits and refills the buckets.
+
+        Args:
+            requests_per_minute (float): Maximum number of requests per minute.
+            tokens_per_minute (float, optional): Maximum number of input tokens per minute. If None, tokens are not limited.
+        """
+        with self.lock:
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self.available_requests = float(requests_per_minute)
+            self.available_tokens = (
+                float(tokens_per_minute) if tokens_per_minute is not None else None
+            )
+            self.last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        minutes = (now - self.last_refill) / 60
+        self.last_refill = now
+        self.available_requests = min(
+            self.requests_per_minute,
+            self.available_requests + minutes * self.requests_per_minute,
+        )
+        if self.tokens_per_minute is not None:
+            self.available_tokens = min(
+                self.tokens_per_minute,
+                self.available_tokens + minutes * self.tokens_per_minute,
+            )
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until one request with `tokens` input tokens can be sent.
+
+        Args:
+            tokens (int): Estimated number of input tokens of the request. Requests larger than the
+                per-minute limit wait for a full bucket.
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens_per_minute is not None:
+                    tokens = min(tokens, self.tokens_per_minute)
+                missing_requests = 1 - self.available_requests
+                missing_tokens = (
+                    tokens - self.available_tokens
+                    if self.tokens_per_minute is not None
+                    else 0
+                )
+                if missing_requests <= 0 and missing_tokens <= 0:
+                    self.available_requests -= 1
+                    if self.tokens_per_minute is not None:
+                        self.available_tokens -= tokens
+                    return
+                wait = 60 * max(
+                    missing_requests / self.requests_per_minute,
+                    (
+                        missing_tokens / self.tokens_per_minute
+                        if self.tokens_per_minute is not None
+                        else 0
+                    ),
+                )
+            time.sleep(wait)
+
+
+def get_rate_limiter(
+    provider: str, requests_per_minute: float = None, tokens_per_minute: float = None
+) -> RateLimiter:
+    """
+    Returns the rate limiter shared by all the helpers of a provider in this process, creating it
+    with the default limits of the provider the first time.
+
+    Args:
+        provider (str): Name of the provider (e.g., "openai" or "anthropic").
+        requests_per_minute (float, optional): If given, updates the requests per minute of the provider.
+        tokens_per_minute (float, optional): If given, updates the input tokens per minute of the provider.
+
+    Returns:
+        RateLimiter: The rate limiter of the provider.
+    """
+    with _RATE_LIMITERS_LOCK:
+        if provider not in _RATE_LIMITERS:
+            _RATE_LIMITERS[provider] = RateLimiter(
+                **DEFAULT_RATE_LIMITS.get(provider, {"requests_per_minute": 60})
+            )
+        rate_limiter = _RATE_LIMITERS[provider]
+    if requests_per_minute is not None or tokens_per_minute is not None:
+        rate_limiter.set_limits(
+            (
+                requests_per_minute
+                if requests_per_minute is not None
+                else rate_limiter.requests_per_minute
+            ),
+            (
+                tokens_per_minute
+                if tokens_per_minute is not None
+                else rate_limiter.tokens_per_minute
+            ),
+        )
+    return rate_limiter
@@ -0,0 +1,193 @@
+import hashlib
+
+# Separator used by Benchmark between documents in the user prompt
+DOCUMENT_SEPARATOR = "\n\n##########################\n\n"
+
+
+class TokenCounter:
+    """
+    Counts tokens locally without calling any API.
+
+    If `tiktoken` is installed, the exact tokenizer of the model is used. Otherwise, the number of
+    tokens is approximated from the number of characters (`chars_per_token`), which can be
+    calibrated with real usage counts returned by the API (see `calibrate`).
+
+    Token counts are cached per document (using a hash of the text), so documents that appear in
+    several prompts (e.g., the same document in the baseline and in every C-SEO method) are only
+    tokenized once.
+    """
+
+    def __init__(self, llm_name: str = None, chars_per_token: float = 4.0):
+        """
+        Initializes the TokenCounter.
+
+        Args:
+            llm_name (str, optional): Name of the model. Used to pick the tiktoken encoding.
+            chars_per_token (float): Average number of characters per token used by the approximation. Defaults to 4.0.
+        """
+        self.llm_name = llm_name
+        self.chars_per_token = chars_per_token
+        self.cache = {}
+        self.encoding = self._load_encoding(llm_name)
+
+    def _load_encoding(self, llm_name):
+        try:
+            import tiktoken
+        except ImportError:  # tiktoken is optional, we fall back to an approximation
+            return None
+        try:
+            return tiktoken.encoding_for_model(llm_name)
+        except Exception:
+            # unknown models (e.g., Claude) use the approximation
+            return None
+
+    def _count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        if not text:
+            return 0
+        return max(1, int(round(len(text) / self.chars_per_token)))
+
+    def count(self, text: str) -> int:
+        """
+        Counts the tokens of a text. Prompts that contain several documents are split on the
+        document separator so that the count of each document is cached independently.
+
+        Args:
+            text (str): Text to count.
+
+        Returns:
+            int: Number of tokens.
+        """
+        if text is None:
+            return 0
+        return sum(self.count_document(part) for part in text.split(DOCUMENT_SEPARATOR))
+
+    def count_document(self, text: str) -> int:
+        """
+        Counts the tokens of a single document, using the cache.
+
+        Args:
+            text (str): Document to count.
+
+        Returns:
+            int: Number of tokens.
+        """
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if key not in self.cache:
+            self.cache[key] = self._count(text)
+        return self.cache[key]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Truncates a text to at most `max_tokens` tokens.
+
+        Args:
+            text (str): Text to truncate.
+            max_tokens (int): Maximum number of tokens to keep.
+
+        Returns:
+            str: The truncated text.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.count_document(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return self.encoding.decode(tokens[:max_tokens])
+        return text[: int(max_tokens * self.chars_per_token)]
+
+    def calibrate(self, texts, token_counts):
+        """
+        Calibrates the characters-per-token ratio of the approximation with token counts
+        reported by the API (e.g., `input_tokens` from the usage of a previous run).
+
+        Args:
+            texts (list): List of texts (e.g., prompts).
+            token_counts (list): Number of tokens reported for each text.
+
+        Returns:
+            float: The new characters-per-token ratio.
+        """
+        num_chars = sum(len(text) for text in texts)
+        num_tokens = sum(token_counts)
+        if num_chars > 0 and num_tokens > 0:
+            self.chars_per_token = num_chars / num_tokens
+            # cached counts were computed with the old ratio
+            self.cache = {}
+        return self.chars_per_token
+
+
+def get_request_texts(request):
+    """
+    Extracts the texts that are sent to the model from a request created with `create_request`
+    (either an OpenAI batch request or an Anthropic batch request).
+
+    Args:
+        request (dict): The request.
+
+    Returns:
+        list: List of texts in the request (system prompt and messages).
+    """
+    texts = []
+    if "body" in request:
+        # OpenAI
+        for message in request["body"]["messages"]:
+            texts.extend(_get_content_texts(message["content"]))
+    else:
+        # Anthropic
+        params = request["params"]
+        texts.extend(_get_content_texts(params.get("system", "")))
+        for message in params["messages"]:
+            texts.extend(_get_content_texts(message["content"]))
+    return texts
+
+
+def _get_content_texts(content):
+    if isinstance(content, str):
+        return [content] if content else []
+    texts = []
+    for block in content:
+        if block.get("type") == "text":
+            texts.append(block["text"])
+        elif block.get("type") == "document":
+            for sub_block in block["source"]["content"]:
+                texts.append(sub_block["text"])
+    return texts
+
+
+def get_request_max_tokens(request):
+    """
+    Returns the maximum number of output tokens of a request.
+
+    Args:
+        request (dict): The request.
+
+    Returns:
+        int: Maximum number of output tokens.
+    """
+    if "body" in request:
+        return request["body"].get("max_completion_tokens")
+    return request["params"].get("max_tokens")
+
+
+# Rough number of tokens added by the chat template for each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_request_tokens(request, token_counter: TokenCounter) -> int:
+    """
+    Counts the input tokens of a request.
+
+    Args:
+        request (dict): The request.
+        token_counter (TokenCounter): Counter used to tokenize the texts.
+
+    Returns:
+        int: Number of input tokens.
+    """
+    texts = get_request_texts(request)
+    return sum(
+        token_counter.count(text) for text in texts
+    ) + _MESSAGE_OVERHEAD_TOKENS * len(texts)
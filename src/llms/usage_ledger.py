@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+USAGE_COLUMNS = [
+    "custom_id",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_tokens",
+    "cache_write_tokens",
+    "reasoning_tokens",
+]
+
+USAGE_FILENAME = "usage.parquet"
+
+
+def create_usage_ledger(list_rows, batch_id=None, batch_seconds=None):
+    """
+    Creates a usage ledger from a list of rows with the token usage of each request.
+
+    Args:
+        list_rows (list): List of rows following `USAGE_COLUMNS`.
+        batch_id (str, optional): ID of the batch the requests belong to.
+        batch_seconds (float, optional): Wall-clock time of the batch in seconds.
+
+    Returns:
+        pd.DataFrame: The usage ledger, one row per request.
+    """
+    ledger = pd.DataFrame(list_rows, columns=USAGE_COLUMNS)
+    for column in USAGE_COLUMNS[1:]:
+        ledger[column] = ledger[column].fillna(0).astype(np.int64)
+    ledger["batch_id"] = batch_id
+    ledger["batch_seconds"] = batch_seconds
+    return ledger
+
+
+def compute_cost(ledger: pd.DataFrame, prices: dict) -> pd.Series:
+    """
+    Computes the cost of each request of a usage ledger.
+
+    Args:
+        ledger (pd.DataFrame): The usage ledger.
+        prices (dict): Prices per million tokens as returned by `llm.get_token_prices`.
+
+    Returns:
+        pd.Series: The cost of each request.
+    """
+    return (
+        ledger["input_tokens"] * prices["input"]
+        + ledger["output_tokens"] * prices["output"]
+        + ledger["cache_read_tokens"] * prices["prompt_caching_read"]
+        + ledger["cache_write_tokens"] * prices["prompt_caching_write"]
+    ) / 1e6
+
+
+def save_usage_ledger(ledger: pd.DataFrame, output_folder: str):
+    """
+    Saves a usage ledger as `usage.parquet` in the output folder (next to `responses.parquet`).
+
+    Args:
+        ledger (pd.DataFrame): The usage ledger.
+        output_folder (str): The folder where the ledger is saved.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    ledger.to_parquet(os.path.join(output_folder, USAGE_FILENAME), index=False)
+
+
+def load_usage_ledgers(results_folder: str) -> pd.DataFrame:
+    """
+    Loads all the usage ledgers from a results folder with the structure `{split}/{method}/{model}/...`.
+
+    Args:
+        results_folder (str): Root of the results.
+
+    Returns:
+        pd.DataFrame: The concatenated ledgers with the extra columns "split", "method", "model" and "run".
+    """
+    list_ledgers = []
+    for root, _, files in os.walk(results_folder):
+        if USAGE_FILENAME not in files:
+            continue
+        run = os.path.relpath(root, results_folder)
+        parts = run.split(os.sep) + [None] * 3
+        ledger = pd.read_parquet(os.path.join(root, USAGE_FILENAME))
+        ledger["split"], ledger["method"], ledger["model"] = parts[:3]
+        ledger["run"] = run
+        list_ledgers.append(ledger)
+    if len(list_ledgers) == 0:
+        return pd.DataFrame(columns=USAGE_COLUMNS + ["split", "method", "model", "run"])
+    return pd.concat(list_ledgers, ignore_index=True)
+
+
+def cost_report(ledger: pd.DataFrame, by=("split", "method")) -> pd.DataFrame:
+    """
+    Aggregates the cost and throughput of a usage ledger.
+
+    Args:
+        ledger (pd.DataFrame): The usage ledger (with a "cost" column).
+        by (tuple): Columns to group by. Defaults to ("split", "method").
+
+    Returns:
+        pd.DataFrame: Requests, tokens, cost and throughput (output tokens per second of batch time) per group.
+    """
+    by = list(by)
+    token_columns = USAGE_COLUMNS[1:]
+    report = ledger.groupby(by)[token_columns + ["cost"]].sum()
+    report.insert(0, "requests", ledger.groupby(by).size())
+    # each batch is counted once, even if it has many requests
+    batch_seconds = (
+        ledger.drop_duplicates(by + ["batch_id"]).groupby(by)["batch_seconds"].sum()
+    )
+    report["batch_seconds"] = batch_seconds
+    report["output_tokens_per_second"] = report[
+        "output_tokens"
+    ] / batch_seconds.replace(0, np.nan)
+    return report.reset_index()
+
+
+def find_outliers(
+    ledger: pd.DataFrame, column: str = "cost", threshold: float = 3.5
+) -> pd.DataFrame:
+    """
+    Finds the requests whose usage is unusually high, using the modified z-score (median and MAD).
+
+    Args:
+        ledger (pd.DataFrame): The usage ledger.
+        column (str): Column to analyze. Defaults to "cost".
+        threshold (float): Modified z-score above which a request is an outlier. Defaults to 3.5.
+
+    Returns:
+        pd.DataFrame: The outlier requests sorted by the column, with their "z_score".
+    """
+    values = ledger[column].to_numpy(dtype=float)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        z_scores = np.where(values > median, np.inf, 0.0)
+    else:
+        z_scores = 0.6745 * (values - median) / mad
+    outliers = ledger.assign(z_score=z_scores)[z_scores > threshold]
+    return outliers.sort_values(column, ascending=False)
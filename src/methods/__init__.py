@@ -10,6 +10,24 @@ from .geo_methods import (
     SimpleLanguage,
     TechnicalTerms,
 )
+from .multi_method import MultiMethodRewriter
+
+# Imported on first access (see `llms/__init__.py`): it imports numpy and scipy
+_LAZY_IMPORTS = {
+    "QualityGate": ".quality_gate",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_IMPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "LLMstxt",
@@ -22,4 +40,6 @@ __all__ = [
     "Quotes",
     "SimpleLanguage",
     "TechnicalTerms",
+    "MultiMethodRewriter",
+    "QualityGate",
 ]
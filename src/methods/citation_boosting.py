@@ -1,8 +1,37 @@
+import hashlib
+import json
+import os
 from abc import ABC, abstractmethod
 from llms.llm_interface import LLMInterface
 
 from typing import List
 
+DEDUP_INDEX_FILENAME = "dedup_index.json"
+
+
+def deduplicate_texts(texts: List[str]):
+    """
+    Removes duplicated texts using a hash of their content.
+
+    Args:
+        texts (List[str]): List of texts, possibly with duplicates.
+
+    Returns:
+        tuple:
+            - unique_texts (List[str]): The unique texts, in order of first appearance.
+            - inverse (List[int]): For each text in `texts`, the index of its unique text.
+    """
+    hash2idx = {}
+    unique_texts = []
+    inverse = []
+    for text in texts:
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if key not in hash2idx:
+            hash2idx[key] = len(unique_texts)
+            unique_texts.append(text)
+        inverse.append(hash2idx[key])
+    return unique_texts, inverse
+
 
 class CitationBoosting(ABC):
     """
@@ -20,19 +49,69 @@ class CitationBoosting(ABC):
         self.instructions = ""
         self.system_prompt = ""
         self.prompt_template = "{instr}\n\n{description}"
+        self.inverse_index = None
 
-    def improve_texts(self, texts: List[str], output_folder: str) -> List[str]:
+    def improve_texts(
+        self, texts: List[str], output_folder: str, deduplicate: bool = True
+    ) -> str:
         """
         Improves a list of texts (e.g. product descriptions) using a specific method.
+        Identical texts (e.g., the same product description under several queries or splits) are only
+        rewritten once, and `retrieve_results` fans the rewrite back out to every occurrence.
 
         Args:
             texts (List[str]): List of texts to improve.
             output_folder (str): Folder to save the output.
+            deduplicate (bool): Whether to send one request per unique text. Defaults to True.
 
         Returns:
-            List[str]: List of improved texts.
+            str: The batch ID. The improved texts are obtained with `retrieve_results`.
+        """
+        list_requests = self.create_deduplicated_requests(
+            texts, output_folder, deduplicate
+        )
+        batch_id = self.llm.run_batch(list_requests, output_folder)
+        print(f"Batch ID: {batch_id}")
+        return batch_id
+
+    def create_deduplicated_requests(
+        self, texts: List[str], output_folder: str, deduplicate: bool = True
+    ) -> List:
+        """
+        Creates one request per unique text and saves the deduplication index in the output folder,
+        so the results can be fanned out with `process_results`.
+
+        Args:
+            texts (List[str]): List of texts to improve.
+            output_folder (str): Folder to save the deduplication index.
+            deduplicate (bool): Whether to send one request per unique text. Defaults to True.
+
+        Returns:
+            List: List of requests, one per unique text.
+        """
+        if deduplicate:
+            unique_texts, self.inverse_index = deduplicate_texts(texts)
+            print(f"{len(unique_texts)} unique texts out of {len(texts)}")
+        else:
+            unique_texts, self.inverse_index = texts, list(range(len(texts)))
+        os.makedirs(output_folder, exist_ok=True)
+        with open(
+            os.path.join(output_folder, DEDUP_INDEX_FILENAME), "w", encoding="utf-8"
+        ) as f:
+            json.dump({"inverse": self.inverse_index}, f)
+        return self.create_requests(unique_texts)
+
+    def create_requests(self, texts: List[str], custom_ids: List[str] = None) -> List:
+        """
+        Creates the requests to improve a list of texts without submitting them.
+
+        Args:
+            texts (List[str]): List of texts to improve.
+            custom_ids (List[str], optional): custom_id of each request. Defaults to "request-{i}".
+
+        Returns:
+            List: List of requests, one per text.
         """
-        # Create the requests
         list_requests = []
         for i, descr in enumerate(texts):
             msg, _ = self.llm.create_message(
@@ -43,49 +122,117 @@ class CitationBoosting(ABC):
                     msg,
                     system=self.system_prompt,
                     i=i,
+                    custom_id=custom_ids[i] if custom_ids is not None else None,
                 )
             )
-        batch_id = self.llm.run_batch(list_requests, output_folder)
-        print(f"Batch ID: {batch_id}")
-        return batch_id
+        return list_requests
 
     def improve_text(self, text: str):
         """
-        Improves a single text using a specific method.
+        Improves a single text using a specific method with the real-time API.
 
         Args:
             text (str): Text to improve.
 
         Returns:
-            str: Improved text.
+            str: Improved text, or None if the request failed.
         """
-        msg, _ = self.llm.create_message(
-            self.prompt_template.format(instr=self.instructions, description=text)
-        )
-        response = self.llm.generate(msg)
-        return response
+        improved_texts, _ = self.improve_texts_sync([text], max_workers=1)
+        return improved_texts[0]
+
+    def improve_texts_sync(
+        self, texts: List[str], max_workers: int = 8, deduplicate: bool = True
+    ):
+        """
+        Improves a list of texts with the real-time API instead of a batch. The requests are the same as
+        in `improve_texts` (including the system prompt) and are sent concurrently with `llm.run_requests`,
+        so small jobs (e.g., a few hundred documents) finish in minutes instead of waiting in the batch queue.
+        Real-time requests cost twice as much as batch requests.
+
+        Args:
+            texts (List[str]): List of texts to improve.
+            max_workers (int): Number of concurrent requests. Defaults to 8.
+            deduplicate (bool): Whether to send one request per unique text. Defaults to True.
+
+        Returns:
+            tuple: The list of improved texts (None for failed requests) and the total cost.
+        """
+        if deduplicate:
+            unique_texts, inverse_index = deduplicate_texts(texts)
+        else:
+            unique_texts, inverse_index = texts, list(range(len(texts)))
+        list_requests = self.create_requests(unique_texts)
+        results, total_cost = self.llm.run_requests(list_requests, max_workers)
+        results_txt = [
+            (
+                self.post_processing(results[request["custom_id"]])
+                if request["custom_id"] in results
+                else None
+            )
+            for request in list_requests
+        ]
+        return [results_txt[i] for i in inverse_index], total_cost
+
+    def retrieve_results(self, batch_id, output_folder=None):
+        """
+        Retrieves and post-processes the improved texts of a batch submitted with `improve_texts`.
 
-    def retrieve_results(self, batch_id):
-        results = self.llm.retrieve_results(batch_id)
+        Args:
+            batch_id (str): The batch ID.
+            output_folder (str, optional): The output folder used in `improve_texts`. Its deduplication index
+                fans out the texts of this batch (needed if this object submitted other batches since, or
+                none). The usage ledger is also saved there.
+
+        Returns:
+            tuple: The list of improved texts (one per text passed to `improve_texts`) and the total cost,
+                or (None, None) if the batch is not completed.
+        """
+        results, total_cost = self.llm.retrieve_results(
+            batch_id, output_folder=output_folder
+        )
         if results is None:
             print(f"Results for batch {batch_id} are not ready yet.")
             return None, None
+        return self.process_results(results, output_folder), total_cost
+
+    def process_results(self, results: List[str], output_folder: str = None):
+        """
+        Post-processes the raw responses of the requests created in `improve_texts` and fans the
+        deduplicated texts back out to every occurrence.
+
+        Args:
+            results (List[str]): The responses sorted by request (None for failed requests).
+            output_folder (str, optional): The output folder used in `improve_texts`. Its deduplication
+                index is used to fan out the texts; without it, the index of the last `improve_texts` call
+                of this object is used.
+
+        Returns:
+            List[str]: The improved texts, one per text passed to `improve_texts`.
+        """
         results_txt = [
-            self.post_processing(self.llm.retrieve_text_response(result))
+            self.post_processing(result) if result is not None else None
             for result in results
         ]
 
-        total_cost = sum(
-            [
-                self.llm.calculate_api_call_cost(
-                    response,
-                    input_cost=self.llm.BATCH_PRICES[self.llm.llm_name]["input"],
-                    output_cost=self.llm.BATCH_PRICES[self.llm.llm_name]["output"],
-                )
-                for response in results
-            ]
+        # the index saved with the requests wins over the one in memory, which belongs to the last
+        # `improve_texts` call of this object (possibly another batch)
+        inverse_index = self.inverse_index
+        dedup_index_path = (
+            os.path.join(output_folder, DEDUP_INDEX_FILENAME)
+            if output_folder is not None
+            else None
         )
-        return results_txt, total_cost
+        if dedup_index_path is not None and os.path.exists(dedup_index_path):
+            with open(dedup_index_path, "r", encoding="utf-8") as f:
+                inverse_index = json.load(f)["inverse"]
+        if inverse_index is not None:
+            if inverse_index and max(inverse_index) >= len(results_txt):
+                raise ValueError(
+                    f"The deduplication index refers to {max(inverse_index) + 1} unique texts, but there "
+                    f"are {len(results_txt)} results. Pass the output folder of the batch."
+                )
+            results_txt = [results_txt[i] for i in inverse_index]
+        return results_txt
 
     def post_processing(self, text: str) -> str:
         """
@@ -25,23 +25,6 @@ class GEOMethod(CitationBoosting):
         self.system_prompt = """You are an expert ml researcher having previous background in SEO and search engines in general. You are working on novel research ideas for next generation of products. These products will have language models augmented with search engines, with the task of answering questions based on sources backed by the search engine. This new set of systems will be collectively called language engines (generative search engines). This will require websites to update their SEO techniques to rank higher in the llm generated answer. Specifically they will use GEO (Generative Engine Optimization) techniques to boost their visibility in the final text answer outputted by the Language Engine."""
         self.prompt_template = ""
 
-    def improve_text(self, text: str):
-        """
-        Improves a single text using a specific method.
-
-        Args:
-            text (str): Text to improve.
-
-        Returns:
-            str: Improved text.
-        """
-        msg, _ = self.llm.create_message(
-            self.prompt_template.format(instr=self.instructions, description=text)
-        )
-        response = self.llm.generate(msg)
-        response = self.post_processing(response)
-        return response
-
 
 class Authoritative(GEOMethod):
     """
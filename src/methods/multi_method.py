@@ -0,0 +1,194 @@
+import json
+import os
+from typing import List
+
+from llms.batching import (
+    MAX_BYTES_PER_BATCH,
+    MAX_REQUESTS_PER_BATCH,
+    decode_custom_id,
+    encode_custom_id,
+    shard_requests,
+)
+from methods.citation_boosting import CitationBoosting, deduplicate_texts
+
+MANIFEST_FILENAME = "multi_method.json"
+
+
+class MultiMethodRewriter:
+    """
+    Runs several C-SEO methods on the same selected documents with shared batches, instead of one
+    `improve_texts` batch (and one queue wait) per method.
+
+    The requests of all the methods are packed into as few batches as the Batch API limits allow. The
+    method, query index and document index of each request are encoded in its custom_id
+    ("{method}-{query_idx}-{doc_idx}"), so the results are demultiplexed with the `post_processing` of
+    each method and written back for all the methods in one step.
+
+    Usage:
+        rewriter = MultiMethodRewriter([Statistics(llm), Fluency(llm), LLMstxt(llm)])
+        rewriter.improve_selected_docs(selected_docs, output_folder)
+        ...
+        rewrites, cost = rewriter.retrieve_results(store=store)
+    """
+
+    def __init__(
+        self,
+        methods: List[CitationBoosting],
+        max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH,
+        max_bytes_per_batch: int = MAX_BYTES_PER_BATCH,
+    ):
+        """
+        Initializes the MultiMethodRewriter.
+
+        Args:
+            methods (List[CitationBoosting]): The C-SEO methods to run. They must use the same LLM, and
+                their classes must be different (the class name routes the results).
+            max_requests_per_batch (int): Maximum number of requests per batch.
+            max_bytes_per_batch (int): Maximum size of a batch in JSONL format.
+        """
+        self.methods = {type(method).__name__: method for method in methods}
+        if len(self.methods) != len(methods):
+            raise ValueError("The names of the methods must be different.")
+        self.llm = methods[0].llm
+        if any(method.llm.llm_name != self.llm.llm_name for method in methods):
+            raise ValueError("All the methods must use the same LLM.")
+        self.max_requests_per_batch = max_requests_per_batch
+        self.max_bytes_per_batch = max_bytes_per_batch
+        self.batch_ids = []
+        self.shard_folders = []
+        self.routing = {}
+
+    def improve_selected_docs(
+        self,
+        selected_docs: dict,
+        output_folder: str,
+        deduplicate: bool = True,
+        per_method: bool = False,
+    ) -> List[str]:
+        """
+        Submits the requests to rewrite the selected documents with all the methods.
+
+        Args:
+            selected_docs (dict): Selected documents in the `selected_docs.json` format
+                ({data_point_index: {document_index: {'doc': ...}}}), or {method: selected documents} if `per_method`.
+            output_folder (str): Folder where the batches and the routing manifest are saved.
+            deduplicate (bool): Whether identical documents are rewritten only once per method. Defaults to True.
+            per_method (bool): Whether each method only rewrites its own selected documents (e.g., the documents
+                that do not have a rewrite of that method yet). Defaults to False.
+
+        Returns:
+            List[str]: The IDs of the batches.
+        """
+        list_requests = []
+        self.routing = {}
+        for method_name, method in self.methods.items():
+            method_docs = (
+                selected_docs.get(method_name, {}) if per_method else selected_docs
+            )
+            texts = []
+            slots = []
+            for query_idx, docs in method_docs.items():
+                for doc_idx, versions in docs.items():
+                    texts.append(versions["doc"])
+                    slots.append([int(query_idx), int(doc_idx)])
+            if deduplicate:
+                unique_texts, inverse = deduplicate_texts(texts)
+            else:
+                unique_texts, inverse = texts, list(range(len(texts)))
+            groups = [[] for _ in unique_texts]
+            for slot, unique_idx in zip(slots, inverse):
+                groups[unique_idx].append(slot)
+
+            # the custom_id of each unique text is the one of its first occurrence
+            custom_ids = [encode_custom_id(method_name, *group[0]) for group in groups]
+            list_requests.extend(method.create_requests(unique_texts, custom_ids))
+            self.routing.update(zip(custom_ids, groups))
+
+        shards = shard_requests(
+            list_requests, self.max_requests_per_batch, self.max_bytes_per_batch
+        )
+        print(
+            f"{len(list_requests)} requests for {len(self.methods)} methods in {len(shards)} batch(es)"
+        )
+        self.batch_ids = []
+        self.shard_folders = []
+        for shard_idx, shard in enumerate(shards):
+            shard_folder = os.path.join(output_folder, f"shard-{shard_idx}")
+            os.makedirs(shard_folder, exist_ok=True)
+            self.batch_ids.append(self.llm.run_batch(shard, shard_folder))
+            self.shard_folders.append(shard_folder)
+
+        with open(
+            os.path.join(output_folder, MANIFEST_FILENAME), "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "batch_ids": self.batch_ids,
+                    "shard_folders": self.shard_folders,
+                    "routing": self.routing,
+                },
+                f,
+            )
+        return self.batch_ids
+
+    def load(self, output_folder: str):
+        """
+        Loads the batches and routing of a previous `improve_selected_docs` call.
+
+        Args:
+            output_folder (str): The output folder used in `improve_selected_docs`.
+        """
+        with open(
+            os.path.join(output_folder, MANIFEST_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            manifest = json.load(f)
+        self.batch_ids = manifest["batch_ids"]
+        self.shard_folders = manifest["shard_folders"]
+        self.routing = manifest["routing"]
+
+    def get_status(self) -> List[str]:
+        """
+        Returns the status of each batch.
+
+        Returns:
+            List[str]: The status of each batch.
+        """
+        return [self.llm.get_status(batch_id) for batch_id in self.batch_ids]
+
+    def retrieve_results(self, store=None):
+        """
+        Retrieves the results of all the batches and demultiplexes them per method.
+
+        Args:
+            store (SelectedDocsStore, optional): If given, the rewrites of every method are written to the store.
+
+        Returns:
+            tuple: A dictionary {method: [(query_idx, doc_idx, text)]} and the total cost,
+                or (None, None) if a batch is not completed.
+        """
+        results = {}
+        total_cost = 0
+        for batch_id, shard_folder in zip(self.batch_ids, self.shard_folders):
+            batch_results, cost = self.llm.retrieve_results_by_custom_id(
+                batch_id, output_folder=shard_folder
+            )
+            if batch_results is None:
+                print(f"Results for batch {batch_id} are not ready yet.")
+                return None, None
+            results.update(batch_results)
+            total_cost += cost
+
+        rewrites = {method_name: [] for method_name in self.methods}
+        for custom_id, text in results.items():
+            method_name = decode_custom_id(custom_id)[0]
+            text = self.methods[method_name].post_processing(text)
+            for query_idx, doc_idx in self.routing[custom_id]:
+                rewrites[method_name].append((query_idx, doc_idx, text))
+        num_missing = len(self.routing) - len(results)
+        if num_missing > 0:
+            print(f"{num_missing} requests failed and have no rewrite.")
+
+        if store is not None:
+            for method_name, rows in rewrites.items():
+                store.write(method_name, rows)
+        return rewrites, total_cost
@@ -0,0 +1,240 @@
+import json
+import os
+import re
+from typing import List
+
+import numpy as np
+
+from data.lexical import LexicalIndex
+from methods.citation_boosting import CitationBoosting, deduplicate_texts
+
+QUALITY_GATE_FILENAME = "quality_gate.json"
+
+# A rewrite wrapped in a code fence, e.g. "```markdown\n...\n```". Anything after the closing fence is a
+# remark to the user, and the closing fence may be missing if the response was truncated
+FENCE_PATTERN = re.compile(r"^\s*```[\w+-]*[ \t]*\n(.*?)(?:\n[ \t]*```|\Z)", re.DOTALL)
+# A first line that introduces the rewrite, e.g. "Sure! Here is the updated description:". It starts with an
+# acknowledgement or names the rewrite, ends with ":" and is followed by a blank line or a fence, so that
+# "Here are the key features:\n- ..." (part of the document) is kept
+PREAMBLE_PATTERN = re.compile(
+    r"^\s*(?:(?:sure|certainly|of course|okay)\b[^\n]*?(?:here(?:'s| is| are)|below is)\b[^\n]*"
+    r"|(?:here(?:'s| is| are)|below is)\b[^\n]*"
+    r"\b(?:rewrit\w*|updated|revised|improved|optimized|enhanced|modified|version|output)\b[^\n]*)"
+    r":[ \t]*\n(?:(?:[ \t]*\n)+|(?=[ \t]*```))",
+    re.IGNORECASE,
+)
+# A last paragraph that talks to the user, e.g. "Let me know if you need any changes.". Only stripped from
+# responses that also have a preamble or a fence, since a document can end with "Feel free to ..."
+CLOSING_PATTERN = re.compile(
+    r"\n\s*(?:let me know|i hope|feel free)\b[^\n]*\s*$",
+    re.IGNORECASE,
+)
+
+
+class QualityGate:
+    """
+    Checks the rewrites of a C-SEO method against the original documents and resubmits the ones that
+    fail, so a bad rewrite (a preamble, a code fence, a truncated or bloated text, or a text about
+    something else) does not waste a full benchmark run.
+
+    Each rewrite is first cleaned (on top of the `post_processing` of the method, the preamble, code fence
+    and closing remarks of responses wrapped in them are stripped; other rewrites are kept as they are).
+    Then all the (original, rewrite) pairs are checked at once:
+
+        - Length ratio: words of the rewrite over words of the original, between `min_length_ratio`
+            and `max_length_ratio`.
+        - Semantic drift: TF-IDF cosine between the rewrite and its original, at least `min_similarity`.
+
+    The term counts of all the originals and rewrites are a single sparse matrix (a `data.LexicalIndex`),
+    so both checks are a few sparse operations. The failing texts are rewritten again with a small
+    real-time job (`method.improve_texts_sync`), up to `max_attempts` times.
+
+    Usage:
+        improved_texts, cost = method.retrieve_results(batch_id, output_folder)
+        improved_texts, retry_cost = QualityGate().apply(method, texts, improved_texts, output_folder)
+    """
+
+    def __init__(
+        self,
+        min_length_ratio: float = 0.5,
+        max_length_ratio: float = 3.0,
+        min_similarity: float = 0.3,
+        max_attempts: int = 2,
+    ):
+        """
+        Initializes the QualityGate.
+
+        Args:
+            min_length_ratio (float): Minimum words of the rewrite over words of the original. Defaults to 0.5.
+            max_length_ratio (float): Maximum words of the rewrite over words of the original. Defaults to 3.0.
+            min_similarity (float): Minimum TF-IDF cosine between the rewrite and the original. Defaults to 0.3.
+            max_attempts (int): Maximum number of times the failing texts are resubmitted. Defaults to 2.
+        """
+        self.min_length_ratio = min_length_ratio
+        self.max_length_ratio = max_length_ratio
+        self.min_similarity = min_similarity
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def clean(text: str) -> str:
+        """
+        Strips the wrapper of a rewrite: a preamble, a code fence and the closing remarks. A rewrite without
+        a preamble or a fence is returned unchanged, so the content of good rewrites is never cut.
+
+        Args:
+            text (str): The rewrite.
+
+        Returns:
+            str: The cleaned rewrite, or None if `text` is None.
+        """
+        if text is None:
+            return None
+        stripped = PREAMBLE_PATTERN.sub("", text, count=1)
+        match = FENCE_PATTERN.match(stripped)
+        if match:
+            # the preamble can also be inside the fence
+            stripped = PREAMBLE_PATTERN.sub("", match.group(1), count=1)
+        elif stripped == text:
+            return text
+        return CLOSING_PATTERN.sub("", stripped).strip()
+
+    def check(self, originals: List[str], rewrites: List[str]) -> dict:
+        """
+        Cleans the rewrites and checks all of them against their originals.
+
+        Args:
+            originals (List[str]): The original texts.
+            rewrites (List[str]): The rewrite of each original (None for failed requests).
+
+        Returns:
+            dict:
+                - "texts" (List[str]): The cleaned rewrites.
+                - "length_ratio" (np.ndarray): Words of each rewrite over words of its original.
+                - "similarity" (np.ndarray): TF-IDF cosine between each rewrite and its original.
+                - "passed" (np.ndarray): Whether each rewrite passes the gate.
+                - "reasons" (List[str]): Why each rewrite fails ("missing", "too short", "too long" or
+                    "drift"), or None if it passes.
+        """
+        texts = [self.clean(text) for text in rewrites]
+        n = len(originals)
+        # rows 0..n-1 are the originals and rows n..2n-1 the rewrites
+        counts = LexicalIndex(list(originals) + [text or "" for text in texts]).counts
+        lengths = np.asarray(counts.sum(axis=1)).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            length_ratio = np.nan_to_num(lengths[n:] / lengths[:n], nan=0.0)
+
+        # smoothed idf over the originals and the rewrites, and l2-normalized rows
+        document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1
+        tfidf = counts.multiply(idf[None, :]).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        products = np.asarray(tfidf[:n].multiply(tfidf[n:]).sum(axis=1)).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = np.nan_to_num(products / (norms[:n] * norms[n:]), nan=0.0)
+
+        missing = np.array([not text for text in texts], dtype=bool)
+        too_short = length_ratio < self.min_length_ratio
+        too_long = length_ratio > self.max_length_ratio
+        drift = similarity < self.min_similarity
+        reasons = np.select(
+            [missing, too_short, too_long, drift],
+            ["missing", "too short", "too long", "drift"],
+            default="",
+        )
+        return {
+            "texts": texts,
+            "length_ratio": length_ratio,
+            "similarity": similarity,
+            "passed": reasons == "",
+            "reasons": [reason or None for reason in reasons.tolist()],
+        }
+
+    def apply(
+        self,
+        method: CitationBoosting,
+        originals: List[str],
+        rewrites: List[str],
+        output_folder: str = None,
+        max_workers: int = 8,
+    ):
+        """
+        Checks the rewrites and resubmits the failing ones until they pass or `max_attempts` is reached.
+        Identical failing texts are resubmitted once.
+
+        Args:
+            method (CitationBoosting): The method that produced the rewrites.
+            originals (List[str]): The original texts (the texts passed to `improve_texts`).
+            rewrites (List[str]): The rewrite of each original (the output of `retrieve_results`).
+            output_folder (str, optional): If given, the report of the gate is saved there as `quality_gate.json`.
+            max_workers (int): Number of concurrent requests of the resubmissions. Defaults to 8.
+
+        Returns:
+            tuple: The cleaned rewrites (the last rewrite of the texts that never pass) and the cost of the
+                resubmissions.
+        """
+        report = self.check(originals, rewrites)
+        texts = report["texts"]
+        print(
+            f"Quality gate: {int((~report['passed']).sum())} of {len(texts)} rewrites fail"
+        )
+        attempts = []
+        total_cost = 0
+        for attempt in range(self.max_attempts):
+            failed = np.flatnonzero(~report["passed"])
+            if len(failed) == 0:
+                break
+            unique_texts, inverse = deduplicate_texts([originals[i] for i in failed])
+            retries, cost = method.improve_texts_sync(
+                unique_texts, max_workers=max_workers, deduplicate=False
+            )
+            total_cost += cost
+            retry_report = self.check(unique_texts, retries)
+            # a retry only replaces the previous rewrite if it passes
+            for i, unique_idx in zip(failed, inverse):
+                if retry_report["passed"][unique_idx]:
+                    texts[i] = retry_report["texts"][unique_idx]
+                    report["length_ratio"][i] = retry_report["length_ratio"][unique_idx]
+                    report["similarity"][i] = retry_report["similarity"][unique_idx]
+                    report["passed"][i] = True
+                    report["reasons"][i] = None
+            attempts.append(
+                {
+                    "resubmitted": len(unique_texts),
+                    "fixed": int(report["passed"][failed].sum()),
+                    "cost": cost,
+                }
+            )
+            print(
+                f"Attempt {attempt + 1}: {attempts[-1]['fixed']} of {len(failed)} rewrites fixed (${cost:.4f})"
+            )
+
+        failed = np.flatnonzero(~report["passed"])
+        if len(failed) > 0:
+            print(f"{len(failed)} rewrites still fail the quality gate.")
+        if output_folder is not None:
+            os.makedirs(output_folder, exist_ok=True)
+            with open(
+                os.path.join(output_folder, QUALITY_GATE_FILENAME),
+                "w",
+                encoding="utf-8",
+            ) as f:
+                json.dump(
+                    {
+                        "min_length_ratio": self.min_length_ratio,
+                        "max_length_ratio": self.max_length_ratio,
+                        "min_similarity": self.min_similarity,
+                        "attempts": attempts,
+                        "failed": {
+                            int(i): {
+                                "reason": report["reasons"][i],
+                                "length_ratio": float(report["length_ratio"][i]),
+                                "similarity": float(report["similarity"][i]),
+                            }
+                            for i in failed
+                        },
+                        "cost": total_cost,
+                    },
+                    f,
+                    indent=2,
+                )
+        return texts, total_cost
@@ -0,0 +1,6 @@
+from .profiler import Profiler, profiler
+
+__all__ = [
+    "Profiler",
+    "profiler",
+]
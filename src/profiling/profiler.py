@@ -0,0 +1,212 @@
+import contextlib
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+# A single no-op context manager is reused when profiling is disabled
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Lightweight instrumentation of the pipeline: timers (context manager and decorator), counters,
+    and optional memory snapshots with tracemalloc.
+
+    Profiling is disabled by default and then every timer and counter is a no-op. It can be enabled
+    with `profiler.enable()` or by setting the environment variable `CSEO_PROFILE=1` (or `true`;
+    `CSEO_PROFILE=memory` also tracks memory). Each `write_report` saves the metrics collected since the
+    previous report, so the report of a run does not include the earlier runs of the process.
+
+    Usage:
+        with profiler.timer("engine.create_requests"):
+            ...
+
+        @profiler.timed("benchmark.preload_data")
+        def preload_data(self):
+            ...
+
+        profiler.count("benchmark.data_points", len(self))
+        profiler.write_report(running_folder)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.reset()
+
+    def enable(self, memory: bool = False):
+        """
+        Enables profiling.
+
+        Args:
+            memory (bool): Whether to track memory with tracemalloc. Defaults to False.
+        """
+        self.enabled = True
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        """
+        Disables profiling. The metrics collected so far are kept until `reset` is called.
+        """
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def reset(self):
+        """
+        Removes all the metrics collected so far.
+        """
+        self.timings = {}
+        self.counters = {}
+        self.memory_snapshots = {}
+        self._depth = 0
+
+    def timer(self, name: str):
+        """
+        Returns a context manager that measures the time spent in a stage.
+
+        Args:
+            name (str): Name of the stage (e.g., "engine.create_requests").
+
+        Returns:
+            A context manager.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name: str = None):
+        """
+        Decorator that measures the time spent in a function.
+
+        Args:
+            name (str, optional): Name of the stage. Defaults to the qualified name of the function.
+
+        Returns:
+            The decorator.
+        """
+
+        def decorator(func):
+            stage = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(self, stage):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name: str, value: int = 1):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): Name of the counter (e.g., "benchmark.data_points").
+            value (int): Value to add. Defaults to 1.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self, name: str):
+        """
+        Records the current and peak memory traced by tracemalloc. Does nothing if memory tracking is disabled.
+
+        Args:
+            name (str): Name of the snapshot.
+        """
+        if self.enabled and self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.memory_snapshots[name] = {"current_bytes": current, "peak_bytes": peak}
+
+    def _record(self, name, seconds, peak_bytes=None):
+        stats = self.timings.setdefault(
+            name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        if peak_bytes is not None:
+            stats["peak_bytes"] = max(stats.get("peak_bytes", 0), peak_bytes)
+
+    def report(self) -> dict:
+        """
+        Returns the metrics collected so far.
+
+        Returns:
+            dict: Dictionary with the keys "timings", "counters" and "memory".
+        """
+        return {
+            "timings": self.timings,
+            "counters": self.counters,
+            "memory": self.memory_snapshots,
+        }
+
+    def write_report(
+        self, folder: str, filename: str = "profile.json", reset: bool = True
+    ):
+        """
+        Saves the metrics collected so far as a JSON file. Does nothing if profiling is disabled.
+
+        Args:
+            folder (str): Folder of the run.
+            filename (str): Name of the report. Defaults to "profile.json".
+            reset (bool): Whether to remove the metrics once they are saved, so the next report of the
+                process (e.g., of the next run) only contains its own metrics. Defaults to True.
+
+        Returns:
+            str: Path of the report, or None if profiling is disabled.
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
+        if reset:
+            depth = self._depth
+            self.reset()
+            # timers that are still open (e.g., a decorated caller) are recorded in the next report
+            self._depth = depth
+        return path
+
+
+class _Timer:
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.track_memory = self.profiler.memory and tracemalloc.is_tracing()
+        if self.track_memory:
+            # only the outermost timer resets the peak, so nested stages do not hide it
+            if self.profiler._depth == 0:
+                tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        self.profiler._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.profiler._depth -= 1
+        peak_bytes = None
+        if self.track_memory:
+            peak_bytes = tracemalloc.get_traced_memory()[1] - self.start_memory
+        self.profiler._record(self.name, seconds, peak_bytes)
+        return False
+
+
+profiler = Profiler()
+# only "1", "true" and "memory" enable profiling ("0", "false" or an empty value keep it disabled)
+_PROFILE_MODE = os.environ.get("CSEO_PROFILE", "").strip().lower()
+if _PROFILE_MODE in ("1", "true", "memory"):
+    profiler.enable(memory=_PROFILE_MODE == "memory")
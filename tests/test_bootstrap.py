@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from evaluation.bootstrap import bootstrap_ratio, query_statistics
+from evaluation.statistics import calculate_rank_differences
+
+
+def naive_bootstrap(numerators, denominators, num_resamples, chunk_size, seed=42):
+    # one resample at a time, drawing the indices in the same chunks as bootstrap_ratio
+    rng = np.random.default_rng(seed)
+    num_queries = len(numerators)
+    statistics = []
+    for start in range(0, num_resamples, chunk_size):
+        size = min(chunk_size, num_resamples - start)
+        for idx in rng.integers(0, num_queries, size=(size, num_queries)):
+            statistics.append(
+                [
+                    sum(numerators[i, c] for i in idx)
+                    / sum(denominators[i, c] for i in idx)
+                    for c in range(numerators.shape[1])
+                ]
+            )
+    return np.array(statistics)
+
+
+def test_bootstrap_ratio_matches_row_by_row_resampling():
+    rng = np.random.default_rng(0)
+    numerators = rng.integers(-3, 4, size=(25, 3)).astype(float)
+    denominators = rng.integers(1, 3, size=(25, 3)).astype(float)
+    # max_memory_mb=0 gives chunks of one resample, the default a single chunk
+    for max_memory_mb, chunk_size in [(0, 1), (256, 200)]:
+        result = bootstrap_ratio(
+            numerators, denominators, num_resamples=200, max_memory_mb=max_memory_mb
+        )
+        statistics = naive_bootstrap(numerators, denominators, 200, chunk_size)
+        assert np.allclose(
+            result["estimate"], numerators.sum(axis=0) / denominators.sum(axis=0)
+        )
+        assert np.allclose(result["se"], statistics.std(axis=0, ddof=1))
+        assert np.allclose(result["ci_low"], np.quantile(statistics, 0.025, axis=0))
+        assert np.allclose(result["ci_high"], np.quantile(statistics, 0.975, axis=0))
+
+    result = bootstrap_ratio(numerators[:, 0], denominators[:, 0], num_resamples=200)
+    statistics = naive_bootstrap(numerators[:, :1], denominators[:, :1], 200, 200)
+    assert np.isclose(result["ci_low"], np.quantile(statistics, 0.025))
+
+
+def test_query_statistics_matches_per_query_loop():
+    df_baseline = pd.DataFrame(
+        {"Citation Order": [[0, 1, 2], [3, 2], [], [4, 0, 1, 2, 3]]}
+    )
+    df_method = pd.DataFrame(
+        {
+            "Citation Order": [[1, 0], [2, 3, 1], [0], [0, 4, 1]],
+            "Boost Product Index": [[1], [2, 3], 0, [4]],
+        }
+    )
+    sums, counts = query_statistics(df_baseline, df_method, k=2)
+    differences = calculate_rank_differences(df_baseline, df_method, by_query=True)
+    for i in range(len(df_method)):
+        boosted = df_method["Boost Product Index"][i]
+        boosted = boosted if isinstance(boosted, list) else [boosted]
+        top_method = df_method["Citation Order"][i][:2]
+        top_baseline = df_baseline["Citation Order"][i][:2]
+        assert counts[i] == len(boosted)
+        assert sums[i, 0] == sum(differences[i])
+        assert sums[i, 1] == sum(doc in top_method for doc in boosted)
+        assert sums[i, 2] == sum(doc in top_baseline for doc in boosted)
+        assert sums[i, 3] == sums[i, 1] - sums[i, 2]
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+from evaluation.position_bias import fit_position_bias, flatten_citation_events
+
+NUM_POSITIONS = 5
+METHODS = ["Fluency", "Statistics"]
+
+
+def make_events(num_queries=60, seed=0):
+    # one run per method, every query with one treated document and up to 3 citations
+    rng = np.random.default_rng(seed)
+    rows = []
+    for method in METHODS:
+        for query_idx in range(num_queries):
+            treated = rng.integers(NUM_POSITIONS)
+            num_cited = rng.integers(0, 4)
+            cited = rng.permutation(NUM_POSITIONS)[:num_cited]
+            for position in range(NUM_POSITIONS):
+                rank = np.flatnonzero(cited == position)
+                rows.append(
+                    {
+                        "run": f"retail/{method}",
+                        "query_idx": query_idx,
+                        "doc_idx": position,
+                        "position": position,
+                        "treated": position == treated,
+                        "rank": int(rank[0]) if len(rank) else -1,
+                        "method": method,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def contexts(events, max_citations=5):
+    # per context: the position and method (None if untreated) of each document, and the cited positions in order
+    list_contexts = []
+    for _, context in events.groupby(["run", "query_idx"]):
+        documents = [
+            (row.position, row.method if row.treated else None)
+            for row in context.itertuples()
+        ]
+        cited = context[(context["rank"] >= 0) & (context["rank"] < max_citations)]
+        list_contexts.append((documents, list(cited.sort_values("rank")["position"])))
+    return list_contexts
+
+
+def naive_log_likelihood(list_contexts, theta):
+    position_effect = np.concatenate([[0.0], theta[: NUM_POSITIONS - 1]])
+    method_effect = dict(zip(METHODS, theta[NUM_POSITIONS - 1 :]))
+    log_likelihood = 0.0
+    for documents, cited in list_contexts:
+        utility = {
+            position: position_effect[position] + method_effect.get(method, 0.0)
+            for position, method in documents
+        }
+        remaining = set(utility)
+        for position in cited:
+            choice_set = [utility[p] for p in remaining]
+            log_likelihood += utility[position] - np.log(np.exp(choice_set).sum())
+            remaining.remove(position)
+    return log_likelihood
+
+
+def test_fit_position_bias_matches_naive_likelihood():
+    events = make_events()
+    list_contexts = contexts(events)
+    fit = fit_position_bias(events)
+    theta = np.concatenate(
+        [fit["positions"]["Effect"].to_numpy()[1:], fit["methods"]["Effect"].to_numpy()]
+    )
+    assert fit["converged"]
+    assert list(fit["methods"]["Method"]) == METHODS
+    assert np.isclose(fit["log_likelihood"], naive_log_likelihood(list_contexts, theta))
+
+    naive = minimize(
+        lambda t: -naive_log_likelihood(list_contexts, t),
+        np.zeros(len(theta)),
+        method="BFGS",
+    )
+    assert np.allclose(theta, naive.x, atol=1e-3)
+
+    # standard errors from the Hessian of the naive likelihood
+    eps = 1e-4
+    hessian = np.zeros((len(theta), len(theta)))
+    for i in range(len(theta)):
+        for j in range(len(theta)):
+            step_i = np.eye(len(theta))[i] * eps
+            step_j = np.eye(len(theta))[j] * eps
+            hessian[i, j] = -(
+                naive_log_likelihood(list_contexts, theta + step_i + step_j)
+                - naive_log_likelihood(list_contexts, theta + step_i - step_j)
+                - naive_log_likelihood(list_contexts, theta - step_i + step_j)
+                + naive_log_likelihood(list_contexts, theta - step_i - step_j)
+            ) / (4 * eps**2)
+    standard_error = np.sqrt(np.diag(np.linalg.inv(hessian)))
+    assert np.allclose(
+        fit["positions"]["SE"].to_numpy()[1:],
+        standard_error[: NUM_POSITIONS - 1],
+        rtol=1e-3,
+    )
+    assert np.allclose(
+        fit["methods"]["SE"].to_numpy(), standard_error[NUM_POSITIONS - 1 :], rtol=1e-3
+    )
+
+
+def test_flatten_citation_events_maps_the_context_order():
+    df = pd.DataFrame(
+        {
+            "Context Order": [[2, 0, 1], [0, 1, 2]],
+            "Boost Product Index": [[0], 2],
+            # document 7 is not in the context, so it does not take a rank
+            "Citation Order": [[1, 7, 2], [2, 0, 1]],
+        }
+    )
+    events = flatten_citation_events(df, "Fluency", "retail", max_citations=2)
+    expected = []
+    for query_idx, (order, boosted, citations) in enumerate(
+        zip(df["Context Order"], [[0], [2]], df["Citation Order"])
+    ):
+        citations = [doc for doc in citations if doc in order][:2]
+        for position, doc in enumerate(order):
+            expected.append(
+                (
+                    query_idx,
+                    doc,
+                    position,
+                    doc in boosted,
+                    citations.index(doc) if doc in citations else -1,
+                )
+            )
+    columns = ["query_idx", "doc_idx", "position", "treated", "rank"]
+    assert [tuple(row) for row in events[columns].itertuples(index=False)] == expected
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from evaluation.visibility import (
+    CITATION_PATTERN,
+    SENTENCE_PATTERN,
+    WORD_PATTERN,
+    visibility_metrics,
+)
+from llms.token_counter import DOCUMENT_SEPARATOR
+
+RESPONSES = [
+    "The first shoe is light [1][3]. It is also cheap [1]! Is it durable? Yes [2].",
+    "No citations here.",
+    "",
+    "Only one document [9] is out of the context [2].\nThe second line cites [3] and [2].",
+    "Repeated [1] [1] [1]. Then [2]. Then [3]. Then [4].",
+]
+CONTEXT_ORDERS = [[2, 0, 1, 3], [0, 1, 2], [1, 0], [0, 1, 2], [3, 2, 1, 0]]
+BOOSTED = [[0, 2], [1], 0, [2, 5], [3]]
+
+
+def naive_visibility(response, order, boosted, k):
+    # per-sentence loop over one response
+    num_docs = len(order)
+    sentences = [s for s in SENTENCE_PATTERN.split(response) if s.strip()]
+    word_count = np.zeros(num_docs)
+    marks = np.zeros(num_docs)
+    cited_in_order = []
+    total_words = 0
+    for j, sentence in enumerate(sentences):
+        words = len(WORD_PATTERN.findall(CITATION_PATTERN.sub(" ", sentence)))
+        total_words += words
+        docs = []
+        for mark in CITATION_PATTERN.findall(sentence):
+            position = int(mark) - 1
+            if 0 <= position < num_docs:
+                doc = order[position]
+                marks[doc] += 1
+                docs.append(doc)
+                if doc not in cited_in_order:
+                    cited_in_order.append(doc)
+        for doc in set(docs):
+            word_count[doc] += np.exp(-j / len(sentences)) * words / len(set(docs))
+    if total_words > 0:
+        word_count /= total_words
+    if marks.sum() > 0:
+        marks /= marks.sum()
+    first = cited_in_order[0] if cited_in_order else -1
+    top_k = np.array([doc in cited_in_order[:k] for doc in range(num_docs)])
+    boosted = [doc for doc in boosted if 0 <= doc < num_docs]
+    return {
+        "Position-Adjusted Word Count": word_count,
+        "Citation Share": marks,
+        "First Citation": first,
+        "Top-k Inclusion": top_k,
+        "Boosted Word Count": np.mean([word_count[d] for d in boosted]),
+        "Boosted Citation Share": np.mean([marks[d] for d in boosted]),
+        "Boosted First Citation": np.mean([float(first == d) for d in boosted]),
+        "Boosted Top-k": np.mean([float(top_k[d]) for d in boosted]),
+    }
+
+
+def test_visibility_metrics_matches_per_sentence_loop():
+    df = pd.DataFrame(
+        {
+            "Response": RESPONSES,
+            "Context Order": CONTEXT_ORDERS,
+            "Boost Product Index": BOOSTED,
+        }
+    )
+    df = visibility_metrics(df, k=2)
+    for i, (response, order, boosted) in enumerate(
+        zip(RESPONSES, CONTEXT_ORDERS, BOOSTED)
+    ):
+        boosted = boosted if isinstance(boosted, list) else [boosted]
+        expected = naive_visibility(response, order, boosted, k=2)
+        for column, value in expected.items():
+            assert np.allclose(df[column][i], value), (i, column)
+
+
+def test_visibility_metrics_without_context_order():
+    df = pd.DataFrame(
+        {
+            "Response": RESPONSES,
+            "Prompt": [
+                "".join(f"doc {p}{DOCUMENT_SEPARATOR}" for p in range(len(order)))
+                for order in CONTEXT_ORDERS
+            ],
+            "Boost Product Index": BOOSTED,
+        }
+    )
+    df = visibility_metrics(df, k=3)
+    for i, (response, order, boosted) in enumerate(
+        zip(RESPONSES, CONTEXT_ORDERS, BOOSTED)
+    ):
+        boosted = boosted if isinstance(boosted, list) else [boosted]
+        expected = naive_visibility(response, list(range(len(order))), boosted, k=3)
+        for column, value in expected.items():
+            assert np.allclose(df[column][i], value), (i, column)